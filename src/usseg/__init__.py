@@ -1,28 +1,47 @@
 """Initialises the ultrasound-segmentation module.
 
-Makes available the following module:
+Makes available the following modules:
 
 * general_functions
+* ocr
 
 and the following functions:
 
 * get_likely_us
 * data_from_image
 * segment
+* segment_iter
 * setup_tesseract
 * generate_html_from_pkl
+* generate_html_from_store
+* generate_report
+* generate_report_from_store
 * generate_html
 * main
 
+and the following classes:
+
+* ImageContext
+* ResultStore
+
 Also, sets the attribute '__version__'.
 """
 from importlib.metadata import version, PackageNotFoundError
 from usseg import general_functions
+from usseg import ocr
+from usseg.image_context import ImageContext
 from usseg.organise_files import get_likely_us
+from usseg.result_store import ResultStore
 from usseg.single_image_processing import data_from_image
-from usseg.segment_files import segment
+from usseg.segment_files import segment, segment_iter
 from usseg.setup_environment import setup_tesseract
-from usseg.visualisation_html import generate_html_from_pkl, generate_html
+from usseg.visualisation_html import (
+    generate_html_from_pkl,
+    generate_html_from_store,
+    generate_html,
+    generate_report,
+    generate_report_from_store,
+)
 from usseg.main import main
 # Replace this with loading from configuration.
 # import os
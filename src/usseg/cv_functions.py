@@ -12,6 +12,7 @@ import skimage.filters
 import toml
 from loguru import logger
 import usseg
+from usseg import ocr
 
 
 # Loads in ultrasound templates from TOML file
@@ -174,7 +175,8 @@ def get_text_from_us(
             Defaults to "--psm 7 --oem 3".
         config_file (str, optional) : The relative path to the tesseract configuration file.
             Defaults to 'src/tesseract_config/patient_id.txt'.
-        ext (str, optional) : The extension of the output type.
+        ext (str, optional) : The extension of the output type. Text ("txt") is read with the
+            OCR backend set in usseg.ocr, other outputs with the tesseract executable.
             Defaults to "txt".
         scale_factor (int, optional) : The factor to scale up the image resolution by.
             For some reason 2 works well.
@@ -201,12 +203,15 @@ def get_text_from_us(
     tessconfig = f"{config} configfile {config_file_full_path}"
 
     # Gets the text from the image
-    image_str = pytesseract.run_and_get_output(
-        image_final,
-        extension=ext,
-        config=tessconfig,
-        timeout=0,
-    )
+    if ext == "txt":
+        image_str = ocr.image_to_string(image_final, config=tessconfig)
+    else:
+        image_str = pytesseract.run_and_get_output(
+            image_final,
+            extension=ext,
+            config=tessconfig,
+            timeout=0,
+        )
 
     if len(image_str.split()) == 0:
         logger.warning("Empty string extracted. Setting to 'N/A'.")
@@ -1,11 +1,13 @@
 """ A set of functions to segment and extract data from doppler ultrasound scans"""
 # Python imports
 import traceback
+import functools
 import math
 import re
 import logging
 
-import Levenshtein
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
 # Module imports
 import matplotlib.pyplot as plt
 from skimage import morphology, measure
@@ -21,10 +23,11 @@ from scipy.spatial.distance import cdist
 from scipy.signal import find_peaks, peak_widths
 import statistics
 import scipy.linalg
-from sklearn.cluster import DBSCAN
 import pandas as pd
-import pytesseract
-from pytesseract import Output
+
+from usseg import ocr
+from usseg.image_context import ImageContext
+from usseg.text_records import TextRecords, metric_name
 
 logger = logging.getLogger(__file__)
 
@@ -74,6 +77,23 @@ def execute_on_main_thread_and_wait(func, *args, **kwargs):
         return result
 
 
+def _rgb_array(input_image_obj):
+    """Returns a (height, width, 3) uint8 array of an RGB image without copying numpy inputs.
+
+    Args:
+        input_image_obj (PIL.Image.Image or ndarray): The image. PIL images in modes other
+            than RGB/RGBA are converted to RGB first.
+
+    Returns:
+        **rgb** (ndarray): The red, green and blue channels of the image.
+    """
+    if isinstance(input_image_obj, Image.Image):
+        if input_image_obj.mode not in ("RGB", "RGBA"):
+            input_image_obj = input_image_obj.convert("RGB")
+        input_image_obj = np.asarray(input_image_obj)
+    return input_image_obj[..., :3]
+
+
 def initial_segmentation(input_image_obj):
     """
     Initial segmentation of an ultrasound image.
@@ -86,8 +106,12 @@ def initial_segmentation(input_image_obj):
     and adjust the shape of the segmented area. It also calculates the
     bounding box coordinates of the waveform.
 
+    The thresholding is evaluated over the whole image array at once and the
+    input image is not modified.
+
     Args:
-        input_image_obj (str): Name of file within current directory, or path to a file.
+        input_image_obj (PIL.Image.Image or ndarray): The RGB image, either as a PIL image
+            or as a (height, width, 3) numpy array.
 
     Returns:
         tuple: tuple containing:
@@ -97,42 +121,19 @@ def initial_segmentation(input_image_obj):
             - **Ymin** (float): Minimum Y coordinate of the segmentation.
             - **Ymax** (float): Maximum Y coordinate of the segmentation.
     """
-    # img_RGBA = Image.open(input_image_filename)  # These images are in RGBA form
-    img_RGB = input_image_obj
-    pixel_data = img_RGB.load()  # Loads a pixel access object, where pixel values can be edited
-    # gry = img_RGB.convert("L")  # (returns grayscale version)
-
-    # To threshold the ROI,
-    for y in range(img_RGB.size[1]):
-        for x in range(img_RGB.size[0]):
-            r = pixel_data[x, y][0]  # red component
-            g = pixel_data[x, y][1]  # green component
-            b = pixel_data[x, y][2]  # blue component
-            rgb_values = [r, g, b]
-            min_rgb = min(rgb_values)
-            max_rgb = max(rgb_values)
-            rgb_range = max_rgb - min_rgb  # range across RGB components
-
-            # notice that the spread of values across R, G and B is reasonably small as the colours is a shade of white/grey,
-            # It can be isolated by marking pixels with a low range (<50) and resonable brightness (sum or R G B components > 120)
-            if (rgb_range < 100 and max_rgb > 120):  # NEEDS REFINING - these values seem to be optimal for the majority tested.
-                pixel_data[x, y] = (
-                    255,
-                    255,
-                    255)  # mark all pixels meeting the conditions to white.
-            else:
-                pixel_data[x, y] = (0, 0, 0)  # If conditions not met, set to black/
+    img_RGB = _rgb_array(input_image_obj)  # Read-only view, the caller's image is left untouched
+    max_rgb = img_RGB.max(axis=-1)
+    rgb_range = max_rgb - img_RGB.min(axis=-1)  # range across RGB components
 
-            if img_RGB.size[1] > 600:
-                if y < 400:  # for some reason x==0 is white, this line negates this.
-                    pixel_data[x, y] = (0, 0, 0)
-            else:
-                if y < 20:
-                    pixel_data[x, y] = (0, 0, 0)
+    # notice that the spread of values across R, G and B is reasonably small as the colours is a shade of white/grey,
+    # It can be isolated by marking pixels with a low range (<50) and resonable brightness (sum or R G B components > 120)
+    nonzero_pixels = (rgb_range < 100) & (max_rgb > 120)  # NEEDS REFINING - these values seem to be optimal for the majority tested.
+
+    if img_RGB.shape[0] > 600:
+        nonzero_pixels[:400, :] = False  # for some reason x==0 is white, this line negates this.
+    else:
+        nonzero_pixels[:20, :] = False
 
-    binary_image = np.asarray(img_RGB)  # Make the image an nparray
-    pixel_sum = binary_image.sum(-1)  # sum over each pixel (255,255,255)->[765]
-    nonzero_pixels = (pixel_sum > 0).astype(bool)  # Change type
     # Some processing to refine the target area
     segmentation_mask = morphology.remove_small_objects(
         nonzero_pixels, 200, connectivity=2
@@ -253,8 +254,8 @@ def segment_refinement(input_image_obj, Xmin, Xmax, Ymin, Ymax):
     for the waveform and its top curve.
 
     Args:
-        input_image_obj (ndarray): An image object, typically read from a file
-            using a library such as OpenCV.
+        input_image_obj (ndarray or ImageContext): An image object in BGR order, typically
+            read from a file using a library such as OpenCV, or its ImageContext.
         Xmin (float): Minimum X coordinate of the segmentation in pixels, 
             defining the left boundary of the ROI.
         Xmax (float): Maximum X coordinate of the segmentation in pixels, 
@@ -274,9 +275,8 @@ def segment_refinement(input_image_obj, Xmin, Xmax, Ymin, Ymax):
     # Refine segmentation to increase smoothing
     # Save output to .txt file to load later.
 
-    image = input_image_obj
-    input_image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    ret, thresholded_image = cv2.threshold(input_image_gray, 30, 255, 0)
+    context = ImageContext.wrap(input_image_obj)
+    thresholded_image = context.threshold(30).copy()  # Copied as the shared threshold is read-only
     thresholded_image[:, int(Xmax): -1] = 0
     thresholded_image[:, 0: int(Xmin) - 1] = 0
     thresholded_image[0: int(Ymin) - 50, :] = 0
@@ -344,6 +344,55 @@ def segment_refinement(input_image_obj, Xmin, Xmax, Ymin, Ymax):
     return refined_segmentation_mask, top_curve_mask, top_curve_coords
 
 
+def contour_column_counts(contours, n_columns):
+    """Counts the number of contours that have at least one point in each column.
+
+    The counts are computed with a single histogram over the unique (contour, column)
+    pairs, rather than by testing every column against every contour.
+
+    Args:
+        contours (list) : Contours as returned by cv2.findContours.
+        n_columns (int) : The number of columns to count, starting from column 0.
+            Points beyond the last column are ignored.
+
+    Returns:
+        **counts** (ndarray) : The number of contours with a point in each column.
+    """
+    n_columns = max(n_columns, 0)
+    if len(contours) == 0:
+        return np.zeros(n_columns, dtype=np.intp)
+
+    x_values = np.concatenate([np.reshape(contour, (-1, 2))[:, 0] for contour in contours]).astype(np.intp)
+    contour_ids = np.repeat(np.arange(len(contours)), [np.reshape(contour, (-1, 2)).shape[0] for contour in contours])
+
+    # Each contour only counts once per column
+    stride = max(int(x_values.max()) + 1, n_columns, 1)
+    x_values = np.unique(contour_ids * stride + x_values) % stride
+
+    return np.bincount(x_values, minlength=stride)[:n_columns]
+
+
+def remove_dense_columns(binary_image, max_count=15, value=255):
+    """Blanks the columns of an image that contain too many pixels of a given value.
+
+    Used to remove long vertical lines, such as the axis itself, from contour images
+    so that only short tick-like objects remain.
+
+    Args:
+        binary_image (ndarray) : A 2D image, typically of drawn contours.
+        max_count (int, optional) : Columns with more than this number of pixels equal to
+            value are set to 0. Defaults to 15.
+        value (int, optional) : The pixel value to count. Defaults to 255.
+
+    Returns:
+        **pruned_image** (ndarray) : A copy of binary_image with the dense columns set to 0.
+    """
+    pruned_image = np.array(binary_image)
+    column_counts = np.count_nonzero(pruned_image == value, axis=0)
+    pruned_image[:, column_counts > max_count] = 0
+    return pruned_image
+
+
 def search_for_ticks(input_image_obj, side, left_dimensions, right_dimensions):
     """
     Search for tick marks on either the left or right axis of an image.
@@ -356,7 +405,7 @@ def search_for_ticks(input_image_obj, side, left_dimensions, right_dimensions):
     details of the processing.
 
     Args:
-        input_image_obj (str) : Name of file within current directory, or path to a file.
+        input_image_obj (ndarray or ImageContext) : The image in BGR order, or its ImageContext.
         side (str) : Indicates the 'Left' or 'Right' axes.
         left_dimensions (list) : edge points for the left axes ROI [Xmin, Xmax, Ymin, Ymax].
         right_dimensions (list) : edge points for the left axes ROI [Xmin, Xmax, Ymin, Ymax].
@@ -377,7 +426,8 @@ def search_for_ticks(input_image_obj, side, left_dimensions, right_dimensions):
             - **ROI3** (ndarray) : Axes ROI used for visualisation (not used - only initialised here).
     """
 
-    image = input_image_obj
+    context = ImageContext.wrap(input_image_obj)
+    image = context.bgr
     thresholded_image = image
 
     if side == "Left":
@@ -402,9 +452,7 @@ def search_for_ticks(input_image_obj, side, left_dimensions, right_dimensions):
     W = morphology.remove_small_objects(nonzero_pixels, 20, connectivity=2)
     W = W.astype(float)
 
-    im = input_image_obj
-    input_image_gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
-    ret, thresholded_image = cv2.threshold(input_image_gray, 127, 255, 0)
+    thresholded_image = context.threshold(127)
 
     if side == "Left":
         ROIAX = thresholded_image[
@@ -430,16 +478,7 @@ def search_for_ticks(input_image_obj, side, left_dimensions, right_dimensions):
     cv2.drawContours(ROI2, contours, -1, [255], 1)
     Cs = list(contours)  # list the contour coordinates as array
     if side == "Right":
-        for Column in range(
-                0, int(right_dimensions[1]) - int(right_dimensions[0])
-        ):  # Move across and find the line with most contours in.
-            count = 0
-            for Row in range(0, (int(right_dimensions[3]) - int(right_dimensions[2]))):
-                if ROI2[Row, Column] == 255:
-                    count = count + 1
-
-            if count > (15):
-                ROI2[:, Column] = 0
+        ROI2 = remove_dense_columns(ROI2, max_count=15)  # Removes the lines with most contours in.
 
     ROI2 = ROI2.astype(np.uint8)
     contours, hierarchy = cv2.findContours(
@@ -479,17 +518,10 @@ def search_for_ticks(input_image_obj, side, left_dimensions, right_dimensions):
         [],
     )  # Initialise some variables
 
-    all = []
-    for TGT in range(0, int(right_dimensions[1]) - int(right_dimensions[0])):
-        count = 0
-        Ctest = 0
-        for id in ids:
-            Ctest = np.reshape(Cs[id], (-1, 2))
-            x_values = [i[0] for i in Ctest]
-            if TGT in x_values:
-                count = count + 1
-
-        all.append(count)
+    # Number of contours crossing each column of the ROI
+    all = contour_column_counts(
+        [Cs[id] for id in ids], int(right_dimensions[1]) - int(right_dimensions[0])
+    )
 
     peaks, vals = signal.find_peaks(all, height=3)  # Miss last 20 pixels as
     if side == "Left":
@@ -602,6 +634,147 @@ def search_for_ticks(input_image_obj, side, left_dimensions, right_dimensions):
     )
 
 
+LABEL_OCR_CONFIG = "--psm 11 -c tessedit_char_whitelist=-0123456789"  # Tesseract config for the axes labels
+TILE_GAP = 20  # Blank rows between the tiles of a batched threshold sweep
+MAX_TILED_HEIGHT = 30000  # Tesseract can not read images taller than 32767 pixels
+
+
+def _label_retries(extracted_text_data):
+    """Counts the labels extracted from an axis that are not divisible by 5.
+
+    Args:
+        extracted_text_data (dict): The output of ocr.image_to_data as a dictionary.
+
+    Returns:
+        **retry** (int): The number of numeric labels that are not a multiple of 5.
+    """
+    number = []
+    for i in range(len(extracted_text_data["text"])):
+        if extracted_text_data["text"][i] != "":
+            number.append(extracted_text_data["text"][i])
+
+    retry = 0
+    for num in number:
+        try:
+            if (float(num) / 5).is_integer() == 0:
+                retry += 1
+        except Exception:
+            pass
+
+    return retry
+
+
+def _split_tiled_ocr_data(extracted_text_data, tile_shape, n_tiles, gap=TILE_GAP):
+    """Splits the OCR output of vertically tiled images into the output of each tile.
+
+    Each tile's output starts with a page level entry covering the tile, followed by the
+    entries whose box centres lie within the tile, with their tops relative to the tile.
+
+    Args:
+        extracted_text_data (dict): The output of ocr.image_to_data for the tiled image.
+        tile_shape (tuple): The (height, width) of each tile.
+        n_tiles (int): The number of tiles.
+        gap (int, optional): The number of blank rows between tiles. Defaults to TILE_GAP.
+
+    Returns:
+        **tiles_data** (list): A dictionary in the format of ocr.image_to_data for each tile.
+    """
+    height, width = tile_shape
+    pitch = height + gap
+    tiles_data = []
+    for _ in range(n_tiles):
+        page = {key: [values[0]] for key, values in extracted_text_data.items()}
+        page["left"][0], page["top"][0], page["width"][0], page["height"][0] = 0, 0, width, height
+        tiles_data.append(page)
+
+    for i in range(len(extracted_text_data["level"])):
+        if extracted_text_data["level"][i] == 1:
+            continue
+        y_centre = extracted_text_data["top"][i] + extracted_text_data["height"][i] / 2
+        tile = int(y_centre // pitch)
+        if tile >= n_tiles or y_centre - tile * pitch > height:
+            continue  # Box lies in a gap between tiles
+
+        for key, values in extracted_text_data.items():
+            tiles_data[tile][key].append(values[i])
+        tiles_data[tile]["top"][-1] -= tile * pitch
+
+    return tiles_data
+
+
+def _label_sweep(context, roi_rows, roi_columns, thresh_values, config):
+    """Thresholds an axis ROI at each level in turn until its labels are consistent.
+
+    Args:
+        context (ImageContext): The decoded image.
+        roi_rows (slice): The rows of the axis ROI.
+        roi_columns (slice): The columns of the axis ROI.
+        thresh_values (ndarray): The threshold levels, in order of preference.
+        config (str): The tesseract configuration.
+
+    Returns:
+        (tuple): tuple containing:
+            - **ROIAX** (ndarray): The ROI thresholded at the chosen level.
+            - **extracted_text_data** (dict): The OCR output of the ROI at the chosen level.
+    """
+    for thresh_value in thresh_values:
+        thresholded_image = context.threshold(thresh_value)
+        ROIAX = thresholded_image[roi_rows, roi_columns]
+
+        extracted_text_data = ocr.image_to_data(ROIAX, config=config)
+
+        if _label_retries(extracted_text_data) == 0:
+            break
+
+    # No threshold gave consistent labels, so the last one is used
+    return ROIAX, extracted_text_data
+
+
+def _batched_label_sweep(gray_roi, thresh_values, config, gap=TILE_GAP):
+    """Thresholds an axis ROI at several levels and extracts the labels of many levels at once.
+
+    The thresholded variants of the ROI are stacked vertically, separated by blank rows, and
+    read with one OCR call per batch of tiles. The boxes are then mapped back to each
+    threshold. The first batch holds only the first level, as that is usually consistent, and
+    each batch after it is twice as large, up to MAX_TILED_HEIGHT rows, so the sweep stops
+    after reading at most about twice the levels the sequential sweep reads.
+
+    Args:
+        gray_roi (ndarray): The greyscale ROI of the axis.
+        thresh_values (ndarray): The threshold levels, in order of preference.
+        config (str): The tesseract configuration.
+        gap (int, optional): The number of blank rows between tiles. Defaults to TILE_GAP.
+
+    Returns:
+        (tuple): tuple containing:
+            - **ROIAX** (ndarray): The ROI thresholded at the chosen level.
+            - **extracted_text_data** (dict): The OCR output of the ROI at the chosen level.
+    """
+    # Same as cv2.threshold(gray_roi, thresh_value, 255, cv2.THRESH_BINARY) for every level
+    variants = np.where(gray_roi[None, :, :] > np.asarray(thresh_values)[:, None, None], 255, 0).astype(np.uint8)
+    height, width = gray_roi.shape
+    pitch = height + gap
+    max_tiles_per_call = max(1, (MAX_TILED_HEIGHT + gap) // pitch)
+
+    first = 0
+    tiles_per_call = 1
+    while first < len(variants):
+        batch = variants[first: first + tiles_per_call]
+        first += len(batch)
+        tiles_per_call = min(2 * tiles_per_call, max_tiles_per_call)
+        tiled_image = np.zeros((len(batch) * pitch - gap, width), dtype=np.uint8)
+        for i, variant in enumerate(batch):
+            tiled_image[i * pitch: i * pitch + height] = variant
+
+        tiled_text_data = ocr.image_to_data(tiled_image, config=config)
+        for i, extracted_text_data in enumerate(_split_tiled_ocr_data(tiled_text_data, (height, width), len(batch), gap)):
+            if _label_retries(extracted_text_data) == 0:
+                return batch[i], extracted_text_data
+
+    # No threshold gave consistent labels, so the last one is used as in the sequential sweep
+    return batch[-1], extracted_text_data
+
+
 def search_for_labels(
         Cs,
         ROIAX,
@@ -615,6 +788,7 @@ def search_for_labels(
         input_image_obj,
         ROI2,
         ROI3,
+        batched_threshold_sweep=False,
 ):
     """
     Searches for labels within specified regions of an image, extracts text,
@@ -627,6 +801,11 @@ def search_for_labels(
     the image being analyzed (left or right) and draws rectangles around the
     detected text. It also warns if characters are too close.
 
+    The first threshold at which every label is divisible by 5 is chosen. By default
+    each threshold is tried in turn with its own OCR call. With batched_threshold_sweep,
+    the ROI is thresholded at every level at once and the variants are tiled into batches
+    of growing size, so a few OCR calls cover the whole sweep.
+
     Args:
         Cs (tuple): List of center points.
         ROIAX (ndarray): Region of Interest (ROI) array for the X axis, modified
@@ -639,9 +818,12 @@ def search_for_labels(
         Side (str): Side of the image being processed ('Left' or 'Right').
         Left_dimensions (list): Dimensions for the left ROI.
         Right_dimensions (list): Dimensions for the right ROI.
-        input_image_obj (ndarray): Image object to be processed.
+        input_image_obj (ndarray or ImageContext): Image object to be processed, in BGR order,
+            or its ImageContext.
         ROI2 (ndarray): Secondary ROI, stores contour detection data during tick search.
         ROI3 (ndarray): Axes ROI used for visualisation.
+        batched_threshold_sweep (bool, optional): If True, OCR all the thresholds of the
+            sweep in one call. Defaults to False.
 
     Returns:
         (tuple): tuple containing:
@@ -650,42 +832,22 @@ def search_for_labels(
             - **positions** (list): A list of positions of the label values.
             - **empty_to_fill** (ndarray): A array showing bounding boxes on image.
     """
-    extracted_text_data = None
-    for thresh_value in np.arange(100, 190, 5):  # Threshold to optimise the resulting text extraction.
-        image = input_image_obj
-        input_image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        ret, thresholded_image = cv2.threshold(input_image_gray, thresh_value, 255, 0)
-        if Side == "Left":
-            ROIAX = thresholded_image[
-                    int(Left_dimensions[2]): int(Left_dimensions[3]),
-                    int(Left_dimensions[0]): int(Left_dimensions[0] + TYLshift),
-                    ]  # Right ROI
-        elif Side == "Right":
-            ROIAX = thresholded_image[
-                    int(Right_dimensions[2]): int(Right_dimensions[3]),
-                    int(Right_dimensions[0] + TYLshift): int(Right_dimensions[1]),
-                    ]  # Left ROI
-
-        extracted_text_data = pytesseract.image_to_data(
-            ROIAX,
-            output_type=Output.DICT,
-            config="--psm 11 -c tessedit_char_whitelist=-0123456789",
-        )
-        number = []
-        for i in range(len(extracted_text_data["text"])):
-            if extracted_text_data["text"][i] != "":
-                number.append(extracted_text_data["text"][i])
-
-        retry = 0
-        for num in number:
-            try:
-                if (float(num) / 5).is_integer() == 0:
-                    retry += 1
-            except Exception:
-                pass
+    context = ImageContext.wrap(input_image_obj)
+    image = context.bgr
+    if Side == "Left":
+        roi_rows = slice(int(Left_dimensions[2]), int(Left_dimensions[3]))
+        roi_columns = slice(int(Left_dimensions[0]), int(Left_dimensions[0] + TYLshift))  # Right ROI
+    elif Side == "Right":
+        roi_rows = slice(int(Right_dimensions[2]), int(Right_dimensions[3]))
+        roi_columns = slice(int(Right_dimensions[0] + TYLshift), int(Right_dimensions[1]))  # Left ROI
 
-        if retry == 0:
-            break
+    thresh_values = np.arange(100, 190, 5)  # Threshold to optimise the resulting text extraction.
+    if batched_threshold_sweep:
+        ROIAX, extracted_text_data = _batched_label_sweep(
+            context.gray[roi_rows, roi_columns], thresh_values, LABEL_OCR_CONFIG
+        )
+    else:
+        ROIAX, extracted_text_data = _label_sweep(context, roi_rows, roi_columns, thresh_values, LABEL_OCR_CONFIG)
 
     # d = pytesseract.image_to_data(
     #     ROIAX,
@@ -787,55 +949,7 @@ def search_for_labels(
             Final_CenPoints.append(CenPoints[int(id)])
 
     except Exception:  # if this step fails, a backup is to assume center of text box is the tick
-        extracted_text_data = pytesseract.image_to_data(
-            ROIAX,
-            output_type=Output.DICT,
-            config="--psm 11 -c tessedit_char_whitelist=-0123456789",
-        )
-        n_boxes = len(extracted_text_data["level"])
-        CenBox = []  # Initialise variable to populate with box center coords
-        for i in range(1, n_boxes):  # dont start from 0 as the first index is redundant
-            if Side == "Left":
-                (x, y, wi, h) = (
-                    extracted_text_data["left"][i],
-                    extracted_text_data["top"][i],
-                    extracted_text_data["width"][i],
-                    extracted_text_data["height"][i],
-                )  # define (Xleft, Ytop, width, height) of each object from the dictionary
-            elif Side == "Right":
-                (x, y, wi, h) = (
-                    extracted_text_data["left"][i] + TYLshift,
-                    extracted_text_data["top"][i],
-                    extracted_text_data["width"][i],
-                    extracted_text_data["height"][i],
-                )  # define (Xleft, Ytop, width, height) of each object from the dictionary
-
-            o = i / 4  # we get 4 repeats for each real box, so this reduces that to 1.
-            if o.is_integer():
-                if Side == "Left":
-                    CenBox.append(
-                        [
-                            (extracted_text_data["left"][i] + (extracted_text_data["width"][i] / 2)),
-                            (extracted_text_data["top"][i] + (extracted_text_data["height"][i] / 2)),
-                        ]
-                    )  # calculate the center point of each bounding box
-                elif Side == "Right":
-                    CenBox.append(
-                        [
-                            (extracted_text_data["left"][i] + TYLshift + (extracted_text_data["width"][i] / 2)),
-                            (extracted_text_data["top"][i] + (extracted_text_data["height"][i] / 2)),
-                        ]
-                    )  # calculate the center point of each bounding box
-            cv2.rectangle(
-                ROI3, (x, y), (x + wi, y + h), (255), 2
-            )  # Draw the rectangles on the ROI
-
-        for i in range(0, len(CenBox)):
-            dists = cdist([CenBox[i]], CenBox)
-            dists[0][i] = dists.max()
-            if dists.min() < 20:
-                logger.warning("Characters too close")
-
+        # The text boxes of the chosen threshold were already found above, so they are reused
         Final_CenPoints = CenBox
 
     # Failed_Indexes = []
@@ -1127,48 +1241,42 @@ def plot_correction(Xplot, Yplot, df):
     return df
 
 
-def scan_type_test(input_image_filename):
+def scan_type_test(input_image_filename, reduce_factor=1):
     """
     Function for yellow filtering an image and searching for a list of target words indicative of
     a doppler ultrasound scan taken using the Voluson E8, RAB6-D.
 
+    Only the band above 45% of the image width holds the text of interest, so the colour
+    conversions and the OCR are restricted to that band.
+
     Args:
-        input_image_filename (str) : Name of file within current directory, or path to a file.
+        input_image_filename (str or ImageContext) : Name of file within current directory, or path to a file.
+            Alternatively, the ImageContext of an already decoded image.
+        reduce_factor (int, optional) : Decodes the file at 1/reduce_factor of its resolution,
+            which JPEG decoding does at a fraction of the cost. Only use a factor at which the
+            text can still be read. Defaults to 1.
 
     Returns:
         **Fail** (int) : Idicates if the file is a fail (1) - doesn't meet criteria for a doppler ultrasound, or pass (0) - does meet criteria. 
 
     """
 
-    img = cv2.imread(input_image_filename)  # Input image file
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)  # Convert to grayscale
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)  # Convert to HSV
+    if isinstance(input_image_filename, ImageContext):
+        context = input_image_filename
+    else:
+        context = ImageContext.from_file(input_image_filename, reduce_factor)  # Input image file
+    img = context.bgr
+    text_band = img[: int(img.shape[1] * 0.45)]  # Exclude bottom 3rd of image - target scans have no text of interest here.
+    gray = cv2.cvtColor(text_band, cv2.COLOR_BGR2GRAY)  # Grayscale
+    hsv = cv2.cvtColor(text_band, cv2.COLOR_BGR2HSV)  # HSV
     lower_yellow = np.array([1, 100, 100], dtype=np.uint8)  # Lower yellow bound
     upper_yellow = np.array([200, 255, 255], dtype=np.uint8)  # Upper yellow bound
     mask = cv2.inRange(hsv, lower_yellow, upper_yellow)  # Threshold HSV between bounds
-    yellow_text = cv2.bitwise_and(gray, gray, mask=mask)
-
-    yellow_text[int(img.shape[1] * 0.45): img.shape[1], :] = 0  # Exclude bottom 3rd of image - target scans have no text of interest here.
-    pixels = np.array(yellow_text)
-    data = pytesseract.image_to_data(
-        pixels, output_type=Output.DICT, lang="eng", config="--psm 3 "
-    )
-
-    # Loop through each word and draw a box around it
-    for i in range(len(data["text"])):
-        x = data["left"][i]
-        y = data["top"][i]
-        segmentation_mask = data["width"][i]
-        h = data["height"][i]
-        if int(data["conf"][i]) > 1:
-            cv2.rectangle(img, (x, y), (x + segmentation_mask, y + h), (0, 0, 255), 2)
-
-    # Display image
-    # cv2.imshow('img', img)
+    pixels = cv2.bitwise_and(gray, gray, mask=mask)
 
     # Perform OCR on the preprocessed image
     custom_config = r"--oem 3 --psm 3"
-    text = pytesseract.image_to_string(pixels, lang="eng", config=custom_config)
+    text = ocr.image_to_string(pixels, lang="eng", config=custom_config)
 
     # Analyze the OCR output
     lines = text.splitlines()
@@ -1233,13 +1341,15 @@ def annotate(
     and highlighting them in specific colors.
 
     The function draws perimeters around the provided dimensions for the left,
-    right, and waveform components on the segmentation mask. Then, it modifies
-    the input image's pixel data to overlay these perimeters and color-codes the
-    different regions: the waveform in red and the left/right axes in green,
-    and the bounds of the ticks and labels in magenta.
+    right, and waveform components. Then, it composites these perimeters onto a
+    copy of the input image with boolean masks and color-codes the different
+    regions: the waveform in red and the left/right axes in green, and the
+    bounds of the ticks and labels in magenta. Neither the input image nor the
+    segmentation mask are modified.
 
     Args:
-        input_image_obj (PIL.Image.Image): The original image to be annotated.
+        input_image_obj (PIL.Image.Image or ndarray): The original image to be annotated,
+            either as a PIL image or as a (height, width, 3 or 4) RGB(A) numpy array.
         refined_segmentation_mask (numpy.ndarray): The segmentation mask that
             indicates the regions of interest.
         Left_dimensions (tuple): The (x_min, x_max, y_min, y_max) dimensions for
@@ -1252,7 +1362,8 @@ def annotate(
         Right_axis (numpy.ndarray): The segmentation mask (ticks and labels) for the right axis.
 
     Returns:
-        PIL.Image.Image: The annotated image with ROIs color-coded and highlighted.
+        **annotated_image** (ndarray): A new (height, width, 4) RGBA array of the annotated
+        image with ROIs color-coded and highlighted.
     """
 
     Xmin, Xmax, Ymin, Ymax = Waveform_dimensions
@@ -1271,40 +1382,27 @@ def annotate(
     c = [Ymax, Ymax, Ymin, Ymin, Ymax]
     rr, cc = polygon_perimeter(c, r, refined_segmentation_mask.shape)
 
-    refined_segmentation_mask[rr, cc] = 2  # set color white
-    refined_segmentation_mask[rrL, ccL] = 2
-    refined_segmentation_mask[rrR, ccR] = 2
-
-    img_RGB = input_image_obj  # .convert('RGB')
-    pixel_data = img_RGB.load()
-    # gry = img_RGB.convert("L")  # returns grayscale version.
-
-    for y in range(img_RGB.size[1]):
-        for x in range(img_RGB.size[0]):
-            # r = pixel_data[x, y][0]
-            # g = pixel_data[x, y][1]
-            # b = pixel_data[x, y][2]
-            # rgb_values = [r, g, b]
-            # min_rgb = min(rgb_values)
-            # max_rgb = max(rgb_values)
-            # rgb_range = max_rgb - min_rgb
-
-            if refined_segmentation_mask[y, x] == 1:
-                pixel_data[x, y] = (
-                    255,
-                    pixel_data[x, y][1],
-                    pixel_data[x, y][2],
-                    250,
-                )  # Segmented waveform as Red
-            elif refined_segmentation_mask[y, x] == 2:
-                pixel_data[x, y] = (1, 255, 1, 255)  # Set ROIs to blue
-            elif Left_axis[y, x] == 255:
-                pixel_data[x, y] = (255, 0, 255, 255)  # Set ROIs to blue
-            elif Right_axis[y, x] == 255:
-                pixel_data[x, y] = (255, 0, 255, 255)  # Set ROIs to blue
-            else:
-                pixel_data[x, y] = pixel_data[x, y]
-    return img_RGB
+    border_mask = np.zeros(refined_segmentation_mask.shape, dtype=bool)
+    border_mask[rr, cc] = True
+    border_mask[rrL, ccL] = True
+    border_mask[rrR, ccR] = True
+
+    # Each layer only covers the pixels not claimed by a layer of higher priority
+    waveform_mask = (refined_segmentation_mask == 1) & ~border_mask
+    axes_mask = ((Left_axis == 255) | (Right_axis == 255)) & ~border_mask & ~waveform_mask
+
+    if isinstance(input_image_obj, Image.Image):
+        annotated_image = np.array(input_image_obj.convert("RGBA"))
+    else:
+        annotated_image = np.empty(input_image_obj.shape[:2] + (4,), dtype=np.uint8)
+        annotated_image[..., :3] = input_image_obj[..., :3]
+        annotated_image[..., 3] = input_image_obj[..., 3] if input_image_obj.shape[-1] == 4 else 255
+
+    annotated_image[waveform_mask, 0] = 255  # Segmented waveform as Red
+    annotated_image[waveform_mask, 3] = 250
+    annotated_image[border_mask] = (1, 255, 1, 255)  # Set ROIs to green
+    annotated_image[axes_mask] = (255, 0, 255, 255)  # Set ticks and labels to magenta
+    return annotated_image
 
 
 def colour_extract(input_image_obj, TargetRGB, cyl_length, cyl_radius):
@@ -1379,24 +1477,18 @@ def append_spherical_1point(xyz):
     return ptsnew
 
 
-def colour_extract_vectorized(input_image_obj, target_rgb, cyl_length, cyl_radius):
-    """
-    Extracts a specified color from an image using a cylindrical filter in RGB space.
-
-    Given an image object and a target RGB color, this function creates a cylindrical
-    filter in RGB space defined by the specified length and radius. It extracts regions
-    of the image that match the color within the defined cylindrical space.
+def _colour_cylinder(target_rgb, cyl_length):
+    """Returns the start and end points of the cylinder axis around a target colour in RGB space.
 
     Args:
-        input_image_obj (np.ndarray): A 3D numpy array representing the RGB image.
         target_rgb (list): A list of three integers representing the target RGB color.
         cyl_length (int): The length of the cylindrical filter along the axis of the color
                           in RGB space.
-        cyl_radius (int): The radius of the cylindrical filter in RGB space.
 
     Returns:
-        output_image (PIL.Image.Image): An image where regions matching the target color are highlighted
-                         and the rest of the image is set to black.
+        (tuple): tuple containing:
+            - **start** (ndarray): The RGB coordinates of the start of the cylinder axis.
+            - **end** (ndarray): The RGB coordinates of the end of the cylinder axis.
     """
     # Convert the target RGB color to spherical coordinates
     targ = np.array(target_rgb)
@@ -1418,33 +1510,291 @@ def colour_extract_vectorized(input_image_obj, target_rgb, cyl_length, cyl_radiu
     B2 = out2[2] + O2
     start = np.array([R1, G1, B1])
     end = np.array([R2, G2, B2])
-    r = cyl_radius
+    return start, end
 
-    # Convert the image to a numpy array (only considering RGB channels)
-    img_array = input_image_obj
 
-    # Vectorized computation to check if each pixel lies within the cylinder in RGB space
+@functools.lru_cache(maxsize=8)
+def _colour_lookup_table(target_rgb, cyl_length, cyl_radius):
+    """Cached worker of colour_lookup_table, target_rgb must be a hashable tuple."""
+    start, end = _colour_cylinder(target_rgb, cyl_length)
+    r = cyl_radius
+
     # Calculate the vector defining the cylinder axis
     vec = end - start
     # Calculate the cylinder's constraint based on its radius
     constraint = r * np.linalg.norm(vec)
-    # Calculate the cross products for each pixel in the image
-    cross_products = np.cross(img_array - start, vec)
-    # Calculate the dot products for the start and end points of the cylinder
-    dot_products_start = np.tensordot(img_array - start, vec, axes=([2], [0]))
-    dot_products_end = np.tensordot(img_array - end, vec, axes=([2], [0]))
-    # Generate a boolean mask indicating if a pixel lies within the cylinder
-    mask = (dot_products_start >= 0) & (dot_products_end <= 0) & (np.linalg.norm(cross_products, axis=2) <= constraint)
 
-    # Create the output image based on the mask, setting target color regions to white and all else to black
-    output_array = np.where(mask[..., None], [255, 255, 255], [0, 0, 0])
+    # Evaluates every green/blue combination for one red value at a time, to bound the memory used
+    green, blue = np.meshgrid(np.arange(256), np.arange(256), indexing="ij")
+    colour_plane = np.stack([np.zeros_like(green), green, blue], axis=-1)
+    inside = np.zeros((256, 256, 256), dtype=bool)
+    for red in range(256):
+        colour_plane[..., 0] = red
+        # Calculate the cross products for each colour
+        cross_products = np.cross(colour_plane - start, vec)
+        # Calculate the dot products for the start and end points of the cylinder
+        dot_products_start = np.tensordot(colour_plane - start, vec, axes=([2], [0]))
+        dot_products_end = np.tensordot(colour_plane - end, vec, axes=([2], [0]))
+        # Generate a boolean mask indicating if a colour lies within the cylinder
+        inside[red] = (
+            (dot_products_start >= 0) & (dot_products_end <= 0) & (np.linalg.norm(cross_products, axis=2) <= constraint)
+        )
 
-    # Convert the numpy array back to an image for the final output
-    output_image = Image.fromarray(np.uint8(output_array)).convert("RGB")
+    table = np.packbits(inside.reshape(-1), bitorder="little")
+    table.flags.writeable = False  # The table is shared between all callers
+    return table
+
+
+def colour_lookup_table(target_rgb, cyl_length, cyl_radius):
+    """
+    Bit-packed membership table of every 8-bit RGB colour for a cylindrical colour filter.
+
+    Bit ``(R << 16) | (G << 8) | B`` of the table (little bit order) is set if the colour
+    lies within the cylinder defined by colour_extract_vectorized. Tables are cached for the
+    most recently used parameters, so every caller using the same parameters shares one table.
+
+    Args:
+        target_rgb (list): A list of three integers representing the target RGB color.
+        cyl_length (int): The length of the cylindrical filter along the axis of the color
+                          in RGB space.
+        cyl_radius (int): The radius of the cylindrical filter in RGB space.
+
+    Returns:
+        **table** (ndarray): A read-only uint8 array of 256**3 / 8 bytes.
+    """
+    return _colour_lookup_table(tuple(int(c) for c in target_rgb), cyl_length, cyl_radius)
+
+
+def colour_extract_vectorized(input_image_obj, target_rgb, cyl_length, cyl_radius):
+    """
+    Extracts a specified color from an image using a cylindrical filter in RGB space.
+
+    Given an image object and a target RGB color, this function creates a cylindrical
+    filter in RGB space defined by the specified length and radius. It extracts regions
+    of the image that match the color within the defined cylindrical space.
+
+    Whether a colour lies within the cylinder is precomputed once for all 8-bit colours
+    (see colour_lookup_table), so classifying the image is a single table lookup per pixel.
+
+    Args:
+        input_image_obj (PIL.Image.Image or np.ndarray): The RGB image, either as a PIL image
+                          or as a 3D numpy array.
+        target_rgb (list): A list of three integers representing the target RGB color.
+        cyl_length (int): The length of the cylindrical filter along the axis of the color
+                          in RGB space.
+        cyl_radius (int): The radius of the cylindrical filter in RGB space.
+
+    Returns:
+        output_image (PIL.Image.Image): An image where regions matching the target color are highlighted
+                         and the rest of the image is set to black.
+    """
+    table = colour_lookup_table(target_rgb, cyl_length, cyl_radius)
+    img_array = _rgb_array(input_image_obj)
+
+    # Index of each pixel colour within the lookup table
+    colour_index = img_array[..., 0].astype(np.uint32) << 16
+    colour_index |= img_array[..., 1].astype(np.uint32) << 8
+    colour_index |= img_array[..., 2]
+
+    # Gathers the byte holding each pixel's bit and writes the mask, white for the target colour
+    mask = table[colour_index >> 3]
+    mask >>= (colour_index & 7).astype(np.uint8)
+    mask &= 1
+    mask *= 255
+
+    # Convert the mask back to an image for the final output
+    output_image = Image.fromarray(mask, mode="L").convert("RGB")
 
     return output_image
 
 
+# The metrics read from the text of a scan, with the prefix of each type of scan
+TARGET_WORDS = [
+    "Lt Ut-PS",
+    "Lt Ut-ED",
+    "Lt Ut-S/D",
+    "Lt Ut-PI",
+    "Lt Ut-RI",
+    "Lt Ut-MD",
+    "Lt Ut-TAmax",
+    "Lt Ut-HR",
+    "Rt Ut-PS",
+    "Rt Ut-ED",
+    "Rt Ut-S/D",
+    "Rt Ut-PI",
+    "Rt Ut-RI",
+    "Rt Ut-MD",
+    "Rt Ut-TAmax",
+    "Rt Ut-HR",
+    "Umb-PS",
+    "Umb-ED",
+    "Umb-S/D",
+    "Umb-PI",
+    "Umb-RI",
+    "Umb-MD",
+    "Umb-TAmax",
+    "Umb-HR",
+    "DV-S",
+    "DV-D",
+    "DV-a",
+    "DV-TAmax",
+    "DV-S/a",
+    "DV-a/S",
+    "DV-PI",
+    "DV-PLI",
+    "DV-PVIV",
+    "DV-HR",
+
+]
+# The metrics with their units, as they appear in the text
+TARGET_WORDS_EXTENDED = [
+    "Lt Ut-PS cm/s",
+    "Lt Ut-ED cm/s",
+    "Lt Ut-S/D",
+    "Lt Ut-PI",
+    "Lt Ut-RI",
+    "Lt Ut-MD cm/s",
+    "Lt Ut-TAmax cm/s",
+    "Lt Ut-HR bpm",
+    "Rt Ut-PS cm/s",
+    "Rt Ut-ED cm/s",
+    "Rt Ut-S/D",
+    "Rt Ut-PI",
+    "Rt Ut-RI",
+    "Rt Ut-MD cm/s",
+    "Rt Ut-TAmax cm/s",
+    "Rt Ut-HR bpm",
+    "Umb-PS cm/s",
+    "Umb-ED cm/s",
+    "Umb-S/D",
+    "Umb-PI",
+    "Umb-RI",
+    "Umb-MD cm/s",
+    "Umb-TAmax cm/s",
+    "Umb-HR bpm",
+    "DV-S cm/s",
+    "DV-D cm/s",
+    "DV-a",
+    "DV-TAmax cm/s",
+    "DV-S/a",
+    "DV-a/S",
+    "DV-PI",
+    "DV-PLI",
+    "DV-PVIV",
+    "DV-HR bpm",
+
+]
+TARGET_PREFIXES = ["Lt", "Rt", "Umb", "DV"]
+TARGET_WORDS_BY_PREFIX = {
+    prefix: [word for word in TARGET_WORDS if word.startswith(prefix)] for prefix in TARGET_PREFIXES
+}
+
+
+def target_distances(lines, targets, score_cutoff=None):
+    """Computes the Levenshtein distance between every line and every target in one call.
+
+    Args:
+        lines (list) : The lines of text.
+        targets (list) : The target words.
+        score_cutoff (int, optional) : The largest distance of interest. Pairs whose lengths
+            differ by more than this are skipped, and any distance above it is returned as
+            score_cutoff + 1. Defaults to None, which computes every distance exactly.
+
+    Returns:
+        **distances** (ndarray) : The (len(lines), len(targets)) integer distances.
+    """
+    if not len(lines) or not len(targets):
+        return np.zeros((len(lines), len(targets)), dtype=np.int32)
+    return process.cdist(lines, targets, scorer=Levenshtein.distance, score_cutoff=score_cutoff, dtype=np.int32)
+
+
+def cluster_1d(values, tolerance, min_samples=2):
+    """Clusters 1-D values by sorting them once and splitting on the gaps larger than tolerance.
+
+    The labels are the same as those of sklearn.cluster.DBSCAN(eps=tolerance,
+    min_samples=min_samples) on the values as a column. A value is a core value if at least
+    min_samples values, itself included, are within tolerance of it. Neighbouring core values
+    within tolerance of each other share a cluster, and the other values join the cluster of a
+    core value within tolerance of them, or are noise.
+
+    Args:
+        values (array_like) : The values to cluster.
+        tolerance (float) : The largest difference between two values in the same neighbourhood.
+        min_samples (int, optional) : The number of values in the neighbourhood of a core value.
+            Defaults to 2.
+
+    Returns:
+        **labels** (ndarray) : The cluster of each value, numbered from 0 in the order of their
+            first core value, or -1 for noise.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    labels = np.full(len(values), -1, dtype=int)
+    if not len(values):
+        return labels
+
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    # The number of values in the closed neighbourhood of each sorted value
+    counts = (
+        np.searchsorted(sorted_values, sorted_values + tolerance, side="right")
+        - np.searchsorted(sorted_values, sorted_values - tolerance, side="left")
+    )
+    core = np.flatnonzero(counts >= min_samples)
+    if not len(core):
+        return labels
+
+    # Consecutive core values further apart than tolerance start a new cluster
+    core_values = sorted_values[core]
+    core_cluster = np.concatenate([[0], np.cumsum(np.diff(core_values) > tolerance)])
+    # Clusters are numbered by their first core value in the original order
+    first_index = np.full(core_cluster[-1] + 1, len(values))
+    np.minimum.at(first_index, core_cluster, order[core])
+    rank = np.empty_like(first_index)
+    rank[np.argsort(first_index)] = np.arange(len(first_index))
+    core_cluster = rank[core_cluster]
+
+    # Every value joins the cluster of the nearest core value on either side within tolerance,
+    # the one numbered first if both are
+    right = np.minimum(np.searchsorted(core_values, sorted_values, side="left"), len(core) - 1)
+    left = np.maximum(np.searchsorted(core_values, sorted_values, side="right") - 1, 0)
+    cluster = np.full(len(values), len(values))
+    for side in (left, right):
+        near = np.abs(core_values[side] - sorted_values) <= tolerance
+        cluster[near] = np.minimum(cluster[near], core_cluster[side[near]])
+    labels[order] = np.where(cluster < len(values), cluster, -1)
+    return labels
+
+
+TEXT_BAND_FRACTION = 0.45  # The text is in the top of the scan, below it are only fails
+TEXT_BAND_MARGIN = 10  # Blank pixels kept around the text, as tesseract reads text at the edge poorly
+
+
+def _text_band_box(band, margin=TEXT_BAND_MARGIN):
+    """Finds the bounding box of the non-zero pixels of the text band, with a margin.
+
+    Args:
+        band (PIL.Image.Image) : The colour-filtered text band of the scan.
+        margin (int, optional) : The number of pixels added on each side, within the band.
+            Defaults to TEXT_BAND_MARGIN.
+
+    Returns:
+        **box** (tuple) : The (left, upper, right, lower) box, or the whole band if it is empty.
+    """
+    mask = np.asarray(band)
+    if mask.ndim == 3:
+        mask = mask.any(axis=2)
+    rows = np.flatnonzero(mask.any(axis=1))
+    columns = np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return 0, 0, band.size[0], band.size[1]
+    return (
+        max(int(columns[0]) - margin, 0),
+        max(int(rows[0]) - margin, 0),
+        min(int(columns[-1]) + 1 + margin, band.size[0]),
+        min(int(rows[-1]) + 1 + margin, band.size[1]),
+    )
+
+
 def text_from_greyscale(input_image_obj, COL):
     """
     Extracts and processes text from a greyscale image using OCR (Optical Character Recognition).
@@ -1455,12 +1805,12 @@ def text_from_greyscale(input_image_obj, COL):
     DataFrame. It also includes matching of specific target words and extraction of associated
     numeric values and units, and uses known relationships between extracted metrics to correct
     errors in text recognition. The function utilizes PIL for image manipulation, numpy for array
-    operations, scipy for image processing, pytesseract for OCR, and OpenCV for drawing bounding
+    operations, scipy for image processing, usseg.ocr for OCR, and OpenCV for drawing bounding
     boxes around the text.
 
     Args:
         input_image_obj (str) : Name of file within current directory, or path to a file.
-        COL (JpegImageFile) : PIL JpegImageFile of the filtered image highlighting yellow text.
+        COL (JpegImageFile) : PIL JpegImageFile of the filtered image highlighting yellow text. It is not modified.
     Returns:
         (tuple): tuple containing:
             - **Fail** (int) - Checks if the function has failed (1), or passed (0).
@@ -1468,22 +1818,23 @@ def text_from_greyscale(input_image_obj, COL):
 
     """
 
-    PIX = COL.load()
     img = input_image_obj
 
     # 2. Apply slight Gaussian blur
     # smoothed_image = COL.filter(ImageFilter.GaussianBlur(radius=1)) # In some cases smoothing helps, in others it makes it worse?
 
-    for y in range(
-            int(COL.size[1] * 0.45), COL.size[1]
-    ):  # Exclude bottom 3rd of image - these are fails
-        for x in range(COL.size[0]):
-            PIX[x, y] = (0, 0, 0)
+    # Exclude the bottom of the image - these are fails. Crops past the band are padded with black.
+    text_band = COL.crop((0, 0, COL.size[0], int(COL.size[1] * TEXT_BAND_FRACTION)))
 
-    pixels = COL  # np.array(smoothed_image)
-    data = pytesseract.image_to_data(
-        pixels, output_type=Output.DICT, lang="eng", config="--oem 1 --psm 3 -c tessedit_char_blacklist=l,!_|=$"
+    # Only the text is read, so tesseract does not analyse the layout of the blank background
+    band_left, band_top, band_right, band_bottom = _text_band_box(text_band)
+    pixels = text_band.crop((band_left, band_top, band_right, band_bottom))  # np.array(smoothed_image)
+    data = ocr.image_to_data(
+        pixels, lang="eng", config="--oem 1 --psm 3 -c tessedit_char_blacklist=l,!_|=$"
     )
+    # The boxes are relative to the crop, so they are moved back into the image
+    data["left"] = [left + band_left for left in data["left"]]
+    data["top"] = [top + band_top for top in data["top"]]
 
     # This is rough, if more than 30 objects found then highly likely it is a waveform scan.
     Fail = 1 if len(data["text"]) < 30 else 0
@@ -1514,12 +1865,8 @@ def text_from_greyscale(input_image_obj, COL):
         heights = OCR_data["height"]
         x_centers = [left + width / 2 for left, width in zip(lefts, widths)]  # Calculate x_center for sorting
 
-        # Convert y_center to a numpy array and reshape for DBSCAN
-        data = np.array(y_center).reshape(-1, 1)
-
-        # Perform DBSCAN clustering on y-coordinates
-        dbscan = DBSCAN(eps=tolerance, min_samples=2)
-        labels = dbscan.fit_predict(data)
+        # Cluster the y-coordinates into lines
+        labels = cluster_1d(y_center, tolerance, min_samples=2)
 
         # Group the indices based on the cluster labels
         groups = {}
@@ -1563,7 +1910,7 @@ def text_from_greyscale(input_image_obj, COL):
     left, top = bounding_boxes[bounding_box_index]['top_left']
     right, bottom = bounding_boxes[bounding_box_index]['bottom_right']
     crop_box = (left - 1, top - 1, right + 1, bottom - 1)
-    cropped_image = COL.crop(crop_box)
+    cropped_image = text_band.crop(crop_box)
 
     # def increase_dpi(image, factor=2):
     #     """Increases the DPI of an image by a factor
@@ -1648,55 +1995,19 @@ def text_from_greyscale(input_image_obj, COL):
     plt.imshow(img)
 
     # Analyze the OCR output
-    target_words = [
-        "Lt Ut-PS",
-        "Lt Ut-ED",
-        "Lt Ut-S/D",
-        "Lt Ut-PI",
-        "Lt Ut-RI",
-        "Lt Ut-MD",
-        "Lt Ut-TAmax",
-        "Lt Ut-HR",
-        "Rt Ut-PS",
-        "Rt Ut-ED",
-        "Rt Ut-S/D",
-        "Rt Ut-PI",
-        "Rt Ut-RI",
-        "Rt Ut-MD",
-        "Rt Ut-TAmax",
-        "Rt Ut-HR",
-        "Umb-PS",
-        "Umb-ED",
-        "Umb-S/D",
-        "Umb-PI",
-        "Umb-RI",
-        "Umb-MD",
-        "Umb-TAmax",
-        "Umb-HR",
-        "DV-S",
-        "DV-D",
-        "DV-a",
-        "DV-TAmax",
-        "DV-S/a",
-        "DV-a/S",
-        "DV-PI",
-        "DV-PLI",
-        "DV-PVIV",
-        "DV-HR",
-    ]
+    target_words = list(TARGET_WORDS)
 
     # Split text into lines
     lines = grouped_words  # text.split("\n")
-    # Initialize DataFrame
-    df = pd.DataFrame(columns=["Line", "Word", "Value", "Unit"])
+    # Initialize the records, the DataFrame is only built once they are complete
+    records = TextRecords()
 
-    prefixes = ["Lt", "Rt", "Umb", "DV"]
-    prefix_counts = {prefix: sum(1 for line in lines if prefix in line) for prefix in prefixes}
+    prefix_counts = {prefix: sum(1 for line in lines if prefix in line) for prefix in TARGET_PREFIXES}
     most_likely_prefix = max(prefix_counts, key=prefix_counts.get)
 
     # Filter target words based on the most likely prefix
-    target_words = [word for word in target_words if word.startswith(most_likely_prefix)]
-    word_order = [word for word in target_words if word.startswith(most_likely_prefix)]
+    target_words = list(TARGET_WORDS_BY_PREFIX[most_likely_prefix])
+    word_order = list(TARGET_WORDS_BY_PREFIX[most_likely_prefix])
     target_word_mem = target_words.copy()
     # Step 1: Exact matching
     matched_lines = set()  # to store the indices of lines that have been matched
@@ -1710,17 +2021,11 @@ def text_from_greyscale(input_image_obj, COL):
                 if match:
                     value = float(match.group(1).replace(' ', ''))
                     unit = match.group(4) if match.group(4) else ""
-                    df = df._append(
-                        {"Line": i + 1, "Word": word, "Value": value, "Unit": unit},
-                        ignore_index=True,
-                    )
+                    records.append(i + 1, word, value, unit)
                     target_words.remove(word)
                 else:
                     # logger.warning("couldn't find numeric data for line.")
-                    df = df._append(
-                        {"Line": i + 1, "Word": word, "Value": 0, "Unit": 0},
-                        ignore_index=True,
-                    )
+                    records.append(i + 1, word, 0, 0)
                     target_words.remove(word)
                 matched_lines.add(i)
                 break  # Exit the inner loop once a match is found
@@ -1749,131 +2054,70 @@ def text_from_greyscale(input_image_obj, COL):
                     if match:
                         value = float(match.group(1))
                         unit = match.group(2) if match.group(2) else ""
-                        df = df._append(
-                            {"Line": i + 1, "Word": word, "Value": value, "Unit": unit},
-                            ignore_index=True,
-                        )
+                        records.append(i + 1, word, value, unit)
                         target_words.remove(word)
                     else:
                         # logger.warning("couldn't find numeric data for line.")
-                        df = df._append(
-                            {"Line": i + 1, "Word": word, "Value": 0, "Unit": 0},
-                            ignore_index=True,
-                        )
+                        records.append(i + 1, word, 0, 0)
                         target_words.remove(word)
                     matched_lines.add(i)
                     break  # Exit the inner loop once a match is found
 
-    def find_closest_target(line, target_words):
-        min_distance = float('inf')
-        closest_word = None
-
-        for word in target_words:
-            distance = Levenshtein.distance(line, word)
-            if distance < min_distance:
-                min_distance = distance
-                closest_word = word
-
-        return closest_word, min_distance
-
     # Set a threshold for acceptable similarity
     threshold = 7
 
-    for i, line in enumerate(lines):
-        if i not in matched_lines:  # only process unmatched lines
-            closest_word, distance = find_closest_target(line, target_words)
-
-            if distance <= threshold:
-                # Extract value and unit
-                match = re.search(r"(\-?\d+(\s*\d+)*\.\s*\d+|\-?\d+(\s*\d+)*)\s*([^\d\s]+)?$", line)
-                if match:
-                    value = float(match.group(1).replace(' ', ''))
-                    unit = match.group(4) if match.group(4) else ""
-                    df = df._append(
-                        {"Line": i + 1, "Word": closest_word, "Value": value, "Unit": unit},
-                        ignore_index=True,
-                    )
-                    target_words.remove(closest_word)
-                matched_lines.add(i)
-
-    target_words_extended = [
-        "Lt Ut-PS cm/s",
-        "Lt Ut-ED cm/s",
-        "Lt Ut-S/D",
-        "Lt Ut-PI",
-        "Lt Ut-RI",
-        "Lt Ut-MD cm/s",
-        "Lt Ut-TAmax cm/s",
-        "Lt Ut-HR bpm",
-        "Rt Ut-PS cm/s",
-        "Rt Ut-ED cm/s",
-        "Rt Ut-S/D",
-        "Rt Ut-PI",
-        "Rt Ut-RI",
-        "Rt Ut-MD cm/s",
-        "Rt Ut-TAmax cm/s",
-        "Rt Ut-HR bpm",
-        "Umb-PS cm/s",
-        "Umb-ED cm/s",
-        "Umb-S/D",
-        "Umb-PI",
-        "Umb-RI",
-        "Umb-MD cm/s",
-        "Umb-TAmax cm/s",
-        "Umb-HR bpm",
-        "DV-S cm/s",
-        "DV-D cm/s",
-        "DV-a",
-        "DV-TAmax cm/s",
-        "DV-S/a",
-        "DV-a/S",
-        "DV-PI",
-        "DV-PLI",
-        "DV-PVIV",
-        "DV-HR bpm",
-    ]
+    # The distances of the unmatched lines to the remaining targets, computed in one call. Only
+    # distances up to the threshold matter, so the pairs that can't reach it are skipped.
+    unmatched_lines = [i for i in range(len(lines)) if i not in matched_lines]
+    closest_targets = list(target_words)
+    distances = target_distances([lines[i] for i in unmatched_lines], closest_targets, score_cutoff=threshold)
+    available = np.ones(len(closest_targets), dtype=bool)
+
+    for row, i in enumerate(unmatched_lines):
+        line = lines[i]
+        if available.any():
+            # The first of the closest targets that is still unmatched
+            candidates = np.where(available, distances[row], np.iinfo(np.int32).max)
+            closest = int(np.argmin(candidates))
+            closest_word, distance = closest_targets[closest], candidates[closest]
+        else:
+            closest_word, distance = None, float('inf')
+
+        if distance <= threshold:
+            # Extract value and unit
+            match = re.search(r"(\-?\d+(\s*\d+)*\.\s*\d+|\-?\d+(\s*\d+)*)\s*([^\d\s]+)?$", line)
+            if match:
+                value = float(match.group(1).replace(' ', ''))
+                unit = match.group(4) if match.group(4) else ""
+                records.append(i + 1, closest_word, value, unit)
+                target_words.remove(closest_word)
+                available[closest] = False
+            matched_lines.add(i)
 
     if target_words:
 
         suffixes = [word.split('-')[-1] for word in target_words if '-' in word]
-        indices = [i for i, entry in enumerate(target_words_extended) if any(sub in entry for sub in target_words)]
-        remaining_target_extended = [target_words_extended[i] for i in indices]
+        indices = [i for i, entry in enumerate(TARGET_WORDS_EXTENDED) if any(sub in entry for sub in target_words)]
+        remaining_target_extended = [TARGET_WORDS_EXTENDED[i] for i in indices]
 
         # Create a distance matrix
         num_lines = len(lines)
         num_target_words = len(remaining_target_extended)
         distance_matrix = np.zeros((num_lines, num_target_words))
 
-        # Bias values - these need to be defined by you, for example:
-        # Create a list of bias values, all set to -2, with the same length as suffixes
-        bias_values = [-2] * len(suffixes)  # Creates a list with -2 repeated len(suffixes) times
+        # Calculate biased distances, stripping the digits from each unmatched line once
+        unmatched_lines = [i for i in range(num_lines) if i not in matched_lines]
+        if unmatched_lines:
+            # Suffix that corresponds to each target word
+            expected_suffixes = [suffixes[j] for j in range(num_target_words)]
+            lines_no_digits = [re.sub(r'\d+', '', lines[i]) for i in unmatched_lines]
+            basic_distances = target_distances(lines_no_digits, remaining_target_extended)
 
-        # Bias dictionary, where the keys are suffixes and the values are the bias amounts
-        bias_dict = {suffix: bias for suffix, bias in zip(suffixes, bias_values)}
-
-        # Initialize your distance matrix
-        num_lines = len(lines)
-        num_target_words = len(remaining_target_extended)
-        distance_matrix = np.zeros((num_lines, num_target_words))
-
-        # Calculate biased distances
-        for i, line in enumerate(lines):
-            if i not in matched_lines:
-                for j, word in enumerate(remaining_target_extended):
-                    # Remove digits from the line
-                    line_no_digits = re.sub(r'\d+', '', line)
-
-                    # Calculate basic Levenshtein distance
-                    basic_distance = Levenshtein.distance(line_no_digits, word)
-
-                    # Apply bias if a specific suffix is expected in the line
-                    expected_suffix = suffixes[j]  # Suffix that corresponds to the current target word
-                    if expected_suffix in line:
-                        # Subtract bias to reduce distance
-                        basic_distance += bias_dict[expected_suffix]
-
-                    # Set the biased distance in the matrix
-                    distance_matrix[i, j] = basic_distance
+            # Subtract a bias to reduce the distance if the expected suffix is in the line
+            bias = np.array(
+                [[-2 if suffix in lines[i] else 0 for suffix in expected_suffixes] for i in unmatched_lines]
+            ).reshape(basic_distances.shape)
+            distance_matrix[unmatched_lines] = basic_distances + bias
 
         matches = {}
         for j, word in enumerate(remaining_target_extended):
@@ -1890,50 +2134,140 @@ def text_from_greyscale(input_image_obj, COL):
                 if match:
                     value = float(match.group(1).replace(' ', ''))
                     unit = match.group(4) if match.group(4) else ""
-                    df = df._append(
-                        {"Line": i + 1, "Word": target_words[j], "Value": value, "Unit": unit},
-                        ignore_index=True,
-                    )
+                    records.append(i + 1, target_words[j], value, unit)
                 else:
-                    df = df._append(
-                        {"Line": i + 1, "Word": target_words[j], "Value": 0, "Unit": 0},
-                        ignore_index=True,
-                    )
+                    records.append(i + 1, target_words[j], 0, 0)
                 matched_lines.add(i)
 
                 # Remove the matched line from further consideration
                 distance_matrix[i, :] = np.inf
 
-    # Create a mask for each word in the word_order list and concatenate them in order
-    df = pd.concat([df.loc[df['Word'] == word] for word in word_order]).reset_index(drop=True)
+    # Orders the records by the word_order list
+    records.order_by(word_order)
 
     try:  # This is still a test really
         if most_likely_prefix == "DV":
-
-            if df.loc[df['Word'] == 'DV-D', 'Value'].values[0] > df.loc[df['Word'] == 'DV-S', 'Value'].values[0] and df.loc[df['Word'] == 'DV-S/a', 'Value'].values[0] > \
-                    df.loc[df['Word'] == 'DV-S', 'Value'].values[0] and df.loc[df['Word'] == 'DV-S/a', 'Unit'].values[0] != '':
-                # Storing temporary values for swapping
-                temp = df.loc[df['Word'] == 'DV-S/a', 'Value'].values[0]
-                df.loc[df['Word'] == 'DV-S/a', 'Value'] = df.loc[df['Word'] == 'DV-S', 'Value'].values[0]
-                df.loc[df['Word'] == 'DV-S', 'Value'] = temp
-                print("swapped DV-S/a and DV-S")
-
-            if df.loc[df['Word'] == 'DV-a/S', 'Unit'].values[0] != '' and df.loc[df['Word'] == 'DV-a', 'Unit'].values[0] == '':
-                # Storing temporary values for swapping
-                temp = df.loc[df['Word'] == 'DV-a/S', 'Value'].values[0]
-                temp_unit = df.loc[df['Word'] == 'DV-a/S', 'Unit'].values[0]
-                df.loc[df['Word'] == 'DV-a/S', 'Value'] = df.loc[df['Word'] == 'DV-a', 'Value'].values[0]
-                df.loc[df['Word'] == 'DV-a/S', 'Unit'] = df.loc[df['Word'] == 'DV-a', 'Unit'].values[0]
-                df.loc[df['Word'] == 'DV-a', 'Value'] = temp
-                df.loc[df['Word'] == 'DV-a', 'Unit'] = temp_unit
-
-            df = metric_check_dv(df)  # handle the ductus venousus differently
+            _swap_dv_values(records)
+            records = metric_check_dv(records)  # handle the ductus venousus differently
         else:
-            df = metric_check(df)  # for left, right, and umbilical
+            records = metric_check(records)  # for left, right, and umbilical
     except:
         print("metric check failed")
 
-    return Fail, df
+    return Fail, records.to_dataframe()
+
+
+def _swap_dv_values(records):
+    """Swaps the DV values that are commonly read from each other's lines, in place.
+
+    S/a is swapped with S if it has a unit and is larger than S while D is too, and a/S is
+    swapped with a, with their units, if a/S has a unit and a does not.
+
+    Args:
+        records (TextRecords) : The metrics of a DV scan, before metric_check_dv.
+    """
+    if records.value('D') > records.value('S') and records.value('S/a') > records.value('S') and \
+            records.unit('S/a') != '':
+        # Storing temporary values for swapping
+        temp = records.value('S/a')
+        records.set_value('S/a', records.value('S'))
+        records.set_value('S', temp)
+        print("swapped DV-S/a and DV-S")
+
+    if records.unit('a/S') != '' and records.unit('a') == '':
+        # Storing temporary values for swapping
+        temp = records.value('a/S')
+        temp_unit = records.unit('a/S')
+        records.set_value('a/S', records.value('a'))
+        records.set_unit('a/S', records.unit('a'))
+        records.set_value('a', temp)
+        records.set_unit('a', temp_unit)
+
+
+METRIC_CHECK_TOLERANCES = {"SoverD": 0.2, "RI": 0.2, "TAmax": 4}  # TAmax is larger, as its equation is approximate
+METRIC_CHECK_DV_TOLERANCES = {"Sovera": 0.2, "PI": 0.2, "TAmax": 2}
+
+
+def _hypothesis_values(hypotheses):
+    """Returns the values of a stage of hypotheses of the metric check, as they are compared.
+
+    The values are compared as float64, with the missing ones as NaN, unless the first of the
+    stage is missing. Then they are compared as they are, and comparing a missing value raises
+    a TypeError.
+
+    Args:
+        hypotheses (dict) : The value of each hypothesis, or None if it could not be derived.
+
+    Returns:
+        **values** (dict) : The values of the hypotheses, in the same order.
+    """
+    if next(iter(hypotheses.values())) is None:
+        return dict(hypotheses)
+    return {name: np.nan if value is None else np.float64(value) for name, value in hypotheses.items()}
+
+
+def _consistent_hypotheses(extracted, hypotheses, tolerances):
+    """Finds the first hypothesis of each metric that agrees with the extracted value of the metric.
+
+    Args:
+        extracted (dict) : The extracted value of each metric, or None if it was not extracted.
+        hypotheses (dict) : The values of the hypotheses, as returned by _hypothesis_values. The
+            name of a hypothesis starts with the metric it derives, e.g. "RI_from_ED_from_SoverD".
+        tolerances (dict) : The largest difference between the derived and extracted values of
+            each metric, in the order the metrics are checked.
+
+    Returns:
+        **conditions_met** (list) : The names of the consistent hypotheses, at most one per metric.
+    """
+    conditions_met = []
+    for metric, tolerance in tolerances.items():
+        extracted_value = extracted[metric]
+        if extracted_value is None:
+            continue
+        for name, value in hypotheses.items():
+            if name.startswith(metric) and abs(value - extracted_value) < tolerance:
+                conditions_met.append(name)
+                break  # Only the first consistent hypothesis of a metric is kept
+    return conditions_met
+
+
+def _set_dataframe_values(df, values):
+    """Sets the values of metrics in a DataFrame of text data in place, by metric name.
+
+    Args:
+        df (DataFrame) : The text data, with the columns 'Word' and 'Value'.
+        values (dict) : The value of each metric to set, by metric name, e.g. "PS".
+    """
+    names = df["Word"].map(metric_name)
+    for name, value in values.items():
+        df.loc[names == name, "Value"] = value
+
+
+def _missing_value(df):
+    """Returns the value of the metrics added to a table by the metric checks, as 0 of the dtype of its values.
+
+    A DataFrame with numeric values keeps their dtype when rows are added to it, so, e.g., the
+    added values of a float64 column are numpy floats, which divide by zero without raising.
+    """
+    if isinstance(df, pd.DataFrame) and df["Value"].dtype != object:
+        return df["Value"].dtype.type(0)
+    return 0
+
+
+def _checked_table(df, source, records):
+    """Returns the result of a metric check, of the same type as the table it was given.
+
+    A DataFrame is corrected in place and returned, as is the TextRecords of the metrics,
+    unless metrics were missing. Then the check returns a new table with the missing rows.
+
+    Args:
+        df (DataFrame or TextRecords) : The table given to the check.
+        source (TextRecords) : The records of df.
+        records (TextRecords) : The checked records, which are source unless rows were added.
+    """
+    if not isinstance(df, pd.DataFrame):
+        return records
+    return df if records is source else records.to_dataframe()
 
 
 def metric_check(df):
@@ -1947,17 +2281,22 @@ def metric_check(df):
     over diastolic ratio (S/D), resistance index (RI), and TAmax from the corrected PS and ED 
     values and checks them against the extracted metrics for consistency.
 
+    The metrics are read once by name, e.g. "PS" for "Lt Ut-PS", and the hypotheses deriving
+    them from each other are compared in stages. The corrections are then written back in one
+    update. The DataFrame or records are corrected in place, unless metrics are missing, in which
+    case they are added to a copy. Use metric_check_batch to check the text data of many images.
+
     Args:
-        - **df** (DataFrame): Extracted data from image
+        - **df** (DataFrame or TextRecords): Extracted data from image
 
     Returns:
-        - df (DataFrame): DataFrame with corrected values after metric checking calculations
+        - df (DataFrame or TextRecords): Corrected values after metric checking calculations, of the same type as df
     """
 
     def identify_prefix(lines):
         # Try to identify the prefix in use
         for prefix in ["Lt", "Rt", "Umb"]:
-            if lines['Word'].str.contains(prefix).any():
+            if any(prefix in word for word in lines.words()):
                 print("prefix found")
                 PRF = prefix
 
@@ -1992,28 +2331,34 @@ def metric_check(df):
 
         return PRF, target_words  # Return None if no known prefix is found
 
-    def add_missing_rows(df_in):
+    def add_missing_rows(records_in):
         # Identify the Prefix
-        prefix, target_words = identify_prefix(df_in)
-
-        # Determine Missing Rows
-        existing_words = df_in['Word'].tolist()
-        missing_targets = [word for word in target_words if word not in existing_words]
+        prefix, target_words = identify_prefix(records_in)
 
         # Add Missing Rows
-        for target in missing_targets:
-            new_row = {"Word": target, "Value": 0, "Unit": ""}
-            df_in = df_in._append(new_row, ignore_index=True)
+        if any(word not in records_in.words() for word in target_words):
+            records_in = records_in.copy()
+            records_in.add_missing(target_words, _missing_value(df))
+
+        return records_in
+
+    is_dataframe = isinstance(df, pd.DataFrame)
+    source = TextRecords.from_dataframe(df) if is_dataframe else df
+    records = add_missing_rows(source)
 
-        return df_in
+    # Each metric is resolved once, and the corrections are written back in one update
+    metrics = {name: records.value(name) for name in ["PS", "ED", "S/D", "PI", "RI", "MD", "TAmax"]}
+    corrections = {}
 
-    df = add_missing_rows(df)
+    def correct(name, value):
+        metrics[name] = value
+        corrections[name] = value
 
-    def check_TAmax_value(value_in, df_in):  # Decimal can be misread, so common sense check.
+    def check_TAmax_value(value_in):  # Decimal can be misread, so common sense check.
 
-        MD = df_in.loc[df['Word'].str.contains('MD'), 'Value'].values[0] if df_in['Word'].str.contains('MD').any() else 0
-        PS = df_in.loc[df['Word'].str.contains('PS'), 'Value'].values[0] if df_in['Word'].str.contains('PS').any() else 0
-        ED = df_in.loc[df['Word'].str.contains('ED'), 'Value'].values[0] if df_in['Word'].str.contains('ED').any() else 0
+        MD = metrics['MD']
+        PS = metrics['PS']
+        ED = metrics['ED']
 
         # If the other values are positive, return the absolute value of TAmax
         if value_in < 0 < MD and PS > 0 and ED > 0:
@@ -2021,21 +2366,10 @@ def metric_check(df):
 
         return value_in  # or return some default value or raise an exception
 
-    # Sense check some values:
-    PI = df.loc[df['Word'].str.contains('PI'), 'Value'].values[0] if df['Word'].str.contains('PI').any() else 0
-    df.loc[df['Word'].str.contains('PI'), 'Value'] = check_pi_value(PI)
-    TAmax = df.loc[df['Word'].str.contains('TAmax'), 'Value'].values[0] if df['Word'].str.contains('TAmax').any() else 0
-    df.loc[df['Word'].str.contains('TAmax'), 'Value'] = check_TAmax_value(TAmax, df)
-
-    # Peak systolic
-    PS = df.loc[df['Word'].str.contains('PS'), 'Value'].values[0] if df['Word'].str.contains('PS').any() else 0
-    # End diastolic
-    ED = df.loc[df['Word'].str.contains('ED'), 'Value'].values[0] if df['Word'].str.contains('ED').any() else 0
-
-    def check_TAmax_value(PS, ED, df):  # Decimal can be misread, so common sense check.
+    def check_PS_ED_values(PS, ED):  # Decimal can be misread, so common sense check.
 
-        TAmax = df.loc[df['Word'].str.contains('TAmax'), 'Value'].values[0] if df['Word'].str.contains('TAmax').any() else 0
-        MD = df.loc[df['Word'].str.contains('MD'), 'Value'].values[0] if df['Word'].str.contains('MD').any() else 0
+        TAmax = metrics['TAmax']
+        MD = metrics['MD']
 
         # Check if there's a difference in sign between PS and ED
         if (PS > 0 > ED) or (PS < 0 < ED):
@@ -2065,183 +2399,111 @@ def metric_check(df):
 
         return PSnew, EDnew
 
-    PS, ED = check_TAmax_value(PS, ED, df)  # sense check for pressures
-    df.loc[df['Word'].str.contains('PS'), 'Value'] = PS
-    df.loc[df['Word'].str.contains('ED'), 'Value'] = ED
-
-    # Find S/D
-    SoverD_calc = PS / ED
-    # Find RI
-    RI_calc = (PS - ED) / PS
-    # Find TAmax
-    TAmax_calc = (PS + (2 * ED)) / 3
-
-    # Now check whether the PS & ED dependant metrics are consistent between calculated and extracted:
-    # Extracted values with default as None if not present
-    SoverD_extracted = df.loc[df['Word'].str.contains('S/D'), 'Value'].values[0] if df['Word'].str.contains('S/D').any() else None
-    RI_extracted = df.loc[df['Word'].str.contains('RI'), 'Value'].values[0] if df['Word'].str.contains('RI').any() else None
-    TAmax_extracted = df.loc[df['Word'].str.contains('TAmax'), 'Value'].values[0] if df['Word'].str.contains('TAmax').any() else None
-    comparison_dataframe = pd.DataFrame(index=['PS_extracted', 'ED_extracted', 'SoverD_extracted', 'RI_extracted', 'TAmax_extracted',
-                                               'SoverD_calc', 'RI_calc', 'TAmax_calc', 'PS_calc', 'ED_calc', 'ED_from_SoverD', 'ED_from_RI',
-                                               'SoverD_from_ED_from_RI', 'RI_from_ED_from_SoverD', 'TAmax_from_ED_from_SoverD', 'TAmax_from_ED_from_RI',
-                                               'PS_from_SoverD', 'PS_from_RI', 'SoverD_from_PS_from_RI', 'RI_from_PS_from_SoverD', 'TAmax_from_PS_from_SoverD',
-                                               'TAmax_from_PS_from_RI'], columns=['Extracted'])
-    # List of all the extracted metrics that exist
-    existing_metrics = [metric for metric in [SoverD_extracted, RI_extracted, TAmax_extracted] if metric is not None]
-    values_to_insert = {
-        'PS_extracted': PS,
-        'ED_extracted': ED,
-        'SoverD_extracted': SoverD_extracted,
-        'RI_extracted': RI_extracted,
-        'TAmax_extracted': TAmax_extracted
-    }
-
-    for key, value in values_to_insert.items():
-        comparison_dataframe.loc[key, 'Extracted'] = value
-        # Check closeness and store conditions met in a list
-
-    values_to_insert = {
-        'SoverD_calc': SoverD_calc,
-        'RI_calc': RI_calc,
-        'TAmax_calc': TAmax_calc
-    }
-    for key, value in values_to_insert.items():
-        comparison_dataframe.loc[key, 'First_calc'] = value
-        # Check closeness and store conditions met in a list
-
-    def Metric_comparison(c_df, col):
-
-        # Tolerance level (you can adjust this based on your requirements)
-        tolerance1 = 0.2
-        tolerance2 = 4  # This tolerance is larger because the equation we used for TAmax is approximate
-        conditions_met = []
-        for parameter, extracted_name in [('SoverD', 'SoverD_extracted'), ('RI', 'RI_extracted'), ('TAmax', 'TAmax_extracted')]:
-            extracted_value = c_df['Extracted'][extracted_name]
-
-            if extracted_value is not None:
-                for row_name, calc_value in c_df.iloc[:, col].items():
-                    if str(row_name).startswith(extracted_name[:-9]):  # If row name starts with the parameter name
-                        tolerance = tolerance1 if parameter != 'TAmax' else tolerance2
-                        if abs(calc_value - extracted_value) < tolerance:
-                            conditions_met.append(row_name)
-                            break  # Exit the inner loop once a match is found
-
-        return conditions_met
-
-    conditions_met = Metric_comparison(comparison_dataframe, 1)
-
-    # You've already extracted PS, SoverD_extracted, RI_extracted, and TAmax_extracted
-
-    # Check if all 3 metrics are inconsistent
-    if len(conditions_met) == 0:  # All 3 are not consistent
-        # Assume PS was extracted correctly, compute ED from the 3 metrics:
-        try:
-            # Recalculate ED using extracted metrics and assumed correct PS
-            ED_from_SoverD = PS / SoverD_extracted if SoverD_extracted else None
-            ED_from_RI = PS * (1 - RI_extracted) if RI_extracted else None
-            # Now, using these new ED values, recalculate the metrics
-            SoverD_from_ED_from_RI = PS / ED_from_RI if ED_from_RI else None
-            RI_from_ED_from_SoverD = (PS - ED_from_SoverD) / PS if ED_from_SoverD else None
-            TAmax_from_ED_from_SoverD = (PS + 2 * ED_from_SoverD) / 3 if ED_from_SoverD else None
-            TAmax_from_ED_from_RI = (PS + 2 * ED_from_RI) / 3 if ED_from_RI else None
-
-            values_to_insert = {
-                'ED_from_SoverD': ED_from_SoverD,
-                'ED_from_RI': ED_from_RI,
-                'SoverD_from_ED_from_RI': SoverD_from_ED_from_RI,
-                'RI_from_ED_from_SoverD': RI_from_ED_from_SoverD,
-                'TAmax_from_ED_from_SoverD': TAmax_from_ED_from_SoverD,
-                'TAmax_from_ED_from_RI': TAmax_from_ED_from_RI
-            }
-            for key, value in values_to_insert.items():
-                comparison_dataframe.loc[key, 'Second_calc'] = value
-                # Check closeness and store conditions met in a list
-
-            # Check conditions met with these values:
-            conditions_met = Metric_comparison(comparison_dataframe, 2)
-
-            if len(conditions_met) == 0 or (ED_from_RI < 2 and ED_from_SoverD < 2):  # If our assumption above was wrong
-                # Recalculate PS using the extracted metrics and assumed correct ED
-                PS_from_SoverD = SoverD_extracted * ED if SoverD_extracted else None
-                PS_from_RI = ED / (1 - RI_extracted) if RI_extracted else None
-                # Now, using these new PS values, recalculate the other metrics
-                SoverD_from_PS_from_RI = PS_from_RI / ED if PS_from_RI else None
-                RI_from_PS_from_SoverD = (PS_from_SoverD - ED) / PS_from_SoverD if PS_from_SoverD else None
-                TAmax_from_PS_from_SoverD = (PS_from_SoverD + 2 * ED) / 3 if PS_from_SoverD else None
-                TAmax_from_PS_from_RI = (PS_from_RI + 2 * ED) / 3 if PS_from_RI else None
-
-                values_to_insert = {
-                    'PS_from_SoverD': PS_from_SoverD,
-                    'PS_from_RI': PS_from_RI,
-                    'SoverD_from_PS_from_RI': SoverD_from_PS_from_RI,
-                    'RI_from_PS_from_SoverD': RI_from_PS_from_SoverD,
-                    'TAmax_from_PS_from_SoverD': TAmax_from_PS_from_SoverD,
-                    'TAmax_from_PS_from_RI': TAmax_from_PS_from_RI
-                }
-                for key, value in values_to_insert.items():
-                    comparison_dataframe.loc[key, 'Third_calc'] = value
-                    # Check closeness and store conditions met in a list
-
-                conditions_met = Metric_comparison(comparison_dataframe, 3)
-                # now check the conditions again:
-                if len(conditions_met) > 0:
-                    row_name = conditions_met[0]
-
-                    parts = row_name.split('_from_')
-                    desired_row_name = parts[1] + '_from_' + parts[2]
-                    new_value = comparison_dataframe.loc[desired_row_name, 'Third_calc']
+    def correct_from_PS_ED(PS, ED):
+        # Find S/D
+        correct('S/D', round(PS / ED, 2))
+        # Find RI
+        correct('RI', round((PS - ED) / PS, 2))
+        # Find TAmax
+        correct('TAmax', round((PS + (2 * ED)) / 3, 2))
+
+    try:
+        # Sense check some values:
+        correct('PI', check_pi_value(metrics['PI']))
+        correct('TAmax', check_TAmax_value(metrics['TAmax']))
+
+        # Peak systolic and end diastolic
+        PS, ED = check_PS_ED_values(metrics['PS'], metrics['ED'])  # sense check for pressures
+        correct('PS', PS)
+        correct('ED', ED)
+
+        # Now check whether the PS & ED dependant metrics are consistent between calculated and extracted
+        extracted = {'SoverD': metrics['S/D'], 'RI': metrics['RI'], 'TAmax': metrics['TAmax']}
+        first_calc = _hypothesis_values({
+            'SoverD_calc': PS / ED,
+            'RI_calc': (PS - ED) / PS,
+            'TAmax_calc': (PS + (2 * ED)) / 3,
+        })
+        conditions_met = _consistent_hypotheses(extracted, first_calc, METRIC_CHECK_TOLERANCES)
+
+        # Check if all 3 metrics are inconsistent
+        if len(conditions_met) == 0:  # All 3 are not consistent
+            # Assume PS was extracted correctly, compute ED from the 3 metrics:
+            SoverD_extracted = extracted['SoverD']
+            RI_extracted = extracted['RI']
+            try:
+                # Recalculate ED using extracted metrics and assumed correct PS
+                ED_from_SoverD = PS / SoverD_extracted if SoverD_extracted else None
+                ED_from_RI = PS * (1 - RI_extracted) if RI_extracted else None
+                # Now, using these new ED values, recalculate the metrics
+                second_calc = _hypothesis_values({
+                    'ED_from_SoverD': ED_from_SoverD,
+                    'ED_from_RI': ED_from_RI,
+                    'SoverD_from_ED_from_RI': PS / ED_from_RI if ED_from_RI else None,
+                    'RI_from_ED_from_SoverD': (PS - ED_from_SoverD) / PS if ED_from_SoverD else None,
+                    'TAmax_from_ED_from_SoverD': (PS + 2 * ED_from_SoverD) / 3 if ED_from_SoverD else None,
+                    'TAmax_from_ED_from_RI': (PS + 2 * ED_from_RI) / 3 if ED_from_RI else None,
+                })
+                conditions_met = _consistent_hypotheses(extracted, second_calc, METRIC_CHECK_TOLERANCES)
+
+                if len(conditions_met) == 0 or (ED_from_RI < 2 and ED_from_SoverD < 2):  # If our assumption above was wrong
+                    # Recalculate PS using the extracted metrics and assumed correct ED
+                    PS_from_SoverD = SoverD_extracted * ED if SoverD_extracted else None
+                    PS_from_RI = ED / (1 - RI_extracted) if RI_extracted else None
+                    # Now, using these new PS values, recalculate the other metrics
+                    third_calc = _hypothesis_values({
+                        'PS_from_SoverD': PS_from_SoverD,
+                        'PS_from_RI': PS_from_RI,
+                        'SoverD_from_PS_from_RI': PS_from_RI / ED if PS_from_RI else None,
+                        'RI_from_PS_from_SoverD': (PS_from_SoverD - ED) / PS_from_SoverD if PS_from_SoverD else None,
+                        'TAmax_from_PS_from_SoverD': (PS_from_SoverD + 2 * ED) / 3 if PS_from_SoverD else None,
+                        'TAmax_from_PS_from_RI': (PS_from_RI + 2 * ED) / 3 if PS_from_RI else None,
+                    })
+                    conditions_met = _consistent_hypotheses(extracted, third_calc, METRIC_CHECK_TOLERANCES)
+                    # now check the conditions again:
+                    if len(conditions_met) > 0:
+                        # The value the first consistent metric was derived from, e.g. PS_from_RI
+                        new_value = third_calc[conditions_met[0].split('_from_', 1)[1]]
+                        # We have calculated the new PS!
+                        print(f"Recalculated PS (from RI): {new_value}")
+                        PS = round(new_value, 2)
+                        correct('PS', PS)
+                        correct_from_PS_ED(PS, ED)
+
+                elif len(conditions_met) > 0:
+                    new_value = second_calc[conditions_met[0].split('_from_', 1)[1]]
                     # We have calculated the new PS!
                     print(f"Recalculated PS (from RI): {new_value}")
-                    df.loc[df['Word'].str.contains('PS'), 'Value'] = round(new_value, 2)
-                    PS = df.loc[df['Word'].str.contains('PS'), 'Value'].values[0]
-                    ED = df.loc[df['Word'].str.contains('ED'), 'Value'].values[0]
-                    # Find S/D
-                    df.loc[df['Word'].str.contains('S/D'), 'Value'] = round(PS / ED, 2)
-                    # Find RI
-                    df.loc[df['Word'].str.contains('RI'), 'Value'] = round((PS - ED) / PS, 2)
-                    # Find TAmax
-                    df.loc[df['Word'].str.contains('TAmax'), 'Value'] = round((PS + (2 * ED)) / 3, 2)
-
-            elif len(conditions_met) > 0:
-
-                row_name = conditions_met[0]
-
-                parts = row_name.split('_from_')
-                desired_row_name = parts[1] + '_from_' + parts[2]
-                new_value = comparison_dataframe.loc[desired_row_name, 'Second_calc']
-                # We have calculated the new PS!
-                print(f"Recalculated PS (from RI): {new_value}")
-                df.loc[df['Word'].str.contains('ED'), 'Value'] = round(new_value, 2)
-                PS = df.loc[df['Word'].str.contains('PS'), 'Value'].values[0]
-                ED = df.loc[df['Word'].str.contains('ED'), 'Value'].values[0]
+                    ED = round(new_value, 2)
+                    correct('ED', ED)
+                    correct_from_PS_ED(PS, ED)
+
+            except ZeroDivisionError:
+                print("Error: Division by zero encountered. Check the extracted values.")
+        elif len(conditions_met) < 3:
+            # At least 1 of the metrics is consistent, therefore PS and ED can be assumed to be correct,
+            # Caclulate the inconsistent metrics from the PS and ED calculations
+            print("At least one text extraction error, correcting...")
+
+            if 'SoverD' not in conditions_met:
                 # Find S/D
-                df.loc[df['Word'].str.contains('S/D'), 'Value'] = round(PS / ED, 2)
+                correct('S/D', round(PS / ED, 2))
+            if 'RI' not in conditions_met:
                 # Find RI
-                df.loc[df['Word'].str.contains('RI'), 'Value'] = round((PS - ED) / PS, 2)
+                correct('RI', round((PS - ED) / PS, 2))
+            if 'TAmax' not in conditions_met:
                 # Find TAmax
-                df.loc[df['Word'].str.contains('TAmax'), 'Value'] = round((PS + (2 * ED)) / 3, 2)
-
-
-        except ZeroDivisionError:
-            print("Error: Division by zero encountered. Check the extracted values.")
-    elif len(conditions_met) < 3:
-        # At least 1 of the metrics is consistent, therefore PS and ED can be assumed to be correct,
-        # Caclulate the inconsistent metrics from the PS and ED calculations
-        print("At least one text extraction error, correcting...")
-
-        if 'SoverD' not in conditions_met:
-            # Find S/D
-            df.loc[df['Word'].str.contains('S/D'), 'Value'] = round(PS / ED, 2)
-        if 'RI' not in conditions_met:
-            # Find RI
-            df.loc[df['Word'].str.contains('RI'), 'Value'] = round((PS - ED) / PS, 2)
-        if 'TAmax' not in conditions_met:
-            # Find TAmax
-            df.loc[df['Word'].str.contains('TAmax'), 'Value'] = round((PS + (2 * ED)) / 3, 2)
-    else:
-        print("All metrics are consistent.")
+                correct('TAmax', round((PS + (2 * ED)) / 3, 2))
+        else:
+            print("All metrics are consistent.")
+    finally:
+        # The corrections made before any error are kept, as the records are corrected in place
+        for name, value in corrections.items():
+            records.set_value(name, value)
+        if is_dataframe and records is source:
+            _set_dataframe_values(df, corrections)
 
-    return df
+    return _checked_table(df, source, records)
 
 
 def upscale_both_images(PIL_img, cv2_img, max_length=950, min_length=950):
@@ -2323,15 +2585,17 @@ def metric_check_dv(df):
     but DV scans have a separate set of measurements with their own unique relationship - this function
     corrects the values for DV scans.
 
+    As in metric_check, the metrics are read and corrected by name, in place unless any are missing.
+
     Args:
-        df (DataFrame): Extracted data from image
+        df (DataFrame or TextRecords): Extracted data from image
 
     Returns:
-        df(DataFrame): DataFrame with corrected values after metric checking calculations
+        df (DataFrame or TextRecords): Corrected values after metric checking calculations, of the same type as df
     """
 
     # Splitting the target words based on prefixes
-    def add_missing_rows(df):
+    def add_missing_rows(records_in):
         # Identify the Prefix
         prefix = "DV"
 
@@ -2345,24 +2609,30 @@ def metric_check_dv(df):
                         "DV-PLI",
                         "DV-PVIV",
                         "DV-HR", ]
-        # Determine Missing Rows
-        existing_words = df['Word'].tolist()
-        missing_targets = [word for word in target_words if word not in existing_words]
-
         # Add Missing Rows
-        for target in missing_targets:
-            new_row = {"Word": target, "Value": 0, "Unit": ""}
-            df = df._append(new_row, ignore_index=True)
+        if any(word not in records_in.words() for word in target_words):
+            records_in = records_in.copy()
+            records_in.add_missing(target_words, _missing_value(df))
+
+        return records_in
 
-        return df
+    is_dataframe = isinstance(df, pd.DataFrame)
+    source = TextRecords.from_dataframe(df) if is_dataframe else df
+    records = add_missing_rows(source)
 
-    df = add_missing_rows(df)
+    # As in metric_check, each metric is resolved once and the corrections are written back in one update
+    metrics = {name: records.value(name) for name in ["S", "D", "a", "TAmax", "S/a", "a/S", "PI"]}
+    corrections = {}
 
-    def check_TAmax_value(value, df):  # Decimal can be misread, so common sense check.
+    def correct(name, value):
+        metrics[name] = value
+        corrections[name] = value
 
-        PLI = df.loc[df['Word'] == 'DV-S/a', 'Value'].values[0]
-        PS = df.loc[df['Word'] == 'DV-S', 'Value'].values[0]
-        ED = df.loc[df['Word'] == 'DV-D', 'Value'].values[0]
+    def check_TAmax_value(value):  # Decimal can be misread, so common sense check.
+
+        PLI = metrics['S/a']
+        PS = metrics['S']
+        ED = metrics['D']
 
         # If the other values are positive, return the absolute value of TAmax
         if value < 0 < PLI and PS > 0 and ED > 0:
@@ -2370,21 +2640,10 @@ def metric_check_dv(df):
 
         return value  # or return some default value or raise an exception
 
-    # Sense check some values:
-    PI = df.loc[df['Word'] == 'DV-PI', 'Value'].values[0]
-    df.loc[df['Word'] == 'DV-PI', 'Value'] = check_pi_value(PI)
-    TAmax = df.loc[df['Word'] == 'DV-TAmax', 'Value'].values[0]
-    df.loc[df['Word'] == 'DV-TAmax', 'Value'] = check_TAmax_value(TAmax, df)
-
-    # Peak systolic
-    PS = df.loc[df['Word'] == 'DV-S', 'Value'].values[0]
-    # End diastolic
-    ED = df.loc[df['Word'] == 'DV-D', 'Value'].values[0]
+    def check_PS_ED_values(PS, ED):  # Decimal can be misread, so common sense check.
 
-    def check_TAmax_value(PS, ED, df):  # Decimal can be misread, so common sense check.
-
-        TAmax = df.loc[df['Word'] == 'DV-TAmax', 'Value'].values[0]
-        a = df.loc[df['Word'] == 'DV-a', 'Value'].values[0]
+        TAmax = metrics['TAmax']
+        a = metrics['a']
 
         # Check if there's a difference in sign between PS and ED
         if (PS > 0 and ED < 0) or (PS < 0 and ED > 0):
@@ -2396,8 +2655,6 @@ def metric_check_dv(df):
 
         return PS, ED
 
-    PS, ED = check_TAmax_value(PS, ED, df)  # sense check for pressures
-
     def check_S_D_value(value):  # Decimal can be misread, so common sense check.
         # If the value is between 0 and 2, return it as is
         if 0 <= abs(value) <= 60:
@@ -2414,188 +2671,156 @@ def metric_check_dv(df):
         # If the value is outside of these ranges, return a default or handle accordingly
         return value  # or return some default value or raise an exception
 
-    ED = check_S_D_value(ED)
-    df.loc[df['Word'] == 'DV-S', 'Value'] = PS
-    df.loc[df['Word'] == 'DV-D', 'Value'] = ED
-    a = df.loc[df['Word'] == 'DV-a', 'Value'].values[0]
-
-    # Find S/D
-    Sovera_calc = PS / a
-    # Find RI
-    aoverS_calc = a / PS
-    # Find TAmax
-    TAmax_calc = (PS + (2 * a)) / 3
-    # Find PI
-    PI_calc = (PS - a) / ((PS + a) / 2)
-
-    # Now check whether the PS & a dependant metrics are consistent between calculated and extracted:
-    # Extracted values with default as None if not present
-    Sovera_extracted = df.loc[df['Word'] == 'DV-S/a', 'Value'].values[0]
-    aoverS_extracted = df.loc[df['Word'] == 'DV-a/S', 'Value'].values[0]
-    TAmax_extracted = df.loc[df['Word'] == 'DV-TAmax', 'Value'].values[0]
-    PI_extracted = df.loc[df['Word'] == 'DV-PI', 'Value'].values[0]
-    comparison_dataframe = pd.DataFrame(index=['PS_extracted', 'a_extracted', 'Sovera_extracted', 'TAmax_extracted', 'PI_extracted',
-                                               'Sovera_calc', 'PI_calc', 'TAmax_calc', 'PS_calc', 'a_calc', 'a_from_Sovera', 'a_from_PI',
-                                               'Sovera_from_a_from_PI', 'PI_from_a_from_Sovera', 'TAmax_from_a_from_Sovera', 'TAmax_from_a_from_PI',
-                                               'PS_from_Sovera', 'PS_from_PI', 'Sovera_from_PS_from_PI', 'PI_from_PS_from_Sovera', 'TAmax_from_PS_from_Sovera',
-                                               'TAmax_from_PS_from_PI'], columns=['Extracted'])
-    # List of all the extracted metrics that exist
-    existing_metrics = [metric for metric in [Sovera_extracted, PI_extracted, TAmax_extracted] if metric is not None]
-    values_to_insert = {
-        'PS_extracted': PS,
-        'a_extracted': a,
-        'Sovera_extracted': Sovera_extracted,
-        'PI_extracted': PI_extracted,
-        'TAmax_extracted': TAmax_extracted
-    }
-
-    for key, value in values_to_insert.items():
-        comparison_dataframe.loc[key, 'Extracted'] = value
-        # Check closeness and store conditions met in a list
-
-    values_to_insert = {
-        'Sovera_calc': Sovera_calc,
-        'PI_calc': PI_calc,
-        'TAmax_calc': TAmax_calc
-    }
-    for key, value in values_to_insert.items():
-        comparison_dataframe.loc[key, 'First_calc'] = value
-        # Check closeness and store conditions met in a list
-
-    def metric_comparison(c_df, col):
-
-        # Tolerance level (you can adjust this based on your requirements)
-        tolerance1 = 0.2
-        tolerance2 = 2  # This tolerance is larger because the equation we used for TAmax is approximate
-        local_conditions_met = []
-        for parameter, extracted_name in [('Sovera', 'Sovera_extracted'), ('PI', 'PI_extracted'), ('TAmax', 'TAmax_extracted')]:
-            extracted_value = c_df['Extracted'][extracted_name]
-
-            if extracted_value is not None:
-                for local_row_name, calc_value in c_df.iloc[:, col].items():
-                    if str(local_row_name).startswith(extracted_name[:-9]) and np.isnan(calc_value) != True:  # If row name starts with the parameter name
-                        tolerance = tolerance1 if parameter != 'TAmax' else tolerance2
-                        if abs(calc_value - extracted_value) < tolerance:
-                            local_conditions_met.append(local_row_name)
-                            break  # Exit the inner loop once a match is found
-
-        return local_conditions_met
+    def correct_from_PS_a(PS, a):
+        # Find S/D
+        correct('S/a', round(PS / a, 2))
+        # Find PI
+        correct('PI', round((PS - a) / ((PS + a) / 2), 2))
+        # Find TAmax
+        correct('TAmax', round((PS + (2 * a)) / 3, 2))
 
     try:
-        conditions_met = metric_comparison(comparison_dataframe, 1)
-        print("ok")
-    except:
-        conditions_met = None
-        traceback.print_exc()
-
-    # You've already extracted PS, Sovera_extracted, RI_extracted, and TAmax_extracted
-
-    # Check if all 3 metrics are inconsistent
-    if len(conditions_met) == 0:  # All 3 are not consistent
-        # Assume PS was extracted correctly, compute a from the 3 metrics:
+        # Sense check some values:
+        correct('PI', check_pi_value(metrics['PI']))
+        correct('TAmax', check_TAmax_value(metrics['TAmax']))
+
+        # Peak systolic and end diastolic
+        PS, ED = check_PS_ED_values(metrics['S'], metrics['D'])  # sense check for pressures
+        ED = check_S_D_value(ED)
+        correct('S', PS)
+        correct('D', ED)
+        a = metrics['a']
+
+        # Now check whether the PS & a dependant metrics are consistent between calculated and extracted
+        extracted = {'Sovera': metrics['S/a'], 'PI': metrics['PI'], 'TAmax': metrics['TAmax']}
+        first_calc = _hypothesis_values({
+            'Sovera_calc': PS / a,
+            'PI_calc': (PS - a) / ((PS + a) / 2),
+            'TAmax_calc': (PS + (2 * a)) / 3,
+            'aoverS_calc': a / PS,
+        })
         try:
-            # Recalculate a using extracted metrics and assumed correct PS
-            a_from_Sovera = PS / Sovera_extracted if Sovera_extracted else None
-            a_from_PI = PS * (1 - PI_extracted) if PI_extracted else None
-            # Now, using these new a values, recalculate the metrics
-            Sovera_from_a_from_PI = PS / a_from_PI if a_from_PI else None
-            PI_from_a_from_Sovera = (PS - a_from_Sovera) / ((PS + a_from_Sovera) / 2) if a_from_Sovera else None
-            TAmax_from_a_from_Sovera = (PS + (2 * a_from_Sovera)) / 3 if a_from_Sovera else None
-            TAmax_from_a_from_PI = (PS + (2 * a_from_PI)) / 3 if a_from_PI else None
-
-            values_to_insert = {
-                'a_from_Sovera': a_from_Sovera,
-                'a_from_PI': a_from_PI,
-                'Sovera_from_a_from_PI': Sovera_from_a_from_PI,
-                'PI_from_a_from_Sovera': PI_from_a_from_Sovera,
-                'TAmax_from_a_from_Sovera': TAmax_from_a_from_Sovera,
-                'TAmax_from_a_from_PI': TAmax_from_a_from_PI
-            }
-            for key, value in values_to_insert.items():
-                comparison_dataframe.loc[key, 'Second_calc'] = value
-                # Check closeness and store conditions met in a list
-
-            # Check conditions met with these values:
-            conditions_met = metric_comparison(comparison_dataframe, 2)
-            if len(conditions_met) == 0:  # If our assumption above was wrong
-                # Recalculate PS using the extracted metrics and assumed correct a
-                PS_from_Sovera = Sovera_extracted * a if Sovera_extracted else None
-                PS_from_PI = ((3 * PI_extracted) - (2 * a)) if PI_extracted else None
-                # Now, using these new PS values, recalculate the other metrics
-                Sovera_from_PS_from_PI = PS_from_PI / a if PS_from_PI else None
-                PI_from_PS_from_Sovera = (PS_from_Sovera - a) / ((PS_from_Sovera + a) / 2) if PS_from_Sovera else None
-                TAmax_from_PS_from_Sovera = (PS_from_Sovera + (2 * a)) / 3 if PS_from_Sovera else None
-                TAmax_from_PS_from_PI = (PS_from_PI + (2 * a)) / 3 if PS_from_PI else None
-
-                values_to_insert = {
-                    'PS_from_Sovera': PS_from_Sovera,
-                    'PS_from_PI': PS_from_PI,
-                    'Sovera_from_PS_from_PI': Sovera_from_PS_from_PI,
-                    'PI_from_PS_from_Sovera': PI_from_PS_from_Sovera,
-                    'TAmax_from_PS_from_Sovera': TAmax_from_PS_from_Sovera,
-                    'TAmax_from_PS_from_PI': TAmax_from_PS_from_PI
-                }
-                for key, value in values_to_insert.items():
-                    comparison_dataframe.loc[key, 'Third_calc'] = value
-                    # Check closeness and store conditions met in a list
-
-                conditions_met = metric_comparison(comparison_dataframe, 3)
-                # now check the conditions again:
-                if len(conditions_met) > 0:
-                    row_name = conditions_met[0]
-
-                    parts = row_name.split('_from_')
-                    desired_row_name = parts[1] + '_from_' + parts[2]
-                    new_value = comparison_dataframe.loc[desired_row_name, 'Third_calc']
+            conditions_met = _consistent_hypotheses(extracted, first_calc, METRIC_CHECK_DV_TOLERANCES)
+            print("ok")
+        except:
+            conditions_met = None
+            traceback.print_exc()
+
+        # Check if all 3 metrics are inconsistent
+        if len(conditions_met) == 0:  # All 3 are not consistent
+            # Assume PS was extracted correctly, compute a from the 3 metrics:
+            Sovera_extracted = extracted['Sovera']
+            PI_extracted = extracted['PI']
+            try:
+                # Recalculate a using extracted metrics and assumed correct PS
+                a_from_Sovera = PS / Sovera_extracted if Sovera_extracted else None
+                a_from_PI = PS * (1 - PI_extracted) if PI_extracted else None
+                # Now, using these new a values, recalculate the metrics
+                second_calc = _hypothesis_values({
+                    'a_from_Sovera': a_from_Sovera,
+                    'a_from_PI': a_from_PI,
+                    'Sovera_from_a_from_PI': PS / a_from_PI if a_from_PI else None,
+                    'PI_from_a_from_Sovera': (
+                        (PS - a_from_Sovera) / ((PS + a_from_Sovera) / 2) if a_from_Sovera else None
+                    ),
+                    'TAmax_from_a_from_Sovera': (PS + (2 * a_from_Sovera)) / 3 if a_from_Sovera else None,
+                    'TAmax_from_a_from_PI': (PS + (2 * a_from_PI)) / 3 if a_from_PI else None,
+                })
+                conditions_met = _consistent_hypotheses(extracted, second_calc, METRIC_CHECK_DV_TOLERANCES)
+
+                if len(conditions_met) == 0:  # If our assumption above was wrong
+                    # Recalculate PS using the extracted metrics and assumed correct a
+                    PS_from_Sovera = Sovera_extracted * a if Sovera_extracted else None
+                    PS_from_PI = ((3 * PI_extracted) - (2 * a)) if PI_extracted else None
+                    # Now, using these new PS values, recalculate the other metrics
+                    third_calc = _hypothesis_values({
+                        'PS_from_Sovera': PS_from_Sovera,
+                        'PS_from_PI': PS_from_PI,
+                        'Sovera_from_PS_from_PI': PS_from_PI / a if PS_from_PI else None,
+                        'PI_from_PS_from_Sovera': (
+                            (PS_from_Sovera - a) / ((PS_from_Sovera + a) / 2) if PS_from_Sovera else None
+                        ),
+                        'TAmax_from_PS_from_Sovera': (PS_from_Sovera + (2 * a)) / 3 if PS_from_Sovera else None,
+                        'TAmax_from_PS_from_PI': (PS_from_PI + (2 * a)) / 3 if PS_from_PI else None,
+                    })
+                    conditions_met = _consistent_hypotheses(extracted, third_calc, METRIC_CHECK_DV_TOLERANCES)
+                    # now check the conditions again:
+                    if len(conditions_met) > 0:
+                        # The value the first consistent metric was derived from, e.g. PS_from_PI
+                        new_value = third_calc[conditions_met[0].split('_from_', 1)[1]]
+                        # We have calculated the new PS!
+                        print(f"Recalculated PS (from PI): {new_value}")
+                        PS = new_value
+                        correct('S', PS)
+                        correct_from_PS_a(PS, a)
+
+                elif len(conditions_met) > 0:
+                    new_value = second_calc[conditions_met[0].split('_from_', 1)[1]]
                     # We have calculated the new PS!
                     print(f"Recalculated PS (from PI): {new_value}")
-                    df.loc[df['Word'] == 'DV-S', 'Value'] = new_value
-                    PS = df.loc[df['Word'] == 'DV-S', 'Value'].values[0]
-                    a = df.loc[df['Word'] == 'DV-a', 'Value'].values[0]
-                    # Find S/D
-                    df.loc[df['Word'] == 'DV-S/a', 'Value'] = round(PS / a, 2)
-                    # Find PI
-                    df.loc[df['Word'] == 'DV-PI', 'Value'] = round((PS - a) / ((PS + a) / 2), 2)
-                    # Find TAmax
-                    df.loc[df['Word'] == 'DV-TAmax', 'Value'] = round((PS + (2 * a)) / 3, 2)
-
-            elif len(conditions_met) > 0:
-
-                row_name = conditions_met[0]
-
-                parts = row_name.split('_from_')
-                desired_row_name = parts[1] + '_from_' + parts[2]
-                new_value = comparison_dataframe.loc[desired_row_name, 'Second_calc']
-                # We have calculated the new PS!
-                print(f"Recalculated PS (from PI): {new_value}")
-                df.loc[df['Word'] == 'DV-a', 'Value'] = round(new_value, 2)
-                PS = df.loc[df['Word'] == 'DV-S', 'Value'].values[0]
-                a = df.loc[df['Word'] == 'DV-a', 'Value'].values[0]
-                # Find S/D
-                df.loc[df['Word'] == 'DV-S/a', 'Value'] = round(PS / a, 2)
+                    a = round(new_value, 2)
+                    correct('a', a)
+                    correct_from_PS_a(PS, a)
+
+            except ZeroDivisionError:
+                print("Error: Division by zero encountered. Check the extracted values.")
+        elif len(conditions_met) < 3:
+            # At least 1 of the metrics is consistent, therefore PS and a can be assumed to be correct,
+            # Calculate the inconsistent metrics from the PS and a calculations
+            print("At least one text extraction error, correcting...")
+
+            if 'Sovera' not in conditions_met:
+                # Find S/a
+                correct('S/a', round(PS / a, 2))
+                correct('a/S', round(a / PS, 2))
+            if 'PI' not in conditions_met:
                 # Find PI
-                df.loc[df['Word'] == 'DV-PI', 'Value'] = round((PS - a) / ((PS + a) / 2), 2)
+                correct('PI', round((PS - a) / ((PS + a) / 2), 2))
+            if 'TAmax' not in conditions_met:
                 # Find TAmax
-                df.loc[df['Word'] == 'DV-TAmax', 'Value'] = round((PS + (2 * a)) / 3, 2)
-
-        except ZeroDivisionError:
-            print("Error: Division by zero encountered. Check the extracted values.")
-    elif len(conditions_met) < 3:
-        # At least 1 of the metrics is consistent, therefore PS and a can be assumed to be correct,
-        # Calculate the inconsistent metrics from the PS and a calculations
-        print("At least one text extraction error, correcting...")
-
-        if 'Sovera' not in conditions_met:
-            # Find S/a
-            df.loc[df['Word'] == 'DV-S/a', 'Value'] = round(PS / a, 2)
-            df.loc[df['Word'] == 'DV-a/S', 'Value'] = round(a / PS, 2)
-        if 'PI' not in conditions_met:
-            # Find PI
-            df.loc[df['Word'] == 'DV-PI', 'Value'] = round((PS - a) / ((PS + a) / 2), 2)
-        if 'TAmax' not in conditions_met:
-            # Find TAmax
-            df.loc[df['Word'] == 'DV-TAmax', 'Value'] = round((PS + (2 * a)) / 3, 2)
-    else:
-        print("All metrics are consistent.")
+                correct('TAmax', round((PS + (2 * a)) / 3, 2))
+        else:
+            print("All metrics are consistent.")
+    finally:
+        # The corrections made before any error are kept, as the records are corrected in place
+        for name, value in corrections.items():
+            records.set_value(name, value)
+        if is_dataframe and records is source:
+            _set_dataframe_values(df, corrections)
 
-    return df
+    return _checked_table(df, source, records)
+
+
+def metric_check_batch(tables):
+    """Performs the metric check of the text data of many images.
+
+    Each table is checked as text_from_greyscale checks its records: with metric_check_dv,
+    after swapping the DV values that are commonly read from each other's lines, if most of
+    its words have the "DV" prefix, and with metric_check otherwise. A table whose check fails
+    is returned as the failure left it, with the corrections made before the failure unless
+    metrics were missing, since they are then added to a copy.
+
+    Args:
+        tables (list) : The text data of each image, as DataFrames or TextRecords. The
+            TextRecords are corrected in place.
+
+    Returns:
+        **checked** (list) : The corrected text data of each image, of the same type as its
+            table. A DataFrame is returned as a new DataFrame of its records.
+    """
+    checked = []
+    for table in tables:
+        is_dataframe = isinstance(table, pd.DataFrame)
+        records = TextRecords.from_dataframe(table) if is_dataframe else table
+        words = records.words()
+        prefix_counts = {prefix: sum(1 for word in words if prefix in str(word)) for prefix in TARGET_PREFIXES}
+        try:
+            if max(prefix_counts, key=prefix_counts.get) == "DV":
+                _swap_dv_values(records)
+                records = metric_check_dv(records)
+            else:
+                records = metric_check(records)
+        except Exception:
+            logger.warning("Metric check failed", exc_info=True)
+        checked.append(records.to_dataframe() if is_dataframe else records)
+    return checked
@@ -0,0 +1,145 @@
+"""Per-image store of derived images shared between the segmentation stages.
+
+Several stages of the segmentation convert the same scan to greyscale or HSV, or
+threshold it at the same level. An ImageContext is created once per scan and computes
+each of these derived images at most once, the first time a stage asks for it.
+
+**Usage:**
+
+.. code-block:: python
+
+   import cv2
+   from usseg.image_context import ImageContext
+
+   context = ImageContext(cv2.imread("Path/to/a/ultrasound/image.JPG"))
+   context.gray  # Computed on first access
+   context.threshold(127)  # Binary threshold, memoized per level
+
+The memoized images are shared, so they are returned read-only. Stages that need to
+modify an image must take a copy first.
+"""
+# Module imports
+import cv2
+import numpy as np
+
+
+# cv2 read modes that decode at a fraction of the full resolution. JPEGs are scaled while
+# they are decoded, which is much faster than decoding at full resolution.
+REDUCED_READ_MODES = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _read_only(array):
+    """Marks an array as read-only and returns it."""
+    array.flags.writeable = False
+    return array
+
+
+class ImageContext:
+    """Lazily computes and memoizes the derived versions of a single image.
+
+    Args:
+        bgr_image (ndarray) : The image as a (height, width, 3) uint8 array in BGR order,
+            as returned by cv2.imread. A fourth (alpha) channel is ignored.
+    """
+
+    def __init__(self, bgr_image):
+        self._bgr = _read_only(np.asarray(bgr_image)[..., :3])
+        self._gray = None
+        self._hsv = None
+        self._thresholds = {}
+
+    @classmethod
+    def from_file(cls, filename, reduce_factor=1):
+        """Creates a context by decoding an image file with cv2.
+
+        Args:
+            filename (str) : Path to the image file.
+            reduce_factor (int, optional) : Decodes the image at 1/reduce_factor of its
+                resolution, one of the keys of REDUCED_READ_MODES. Defaults to 1.
+
+        Returns:
+            **context** (ImageContext) : The context of the decoded image.
+        """
+        bgr_image = cv2.imread(filename, REDUCED_READ_MODES[reduce_factor])
+        if bgr_image is None:
+            raise ValueError(f"Could not read image {filename}")
+        return cls(bgr_image)
+
+    @classmethod
+    def from_rgb(cls, rgb_image):
+        """Creates a context from an image in RGB order.
+
+        Args:
+            rgb_image (ndarray or PIL.Image.Image) : The image in RGB (or RGBA) order.
+
+        Returns:
+            **context** (ImageContext) : The context of the image.
+        """
+        return cls(np.asarray(rgb_image)[..., 2::-1])
+
+    @classmethod
+    def wrap(cls, image):
+        """Returns image if it is already a context, else creates a context of the BGR image.
+
+        Args:
+            image (ImageContext or ndarray) : A context, or an image in BGR order.
+
+        Returns:
+            **context** (ImageContext) : The context of the image.
+        """
+        if isinstance(image, cls):
+            return image
+        return cls(image)
+
+    @property
+    def shape(self):
+        """tuple : The (height, width, 3) shape of the image."""
+        return self._bgr.shape
+
+    @property
+    def bgr(self):
+        """ndarray : The image in BGR order."""
+        return self._bgr
+
+    @property
+    def rgb(self):
+        """ndarray : A view of the image in RGB order."""
+        return self._bgr[..., ::-1]
+
+    @property
+    def gray(self):
+        """ndarray : The greyscale image."""
+        if self._gray is None:
+            self._gray = _read_only(cv2.cvtColor(self._bgr, cv2.COLOR_BGR2GRAY))
+        return self._gray
+
+    @property
+    def hsv(self):
+        """ndarray : The image in HSV colour space."""
+        if self._hsv is None:
+            self._hsv = _read_only(cv2.cvtColor(self._bgr, cv2.COLOR_BGR2HSV))
+        return self._hsv
+
+    def threshold(self, level, max_value=255, threshold_type=cv2.THRESH_BINARY):
+        """Returns the greyscale image thresholded at a given level.
+
+        Args:
+            level (float) : The threshold level, as passed to cv2.threshold.
+            max_value (float, optional) : The value given to pixels above the threshold.
+                Defaults to 255.
+            threshold_type (int, optional) : The cv2 threshold type.
+                Defaults to cv2.THRESH_BINARY.
+
+        Returns:
+            **thresholded_image** (ndarray) : The thresholded greyscale image.
+        """
+        key = (float(level), float(max_value), threshold_type)
+        if key not in self._thresholds:
+            ret, thresholded_image = cv2.threshold(self.gray, key[0], key[1], threshold_type)
+            self._thresholds[key] = _read_only(thresholded_image)
+        return self._thresholds[key]
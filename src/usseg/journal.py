@@ -0,0 +1,160 @@
+"""Append-only journal of the images segmented in a run.
+
+Each finished image is appended to the journal as a single json line, holding its outputs and
+the stages that failed, and is flushed to disk straight away. If a long run is interrupted,
+the journal is read back on the next run and the images that were already finished are
+skipped, so only the remaining images are segmented.
+
+**Usage:**
+
+.. code-block:: python
+
+   from usseg import segment
+
+   # Records each image as it finishes, and skips the images recorded by a previous run
+   segment(filenames, journal_path="segment_journal.jsonl", resume=True)
+
+A record that was only partly written when a run was interrupted is ignored, so that image
+is segmented again.
+
+A resumed run compacts the journal to the last record of each image, so it grows with the
+number of images rather than the number of runs. To start afresh, e.g. for another dataset,
+delete the journal or give the run another journal path.
+"""
+# Python imports
+import base64
+import json
+import logging
+import os
+import pickle
+
+# Module imports
+import numpy as np
+
+logger = logging.getLogger(__file__)
+
+
+def _encode_record(record):
+    """Returns the json line of a record.
+
+    The text data is pickled, as in the segmented data pickle, so that the DataFrame is read
+    back with the same values and dtypes.
+    """
+    record = dict(record)
+    if record.get("text_data") is not None:
+        record["text_data"] = base64.b64encode(pickle.dumps(record["text_data"])).decode("ascii")
+    if record.get("waveform") is not None:
+        record["waveform"] = np.asarray(record["waveform"]).tolist()
+    return json.dumps(record)
+
+
+def _decode_record(line):
+    """Returns the record of a json line, with its text data as a DataFrame."""
+    record = json.loads(line)
+    if record.get("text_data") is not None:
+        record["text_data"] = pickle.loads(base64.b64decode(record["text_data"]))
+    if record.get("waveform") is not None:
+        record["waveform"] = np.array(record["waveform"], dtype=np.float32)
+    return record
+
+
+class SegmentationJournal:
+    """Append-only journal of per-image segmentation results.
+
+    Args:
+        path (str) : Path to the journal file. It is created if it does not exist, and
+            appended to if it does.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def load(self):
+        """Reads the records of the journal.
+
+        Returns:
+            **records** (dict) : The last record of each image, by filename. Each record is a
+                dictionary of the fields of a SegmentationResult.
+        """
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = _decode_record(line)
+                except (ValueError, pickle.UnpicklingError, EOFError):
+                    # Left by an interrupted write, so the image is segmented again
+                    logger.warning(f"Ignoring incomplete record on line {line_number} of {self.path}")
+                    continue
+                records[record["filename"]] = record
+
+        return records
+
+    def compact(self, records=None):
+        """Rewrites the journal with only the last complete record of each image.
+
+        The journal is written to a temporary file first and then replaces the old one, so an
+        interrupted compaction leaves the old journal in place.
+
+        Args:
+            records (dict, optional) : The records to keep, as returned by load. Defaults to
+                None, which loads them.
+        """
+        if records is None:
+            records = self.load()
+        if not os.path.exists(self.path):
+            return
+
+        self.close()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as f:
+            for record in records.values():
+                f.write(_encode_record(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+
+    def append(self, result):
+        """Appends the result of an image to the journal and flushes it to disk.
+
+        Args:
+            result (SegmentationResult) : The result of the image.
+        """
+        if self._file is None:
+            self._open()
+        self._file.write(_encode_record(vars(result)) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _open(self):
+        """Opens the journal for appending, ending a partly written last line first."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        ends_mid_line = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                ends_mid_line = f.read(1) != b"\n"
+
+        self._file = open(self.path, "a")
+        if ends_mid_line:
+            self._file.write("\n")
+
+    def close(self):
+        """Closes the journal file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
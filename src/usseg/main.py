@@ -21,7 +21,27 @@ This will generate an output.html file in the current directory containing the s
 
 The script can be configured using the `config.toml` file. The `config.toml` file should be placed in the same directory as the script.
 
-The only configuration option currently supported is the `root_dir` key. The `root_dir` key specifies the root directory containing the ultrasound images to be segmented.
+The `root_dir` key specifies the root directory containing the ultrasound images to be segmented.
+The `n_workers` key sets the number of worker processes used to segment the images.
+Setting the `batched_threshold_sweep` key to true reads the labels of the axes of each image with
+a few batched OCR calls, in place of one call per threshold.
+The `journal` key of the `[pickle]` table sets the journal each segmented image is recorded in,
+and setting the `resume` key to true skips the images recorded by an interrupted run, compacting
+the journal to the last record of each image. The images whose outputs failed to be written are
+segmented again, and setting the `retry_failed` key to true retries every image with a failed
+stage. Delete the journal to start afresh, e.g. for another dataset.
+The `manifest` key of the `[pickle]` table keeps the classification of each image between runs,
+so only new or changed images are classified.
+A `[prefilter]` table rejects images that are clearly not doppler scans before OCR, with any
+thresholds given in the table overriding the defaults.
+The `result_store` key of the `[pickle]` table sets the directory of the columnar result store
+the segmented images are appended to, in place of the `segmented_data` pickle.
+With a result store, a `[report]` table writes a paginated report of linked thumbnails in
+place of the single output.html, with the number of scans on each page set by `page_size`.
+The `[output]` table sets the PNG compression and the size of the annotated and digitized images,
+and with its `artifacts` key, which scans get them. The images that are skipped can be rendered
+later with `python -m usseg.render <output_dir>`.
+The `backend` key of the `[ocr]` table selects the OCR backend, see `usseg.ocr`.
 
 **Known issues and limitations:**
 
@@ -63,24 +83,95 @@ def prof(fn, *args, **kwargs):
     return rtn_val
 
 
-def main(root_dir):
-    """Main function that performs all of the segmentation on a root directory"""
+def main(
+    root_dir,
+    n_workers=1,
+    journal_path=False,
+    resume=False,
+    manifest_path=False,
+    prefilter=False,
+    writer_options=None,
+    store_path=False,
+    report_options=None,
+    batched_threshold_sweep=False,
+    retry_failed=False,
+):
+    """Main function that performs all of the segmentation on a root directory
+
+    Args:
+        root_dir (str) : The root directory containing the ultrasound images to be segmented.
+        n_workers (int, optional) : The number of worker processes used to segment the images.
+            Defaults to 1.
+        journal_path (str or bool, optional) : Path to the journal of segmented images, or
+            False to keep no journal. Defaults to False.
+        resume (bool, optional) : If True, skips the images already recorded in the journal.
+            Defaults to False.
+        retry_failed (bool, optional) : If True, the images recorded in the journal with any
+            failed stage are segmented again when resuming, and otherwise only those whose
+            outputs failed to be written. Defaults to False.
+        manifest_path (str or bool, optional) : Path to the manifest of previously classified
+            images, so only new or changed images are classified, or False to classify every
+            image. Defaults to False.
+        prefilter (bool or dict, optional) : Whether to reject images that are clearly not
+            doppler scans before OCR, or the prefilter thresholds to use, see
+            usseg.organise_files.prefilter_file. Defaults to False.
+        writer_options (dict, optional) : Options of the writer of the annotated and digitized
+            images, see usseg.output_writer.OutputWriter. Defaults to None.
+        store_path (str or bool, optional) : Path to the result store the segmented images
+            are appended to, in place of the segmented data pickle, or False to write the
+            pickle. Defaults to False.
+        report_options (dict, optional) : Options of the paginated report of the result
+            store, see usseg.visualisation_html.generate_report_from_store, or None to write a
+            single html file. Defaults to None.
+        batched_threshold_sweep (bool, optional) : If True, the labels of the axes are read
+            with a few batched OCR calls in place of one call per threshold. Defaults to False.
+    """
 
     # Checks and sets up the tesseract environment
     usseg.setup_tesseract()
 
     # Gets a list of likely ultrasound images from root dir and saves them to a pickle file.
-    filenames = prof(usseg.get_likely_us, root_dir)
+    filenames = prof(usseg.get_likely_us, root_dir, manifest_path=manifest_path, prefilter=prefilter)
 
     # Segments and digitises the pre-selected ultrasound images.
     # filenames = "Path/to/a/single/test/file.JPG"
-    prof(usseg.segment, filenames)
+    prof(
+        usseg.segment,
+        filenames,
+        n_workers=n_workers,
+        journal_path=journal_path,
+        resume=resume,
+        writer_options=writer_options,
+        pickle_path=False if store_path else None,
+        store_path=store_path,
+        batched_threshold_sweep=batched_threshold_sweep,
+        retry_failed=retry_failed,
+    )
 
     # Generates an output.html of the segmented output
-    prof(usseg.generate_html_from_pkl)
+    if store_path and report_options is not None:
+        prof(usseg.generate_report_from_store, store_path, **report_options)
+    elif store_path:
+        prof(usseg.generate_html_from_store, store_path)
+    else:
+        prof(usseg.generate_html_from_pkl)
 
 
 if __name__ == "__main__":
-    config_root_dir = toml.load("config.toml")["root_dir"]
+    config = toml.load("config.toml")
+    usseg.ocr.configure(config)  # Sets the OCR backend from the [ocr] table, if any
+    config_root_dir = config["root_dir"]
     # root_dir = "Path/to/a/folder/of/images"
-    main(config_root_dir)
+    main(
+        config_root_dir,
+        n_workers=config.get("n_workers", 1),
+        journal_path=config["pickle"].get("journal", False),
+        resume=config.get("resume", False),
+        manifest_path=config["pickle"].get("manifest", False),
+        prefilter=config.get("prefilter", False),
+        writer_options=config.get("output"),
+        store_path=config["pickle"].get("result_store", False),
+        report_options=config.get("report"),
+        batched_threshold_sweep=config.get("batched_threshold_sweep", False),
+        retry_failed=config.get("retry_failed", False),
+    )
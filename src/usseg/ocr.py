@@ -0,0 +1,446 @@
+"""Pluggable OCR backends used by the segmentation stages.
+
+All of the OCR in usseg goes through the functions :func:`image_to_data` and
+:func:`image_to_string` of this module, which forward to the active backend:
+
+* ``"pytesseract"`` (default) runs the tesseract executable through pytesseract. Each call
+  starts a new tesseract process, which writes the image to a temporary file and loads the
+  traineddata again.
+* ``"tesserocr"`` keeps a tesseract engine resident in the process through the tesserocr
+  bindings to the tesseract C API. An engine is initialised once per thread for each
+  distinct configuration and is then reused, with images passed in memory.
+
+Both backends take the same pytesseract style config strings (``--psm``, ``--oem``,
+``-c name=value`` and trailing config files), and return the same dictionary layout for
+:func:`image_to_data`.
+
+The results are cached by a hash of the exact image bytes, the config string, the language
+and the backend, so the same pixels are only read once. The cache has an in-memory LRU tier
+and an optional on-disk tier, which is shared between processes and between runs.
+
+**Usage:**
+
+.. code-block:: python
+
+   from usseg import ocr
+
+   ocr.set_backend("tesserocr")
+   data = ocr.image_to_data(image, config="--psm 11 -c tessedit_char_whitelist=0123456789")
+
+The backend can also be set in the `config.toml` file:
+
+.. code-block:: toml
+
+   [ocr]
+   backend = "tesserocr"
+   cache_size = 4096  # In-memory entries, 0 disables the in-memory tier
+   cache_dir = "ocr_cache"  # Enables the on-disk tier
+"""
+# Python imports
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import shlex
+import tempfile
+import threading
+
+# Module imports
+import numpy as np
+from PIL import Image
+import pytesseract
+from pytesseract.pytesseract import file_to_dict
+
+logger = logging.getLogger(__file__)
+
+# Header of the tsv output of the tesseract executable, which the C API does not include.
+TSV_HEADER = "\t".join([
+    "level", "page_num", "block_num", "par_num", "line_num", "word_num",
+    "left", "top", "width", "height", "conf", "text",
+])
+
+
+def parse_config(config):
+    """Splits a tesseract command line config string into its parts.
+
+    Args:
+        config (str) : A config string as passed to pytesseract,
+            e.g. "--oem 1 --psm 3 -c tessedit_char_blacklist=l,!_|=$".
+
+    Returns:
+        (tuple): tuple containing:
+            - **psm** (int) : The page segmentation mode, or None if not given.
+            - **oem** (int) : The OCR engine mode, or None if not given.
+            - **variables** (dict) : The variables set with -c, by name.
+            - **configs** (list) : The config files named after the options.
+    """
+    psm = None
+    oem = None
+    variables = {}
+    configs = []
+
+    tokens = shlex.split(config or "", posix=False)
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ("--psm", "--oem", "-c") and i + 1 < len(tokens):
+            value = tokens[i + 1]
+            if token == "--psm":
+                psm = int(value)
+            elif token == "--oem":
+                oem = int(value)
+            else:
+                name, _, setting = value.partition("=")
+                variables[name] = setting
+            i += 2
+            continue
+        if token.startswith("-c") and "=" in token:
+            name, _, setting = token[2:].partition("=")
+            variables[name] = setting
+        elif token != "configfile":  # Label used before a config file path
+            configs.append(token)
+        i += 1
+
+    return psm, oem, variables, configs
+
+
+def _to_pil(image):
+    """Converts an image to a PIL image in the same way pytesseract does."""
+    if isinstance(image, Image.Image):
+        return image
+    return Image.fromarray(np.asarray(image))
+
+
+class PytesseractBackend:
+    """Runs each OCR call as a tesseract process through pytesseract."""
+
+    name = "pytesseract"
+
+    def image_to_data(self, image, lang=None, config=""):
+        """Returns the word boxes of an image, see :func:`usseg.ocr.image_to_data`."""
+        return pytesseract.image_to_data(
+            image, lang=lang, config=config, output_type=pytesseract.Output.DICT
+        )
+
+    def image_to_string(self, image, lang=None, config=""):
+        """Returns the text of an image, see :func:`usseg.ocr.image_to_string`."""
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+
+class TesserocrBackend:
+    """Runs OCR on tesseract engines that stay loaded in the process.
+
+    Args:
+        tessdata_path (str, optional) : Path to the tessdata directory. Defaults to None,
+            which uses the tesserocr default (the TESSDATA_PREFIX environment variable).
+
+    Raises:
+        ImportError : If tesserocr is not installed.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, tessdata_path=None):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self._tessdata_path = tessdata_path
+        self._local = threading.local()
+
+    def __reduce__(self):
+        """Pickles the backend by its options, so a worker process builds its own engines."""
+        return TesserocrBackend, (self._tessdata_path,)
+
+    def _api(self, lang, config):
+        """Returns the engine of this thread for a language and config, initialising it once."""
+        psm, oem, variables, configs = parse_config(config)
+        key = (lang, psm, oem, tuple(sorted(variables.items())), tuple(configs))
+
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+        if key not in apis:
+            kwargs = {"lang": lang or "eng", "configs": configs, "variables": variables}
+            if psm is not None:
+                kwargs["psm"] = psm
+            if oem is not None:
+                kwargs["oem"] = oem
+            if self._tessdata_path is not None:
+                kwargs["path"] = self._tessdata_path
+            logger.debug(f"Initialising tesseract engine for {key}")
+            apis[key] = self._tesserocr.PyTessBaseAPI(**kwargs)
+        return apis[key]
+
+    def image_to_data(self, image, lang=None, config=""):
+        """Returns the word boxes of an image, see :func:`usseg.ocr.image_to_data`."""
+        api = self._api(lang, config)
+        api.SetImage(_to_pil(image))
+        tsv = api.GetTSVText(0)
+        api.Clear()
+        return file_to_dict(f"{TSV_HEADER}\n{tsv}", "\t", -1)
+
+    def image_to_string(self, image, lang=None, config=""):
+        """Returns the text of an image, see :func:`usseg.ocr.image_to_string`."""
+        api = self._api(lang, config)
+        api.SetImage(_to_pil(image))
+        text = api.GetUTF8Text()
+        api.Clear()
+        return text
+
+
+class OCRCache:
+    """Content-addressed store of OCR results with an in-memory and an optional on-disk tier.
+
+    Args:
+        max_entries (int, optional) : The number of results kept in memory, least recently
+            used first out. 0 disables the in-memory tier. Defaults to 1024.
+        cache_dir (str, optional) : Directory of the on-disk tier, one json file per result.
+            Defaults to None, which disables the on-disk tier.
+    """
+
+    def __init__(self, max_entries=1024, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(kind, image, lang, config, backend_name):
+        """Returns the hash identifying an OCR call.
+
+        Args:
+            kind (str) : The OCR function, "data" or "string".
+            image (ndarray or PIL.Image.Image) : The image to read.
+            lang (str) : The tesseract language.
+            config (str) : The tesseract config string.
+            backend_name (str) : The name of the backend.
+
+        Returns:
+            **key** (str) : The hex digest of the call.
+        """
+        pixels = np.ascontiguousarray(np.asarray(image))
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(repr((kind, backend_name, lang, config, pixels.shape, pixels.dtype.str)).encode())
+        digest.update(pixels.data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        """Returns the path of a result in the on-disk tier."""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Returns a cached result, or None if it is not in either tier."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+
+        if self.cache_dir is not None:
+            try:
+                with open(self._path(key)) as f:
+                    value = json.load(f)["value"]
+            except (OSError, ValueError, KeyError):
+                pass
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Stores a result in both tiers."""
+        self._remember(key, value)
+        if self.cache_dir is not None:
+            # Written to a temporary file first, so other processes never read a partial file
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"value": value}, f)
+            os.replace(temp_path, path)
+
+    def _remember(self, key, value):
+        """Stores a result in the in-memory tier, evicting the least recently used."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the in-memory tier and resets the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    def add_stats(self, memory_hits=0, disk_hits=0, misses=0):
+        """Adds hit and miss counts to the statistics, e.g. those of the cache of a worker process."""
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += misses
+
+    def stats(self):
+        """Returns the hit and miss counts of the cache.
+
+        Returns:
+            **stats** (dict) : The memory_hits, disk_hits, misses, hit_rate and the number of
+                entries in memory.
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+BACKENDS = {
+    PytesseractBackend.name: PytesseractBackend,
+    TesserocrBackend.name: TesserocrBackend,
+}
+
+_backend = PytesseractBackend()
+_cache = OCRCache()
+
+
+def set_backend(backend, **kwargs):
+    """Sets the backend used for all subsequent OCR calls.
+
+    Args:
+        backend (str or object) : The name of a backend in BACKENDS, or a backend object with
+            image_to_data and image_to_string methods. The backend is pickled to the worker
+            processes of a parallel segmentation, so a backend object must be picklable.
+        **kwargs : Passed to the backend class when backend is a name.
+
+    Returns:
+        **backend** (object) : The backend that was set.
+    """
+    global _backend
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown OCR backend {backend}, expected one of {list(BACKENDS)}")
+        backend = BACKENDS[backend](**kwargs)
+    _backend = backend
+    return _backend
+
+
+def get_backend():
+    """Returns the backend used for OCR calls."""
+    return _backend
+
+
+def set_cache(cache):
+    """Sets the cache used for all subsequent OCR calls.
+
+    Args:
+        cache (OCRCache) : The cache, or None to disable caching.
+
+    Returns:
+        **cache** (OCRCache) : The cache that was set.
+    """
+    global _cache
+    _cache = cache
+    return _cache
+
+
+def get_cache():
+    """Returns the cache used for OCR calls, or None if caching is disabled."""
+    return _cache
+
+
+def log_cache_stats():
+    """Logs the hit and miss counts of the OCR cache.
+
+    The counts of worker processes are only included once they are added to the cache of this
+    process with OCRCache.add_stats, as usseg.segment_files does for its workers.
+    """
+    if _cache is not None:
+        logger.info(f"OCR cache: {_cache.stats()}")
+
+
+def configure(config):
+    """Sets the backend and the cache from the [ocr] table of a loaded config.toml.
+
+    Args:
+        config (dict) : The loaded config.toml. If it has no [ocr] table, nothing is changed.
+            The cache_size and cache_dir keys configure the cache, any other keys are passed
+            to the backend.
+
+    Returns:
+        **backend** (object) : The backend used for OCR calls.
+    """
+    ocr_config = dict(config.get("ocr", {}))
+    if "cache_size" in ocr_config or "cache_dir" in ocr_config:
+        set_cache(OCRCache(
+            max_entries=ocr_config.pop("cache_size", 1024),
+            cache_dir=ocr_config.pop("cache_dir", None),
+        ))
+    if "backend" in ocr_config:
+        return set_backend(ocr_config.pop("backend"), **ocr_config)
+    return _backend
+
+
+def _cached(kind, image, lang, config, read):
+    """Returns the cached result of an OCR call, calling read on a miss."""
+    if _cache is None:
+        return read()
+
+    backend_name = getattr(_backend, "name", type(_backend).__name__)
+    key = _cache.key(kind, image, lang, config, backend_name)
+    value = _cache.get(key)
+    if value is None:
+        value = read()
+        _cache.put(key, value)
+
+    # Callers may modify the lists of a result, so they get their own copy
+    if isinstance(value, dict):
+        return {column: list(values) for column, values in value.items()}
+    return value
+
+
+def image_to_data(image, lang=None, config=""):
+    """Finds the words in an image and their bounding boxes.
+
+    Args:
+        image (ndarray or PIL.Image.Image) : The image to read.
+        lang (str, optional) : The tesseract language. Defaults to None (english).
+        config (str, optional) : The tesseract config string. Defaults to "".
+
+    Returns:
+        **data** (dict) : The tesseract tsv output as lists by column name, as returned by
+            pytesseract.image_to_data with output_type=Output.DICT.
+    """
+    return _cached("data", image, lang, config,
+                   lambda: _backend.image_to_data(image, lang=lang, config=config))
+
+
+def image_to_string(image, lang=None, config=""):
+    """Reads the text of an image.
+
+    Args:
+        image (ndarray or PIL.Image.Image) : The image to read.
+        lang (str, optional) : The tesseract language. Defaults to None (english).
+        config (str, optional) : The tesseract config string. Defaults to "".
+
+    Returns:
+        **text** (str) : The text found in the image.
+    """
+    return _cached("string", image, lang, config,
+                   lambda: _backend.image_to_string(image, lang=lang, config=config))
@@ -1,51 +1,293 @@
 """Searches a directory and identifies images likely to be doppler ultrasounds"""
 # /usr/bin/env python3
 
+import functools
+import logging
 import os
 import pickle
 import re
 import toml
 import traceback
 
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
 
+import cv2
+import numpy as np
+
 from usseg import general_functions
+from usseg import ocr
+from usseg.image_context import REDUCED_READ_MODES
+
+logger = logging.getLogger(__file__)
+
+
+# Thresholds of the prefilter, chosen well clear of the values of doppler scans so only
+# files that are clearly not doppler scans are rejected without OCR.
+PREFILTER_THRESHOLDS = {
+    "reduce_factor": 4,  # Decodes at 1/2, 1/4 or 1/8 of the full resolution
+    "min_width": 320,  # Full resolution, in pixels
+    "min_height": 240,
+    "min_aspect_ratio": 0.8,  # Width / height
+    "max_aspect_ratio": 3.0,
+    "min_text_fraction": 0.002,  # Coloured text pixels in the upper band
+    "min_waveform_fraction": 0.01,  # Bright grey pixels in the lower band
+}
+PREFILTER_STAGES = ("dimensions", "text", "waveform")  # The stages of prefilter_file
+
+
+def prefilter_file(file_path, thresholds=None):
+    """Rejects files that are clearly not doppler scans using cheap image signals, without OCR.
+
+    The file is decoded at a reduced resolution, and the signals are checked in stages,
+    stopping at the first stage that rejects the file:
+
+    * "dimensions" : The full resolution size and aspect ratio of the image.
+    * "text" : The fraction of coloured text pixels in the upper band searched by
+      scan_type_test, using the same colour bounds.
+    * "waveform" : The fraction of bright grey pixels in the lower half, using the same
+      criteria as the initial segmentation of the waveform.
+
+    Args:
+        file_path: The path to the image file.
+        thresholds: A dictionary of thresholds overriding those in PREFILTER_THRESHOLDS.
+
+    Returns:
+        The name of the stage that rejected the file, or `None` if the file could be a doppler
+        scan (or could not be decoded), so it needs the full scan type test.
+    """
+    thresholds = {**PREFILTER_THRESHOLDS, **(thresholds or {})}
+    reduce_factor = thresholds["reduce_factor"]
+    img = cv2.imread(file_path, REDUCED_READ_MODES[reduce_factor])
+    if img is None:
+        return None
+
+    height, width = img.shape[:2]
+    full_width, full_height = width * reduce_factor, height * reduce_factor
+    aspect_ratio = width / height
+    if (
+        full_width < thresholds["min_width"]
+        or full_height < thresholds["min_height"]
+        or not thresholds["min_aspect_ratio"] <= aspect_ratio <= thresholds["max_aspect_ratio"]
+    ):
+        return "dimensions"
+
+    # The band above 45% of the width, as searched for text in scan_type_test
+    upper_band = cv2.cvtColor(img[: int(width * 0.45)], cv2.COLOR_BGR2HSV)
+    lower_yellow = np.array([1, 100, 100], dtype=np.uint8)  # Bounds of scan_type_test
+    upper_yellow = np.array([200, 255, 255], dtype=np.uint8)
+    text_fraction = cv2.countNonZero(cv2.inRange(upper_band, lower_yellow, upper_yellow)) / upper_band[..., 0].size
+    if text_fraction < thresholds["min_text_fraction"]:
+        return "text"
+
+    lower_band = img[height // 2:]
+    max_bgr = lower_band.max(axis=2)
+    bgr_range = max_bgr - lower_band.min(axis=2)
+    waveform_fraction = np.count_nonzero((bgr_range < 100) & (max_bgr > 120)) / max_bgr.size
+    if waveform_fraction < thresholds["min_waveform_fraction"]:
+        return "waveform"
+
+    return None
+
+
+def _classify_file(file_path, thresholds=None):
+    """Classifies a single file, raising any error of the scan type test.
+
+    Args:
+        file_path: The path to the file to be checked.
+        thresholds: The prefilter thresholds, or `None` to send every file to the scan type test.
+
+    Returns:
+        A tuple of (result, stage), where result is a tuple of (patient_id, file_path) if the
+        file is a likely ultrasound, or `None` otherwise, and stage is the name of the stage
+        that rejected the file, or `None` if it was accepted.
+    """
+    if not file_path.endswith('.JPG'):
+        return None, "extension"
 
+    if thresholds is not None:
+        stage = prefilter_file(file_path, thresholds)
+        if stage is not None:
+            return None, stage
 
-def check_file_for_us(file_path):
+    Fail, df = general_functions.scan_type_test(file_path)
+    if Fail != 0:
+        return None, "scan type test"
+
+    # Extract patient ID from the file path
+    match = re.search(r"\d{4}", file_path)
+    if not match:
+        return None, "patient id"
+    patient_id = match.group(0)
+    return (patient_id, file_path), None
+
+
+def _check_file(file_path, thresholds=None):
+    """Classifies a single file, as _classify_file, with the stage "error" if the check failed."""
+    try:
+        return _classify_file(file_path, thresholds)
+    except Exception:
+        traceback.print_exc()
+    return None, "error"
+
+
+def check_file_for_us(file_path, thresholds=None):
     """Checks a single file to see if it's a likely ultrasound and returns its path.
 
     Args:
         file_path: The path to the file to be checked.
+        thresholds: The prefilter thresholds, or `None` to send every file to the scan type test.
 
     Returns:
         A tuple of (patient_id, file_path) if the file is a likely ultrasound, or `None` otherwise.
     """
-    if file_path.endswith('.JPG'):
+    return _check_file(file_path, thresholds)[0]
+
+
+def _file_signature(file_path):
+    """Returns the (size, mtime) of a file, which change whenever the file is rewritten."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _prefilter_key(thresholds):
+    """Returns the full prefilter thresholds in use, or `None` if the prefilter is off."""
+    return None if thresholds is None else {**PREFILTER_THRESHOLDS, **thresholds}
+
+
+def _check_file_for_manifest(file_path, thresholds=None):
+    """Checks a single file, returning its manifest entry.
+
+    The entry keeps the prefilter thresholds in use, as a rejection by the prefilter only
+    holds for those thresholds. A failed check is not stored in the manifest, so the file is
+    checked again on the next run.
+    """
+    try:
+        signature = _file_signature(file_path)
+        result, stage = _classify_file(file_path, thresholds)
+        return {"signature": signature, "result": result, "stage": stage, "prefilter": _prefilter_key(thresholds)}
+    except Exception:
+        traceback.print_exc()
+    return {"signature": None, "result": None, "stage": "error"}
+
+
+def load_manifest(manifest_path):
+    """Loads the manifest of previously classified files.
+
+    Args:
+        manifest_path: The path to the manifest pickle file.
+
+    Returns:
+        A dictionary of manifest entries by file path, empty if there is no manifest yet.
+        Each entry has the "signature" (size, mtime) of the file when it was classified, the
+        "result" of check_file_for_us, the "stage" that rejected the file and the "prefilter"
+        thresholds it was classified with.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_manifest(manifest, manifest_path):
+    """Saves the manifest, replacing the previous one only once it is fully written.
+
+    Args:
+        manifest: A dictionary of manifest entries by file path, as returned by load_manifest.
+        manifest_path: The path to the manifest pickle file.
+    """
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump(manifest, f)
+    os.replace(temp_path, manifest_path)
+
+
+def _check_files(files, thresholds, use_parallel, check=_check_file):
+    """Runs check on each file, in a thread pool if use_parallel, keeping the order of files."""
+    check = functools.partial(check, thresholds=thresholds)
+    if use_parallel:
+        # Using ThreadPoolExecutor to parallelize the file processing
+        with ThreadPoolExecutor() as executor:
+            return list(executor.map(check, files))
+    return list(map(check, files))
+
+
+def _check_files_with_manifest(all_files, manifest_path, thresholds, use_parallel):
+    """Checks only the files that are new or changed since they were stored in the manifest.
+
+    A file rejected by the prefilter is checked again if the prefilter thresholds changed, or
+    the prefilter was turned off, since it was stored.
+
+    Args:
+        all_files: The paths to the files to be checked.
+        manifest_path: The path to the manifest pickle file, which is updated with the new results.
+        thresholds: The prefilter thresholds, or `None` to send every file to the scan type test.
+        use_parallel: Whether to use a parallel thread pool to process the files.
+
+    Returns:
+        A list of (result, stage) tuples of the files, in the order of all_files. The stage of
+        files whose result was taken from the manifest is "manifest".
+    """
+    manifest = load_manifest(manifest_path)
+    prefilter = _prefilter_key(thresholds)
+    entries = {}
+    to_check = []
+    for file_path in all_files:
+        entry = manifest.get(file_path)
         try:
-            Fail, df = general_functions.scan_type_test(file_path)
-            if Fail == 0:
-                # Extract patient ID from the file path
-                match = re.search(r"\d{4}", file_path)
-                if match:
-                    patient_id = match.group(0)
-                    return patient_id, file_path
-        except Exception:
-            traceback.print_exc()
-    return None
+            signature = _file_signature(file_path)
+        except OSError:
+            signature = None
+        if (
+            entry is not None
+            and entry["signature"] == signature
+            and (entry["stage"] not in PREFILTER_STAGES or entry.get("prefilter", False) == prefilter)
+        ):
+            entries[file_path] = entry
+        else:
+            to_check.append(file_path)
+
+    new_entries = dict(zip(to_check, _check_files(to_check, thresholds, use_parallel, _check_file_for_manifest)))
+    logger.info(
+        f"Classified {len(to_check)} new or changed files, "
+        f"reused {len(all_files) - len(to_check)} from {manifest_path}"
+    )
+
+    # Failed checks and files that no longer exist are left out of the manifest
+    entries.update({path: entry for path, entry in new_entries.items() if entry["stage"] != "error"})
+    save_manifest({path: entries[path] for path in all_files if path in entries}, manifest_path)
 
+    return [
+        (new_entries[path]["result"], new_entries[path]["stage"]) if path in new_entries
+        else (entries[path]["result"], "manifest")
+        for path in all_files
+    ]
 
-def get_likely_us(root_dir, pickle_path=None, use_parallel=True):
+
+def get_likely_us(root_dir, pickle_path=None, use_parallel=True, manifest_path=False, prefilter=False):
     """Searches a directory and identifies the images that are likely to be doppler ultrasounds.
 
     Args:
         root_dir: The path to the directory to be searched.
         pickle_path: The path to the pickle file to save the results to. If `None`, the results will be saved to the current directory.
         use_parallel: Whether to use a parallel thread pool to process the files.
+        manifest_path: The path to a manifest pickle file of the files classified by previous runs.
+            Only files that are new, or whose size or modification time changed, are classified
+            again, and the manifest is updated. If `False`, every file is classified.
+        prefilter: Whether to reject the files that are clearly not doppler scans with cheap
+            image signals before the OCR of the scan type test, see prefilter_file.
+            If a dictionary, the prefilter is used with these thresholds overriding those in
+            PREFILTER_THRESHOLDS.
 
     Returns:
         A list of paths to the images that are likely to be doppler ultrasounds.
     """
+    thresholds = None
+    if isinstance(prefilter, dict):
+        thresholds = dict(prefilter)
+    elif prefilter:
+        thresholds = {}
+
     # Initialize a dictionary to store the paths for each patient
     patient_paths = {}
 
@@ -54,12 +296,19 @@ def get_likely_us(root_dir, pickle_path=None, use_parallel=True):
         # Collect all JPG files from the root directory
         all_files = [os.path.join(subdir, file) for subdir, _, files in os.walk(root_dir) for file in files if file.endswith('.JPG')]
 
-        if use_parallel:
-            # Using ThreadPoolExecutor to parallelize the file processing
-            with ThreadPoolExecutor() as executor:
-                results = list(executor.map(check_file_for_us, all_files))
+        if manifest_path:
+            checks = _check_files_with_manifest(all_files, manifest_path, thresholds, use_parallel)
         else:
-            results = list(map(check_file_for_us, all_files))
+            checks = _check_files(all_files, thresholds, use_parallel)
+        results = [result for result, stage in checks]
+
+        # Reports how many of the files classified in this run each stage rejected
+        stages = [stage for result, stage in checks if stage != "manifest"]
+        rejections = Counter(stage for stage in stages if stage is not None)
+        logger.info(
+            f"Accepted {len(stages) - sum(rejections.values())} of {len(stages)} classified files, "
+            f"rejected by stage: {dict(rejections)}"
+        )
 
         # Process results and populate patient_paths
         for res in results:
@@ -72,7 +321,7 @@ def get_likely_us(root_dir, pickle_path=None, use_parallel=True):
 
     elif os.path.isfile(root_dir):
         # If it's a single file, directly use the check_file_for_us function
-        result = check_file_for_us(root_dir)
+        result = check_file_for_us(root_dir, thresholds)
         if result:
             patient_id, file_path = result
             patient_paths[patient_id] = [file_path]
@@ -88,6 +337,8 @@ def get_likely_us(root_dir, pickle_path=None, use_parallel=True):
         with open(pickle_path, 'wb') as f:
             pickle.dump(patient_paths, f)
 
+    ocr.log_cache_stats()
+
     # Convert dictionary values to a list
     all_paths = [path for sublist in patient_paths.values() for path in sublist]
 
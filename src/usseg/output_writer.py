@@ -0,0 +1,200 @@
+"""Writes the annotated and digitized images of the segmentation.
+
+The annotated image is written directly from its array at the native resolution of the scan,
+and the digitized waveform is rendered at a small, fixed size. With a background writer, the
+PNG encoding and the disk writes happen on a separate thread, so they overlap with the
+segmentation of the next image.
+
+**Usage:**
+
+.. code-block:: python
+
+   from usseg.output_writer import OutputWriter
+
+   with OutputWriter(png_compression=3, digitized_size=(640, 480)) as writer:
+       writer.write_image("scan_Annotated.png", annotated_rgba)
+       writer.write_figure("scan_Digitized.png", figure)
+
+The artifact policy sets which scans get their images written: "all", "none", "failures" for
+only the scans with a failed stage, or "sampled" for a fixed fraction of the scans. The scans
+whose images are skipped keep a small render state instead, from which `usseg.render` draws
+the images later on demand.
+
+The options can also be set in the `[output]` table of the `config.toml` file.
+"""
+# Python imports
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import zlib
+
+# Module imports
+import cv2
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+logger = logging.getLogger(__file__)
+
+ARTIFACT_POLICIES = ("all", "none", "failures", "sampled")
+
+
+def render_figure(figure, size=(640, 480), dpi=100):
+    """Renders a matplotlib figure to an array.
+
+    Args:
+        figure (matplotlib.figure.Figure) : The figure to render. Its size is changed to size.
+        size (tuple, optional) : The (width, height) of the rendered image in pixels.
+            Defaults to (640, 480).
+        dpi (int, optional) : The resolution the figure is drawn at, which sets the size of
+            the text and lines relative to the image. Defaults to 100.
+
+    Returns:
+        **image** (ndarray) : The (height, width, 4) RGBA image of the figure.
+    """
+    figure.set_dpi(dpi)
+    figure.set_size_inches(size[0] / dpi, size[1] / dpi)
+    canvas = FigureCanvasAgg(figure)
+    canvas.draw()
+    return np.array(canvas.buffer_rgba())
+
+
+def write_png(path, image, png_compression=3):
+    """Writes an RGB or RGBA array as a PNG with cv2.
+
+    Args:
+        path (str) : The path of the PNG file.
+        image (ndarray) : The (height, width, 3 or 4) image in RGB(A) order.
+        png_compression (int, optional) : The zlib compression level, from 0 (fastest) to 9
+            (smallest). Defaults to 3.
+    """
+    image = np.asarray(image)
+    code = cv2.COLOR_RGBA2BGRA if image.shape[-1] == 4 else cv2.COLOR_RGB2BGR
+    if not cv2.imwrite(path, cv2.cvtColor(image, code), [cv2.IMWRITE_PNG_COMPRESSION, png_compression]):
+        raise OSError(f"Could not write {path}")
+
+
+class OutputWriter:
+    """Writes the output images of the segmentation, optionally on a background thread.
+
+    Args:
+        png_compression (int, optional) : The zlib compression level of the PNGs, from 0
+            (fastest) to 9 (smallest). Defaults to 3.
+        digitized_size (tuple, optional) : The (width, height) in pixels of the digitized
+            waveform plot. Defaults to (640, 480).
+        digitized_dpi (int, optional) : The resolution the digitized plot is drawn at.
+            Defaults to 100.
+        background (bool, optional) : If True, the images are encoded and written on a
+            background thread. Defaults to True.
+        max_pending (int, optional) : The maximum number of images waiting to be written,
+            after which a write blocks until the oldest is done, to bound the memory held.
+            Defaults to 8.
+        artifacts (str, optional) : Which scans get their images written, one of "all",
+            "none", "failures" or "sampled". Defaults to "all".
+        sample_rate (float, optional) : The fraction of the scans written with the "sampled"
+            policy. The sample is chosen by a hash of the filename, so it is the same on every
+            run. Defaults to 0.05.
+    """
+
+    def __init__(
+        self,
+        png_compression=3,
+        digitized_size=(640, 480),
+        digitized_dpi=100,
+        background=True,
+        max_pending=8,
+        artifacts="all",
+        sample_rate=0.05,
+    ):
+        if artifacts not in ARTIFACT_POLICIES:
+            raise ValueError(f"Unknown artifact policy {artifacts!r}, expected one of {ARTIFACT_POLICIES}")
+        self.artifacts = artifacts
+        self.sample_rate = sample_rate
+        self.png_compression = png_compression
+        self.digitized_size = tuple(digitized_size)
+        self.digitized_dpi = digitized_dpi
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = {}
+
+    def should_write(self, result):
+        """Returns whether the images of a scan are written under the artifact policy.
+
+        Args:
+            result (SegmentationResult) : The result of the scan, with its failed stages.
+
+        Returns:
+            **write** (bool) : True if the images are written, False if they are skipped.
+        """
+        if self.artifacts == "failures":
+            return bool(result.failed_stages)
+        if self.artifacts == "sampled":
+            return zlib.crc32(str(result.filename).encode()) % 10000 < self.sample_rate * 10000
+        return self.artifacts == "all"
+
+    def write_image(self, path, image, key=None):
+        """Writes an RGB(A) image array at its native resolution.
+
+        Without a background thread, a failed write raises here. In the background, it is
+        logged, and reported by failed_writes if the write has a key.
+
+        Args:
+            path (str) : The path of the PNG file.
+            image (ndarray) : The image in RGB(A) order. It must not be modified afterwards
+                while the write is pending.
+            key (str, optional) : The key the background write is tracked under, see
+                failed_writes. Defaults to None, which does not track it.
+        """
+        if self._executor is None:
+            write_png(path, image, self.png_compression)
+            return
+
+        self._slots.acquire()
+        future = self._executor.submit(write_png, path, image, self.png_compression)
+        future.add_done_callback(lambda future: self._done(future, path))
+        if key is not None:
+            self._pending.setdefault(key, []).append((path, future))
+
+    def write_figure(self, path, figure, key=None):
+        """Renders a matplotlib figure at the digitized size and writes it.
+
+        The figure is rendered on the calling thread, as matplotlib is not thread safe, and
+        only the encoding and writing are done in the background.
+
+        Args:
+            path (str) : The path of the PNG file.
+            figure (matplotlib.figure.Figure) : The figure to write.
+            key (str, optional) : The key the background write is tracked under, see
+                failed_writes. Defaults to None, which does not track it.
+        """
+        self.write_image(path, render_figure(figure, self.digitized_size, self.digitized_dpi), key)
+
+    def failed_writes(self, key):
+        """Waits for the background writes tracked under a key and returns those that failed.
+
+        Args:
+            key (str) : The key the writes were made with.
+
+        Returns:
+            **paths** (list) : The paths of the failed writes, empty if all of them succeeded
+                or none were tracked.
+        """
+        return [path for path, future in self._pending.pop(key, []) if future.exception() is not None]
+
+    def _done(self, future, path):
+        """Releases the slot of a finished write and logs it if it failed."""
+        self._slots.release()
+        if future.exception() is not None:
+            logger.error(f"Failed writing {path}: {future.exception()}")
+
+    def close(self):
+        """Waits for the pending writes to finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
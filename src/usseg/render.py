@@ -0,0 +1,173 @@
+"""Renders the annotated and digitized images of a scan from its stored render state.
+
+When the artifact policy of the OutputWriter skips the images of a scan, the segmentation
+instead stores what is needed to draw them later in a small compressed ``_Render.npz`` file:
+the path to the scan, the waveform and axes masks and the ROIs of the annotation, and the
+lines of the digitized plot. This module rebuilds the images from those files on demand.
+
+**Usage:**
+
+.. code-block:: python
+
+   from usseg.render import render_artifacts
+
+   annotated_path, digitized_path = render_artifacts("E:/us-data-processed/scan_Render.npz")
+
+or from the command line, for any number of render states or directories of render states:
+
+python -m usseg.render E:/us-data-processed/
+"""
+# Python imports
+import argparse
+import glob
+import logging
+import os
+
+# Module imports
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+
+# Local imports
+from usseg import general_functions
+from usseg.image_context import ImageContext
+from usseg.output_writer import OutputWriter
+
+logger = logging.getLogger(__file__)
+
+RENDER_STATE_SUFFIX = "_Render.npz"
+
+
+def save_render_state(path, input_image_filename, annotation=None, figure=None):
+    """Stores what is needed to render the images of a scan later.
+
+    Args:
+        path (str) : The path of the render state file, ending in ".npz".
+        input_image_filename (str) : Path to the ultrasound image.
+        annotation (dict, optional) : The keyword arguments of general_functions.annotate,
+            other than input_image_obj, or None if the scan has no annotated image.
+        figure (matplotlib.figure.Figure, optional) : The digitized plot, or None if the
+            scan has no digitized image. Only the lines, limits and labels of its first axes
+            are stored.
+    """
+    state = {"input_image_filename": np.array(input_image_filename)}
+
+    if annotation is not None:
+        # Only the pixels that annotate highlights are needed, so the masks are stored as booleans
+        state["waveform_mask"] = np.asarray(annotation["refined_segmentation_mask"]) == 1
+        state["axes_mask"] = (np.asarray(annotation["Left_axis"]) == 255) | (
+            np.asarray(annotation["Right_axis"]) == 255
+        )
+        for key in ["Left_dimensions", "Right_dimensions", "Waveform_dimensions"]:
+            state[key] = np.asarray(annotation[key])
+
+    if figure is not None and figure.axes:
+        ax = figure.axes[0]
+        state["n_lines"] = np.array(len(ax.lines))
+        for i, line in enumerate(ax.lines):
+            state[f"line_{i}_x"] = np.asarray(line.get_xdata(), dtype=float)
+            state[f"line_{i}_y"] = np.asarray(line.get_ydata(), dtype=float)
+            state[f"line_{i}_style"] = np.array([str(line.get_linestyle()), str(line.get_marker())])
+        state["limits"] = np.array([*ax.get_xlim(), *ax.get_ylim()])
+        state["labels"] = np.array([ax.get_xlabel(), ax.get_ylabel()])
+
+    np.savez_compressed(path, **state)
+
+
+def _annotation_from_state(state):
+    """Returns the keyword arguments of general_functions.annotate stored in a render state."""
+    axes = state["axes_mask"].astype(np.uint8) * 255
+    return {
+        "refined_segmentation_mask": state["waveform_mask"].astype(np.uint8),
+        "Left_dimensions": state["Left_dimensions"].tolist(),
+        "Right_dimensions": state["Right_dimensions"].tolist(),
+        "Waveform_dimensions": state["Waveform_dimensions"].tolist(),
+        "Left_axis": axes,
+        "Right_axis": np.zeros_like(axes),
+    }
+
+
+def _figure_from_state(state):
+    """Redraws the digitized plot stored in a render state."""
+    figure, ax = plt.subplots(1)
+    for i in range(int(state["n_lines"])):
+        linestyle, marker = state[f"line_{i}_style"].tolist()
+        ax.plot(state[f"line_{i}_x"], state[f"line_{i}_y"], linestyle=linestyle, marker=marker)
+    xmin, xmax, ymin, ymax = state["limits"].tolist()
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    ax.set_xlabel(str(state["labels"][0]))
+    ax.set_ylabel(str(state["labels"][1]))
+    return figure
+
+
+def render_artifacts(render_state_path, output_dir=None, writer=None):
+    """Renders the annotated and digitized images of a scan from its render state.
+
+    Args:
+        render_state_path (str) : Path to the render state file, as saved by save_render_state.
+        output_dir (str, optional) : Directory to write the images to. Defaults to None, which
+            writes them next to the render state.
+        writer (OutputWriter, optional) : The writer of the images. Defaults to None, which
+            writes all of the images with the default options.
+
+    Returns:
+        (tuple): tuple containing:
+            - **annotated_path** (str): The path to the annotated image, or None if the scan has none.
+            - **digitized_path** (str): The path to the digitized image, or None if the scan has none.
+    """
+    if writer is None:
+        writer = OutputWriter(background=False, artifacts="all")
+    if output_dir is None:
+        output_dir = os.path.dirname(render_state_path)
+    stem = os.path.join(output_dir, os.path.basename(render_state_path)[: -len(RENDER_STATE_SUFFIX)])
+
+    annotated_path = None
+    digitized_path = None
+    with np.load(render_state_path) as state:
+        if "waveform_mask" in state:
+            rgb_img = ImageContext.from_file(str(state["input_image_filename"])).rgb
+            annotated_path = stem + "_Annotated.png"
+            writer.write_image(
+                annotated_path, general_functions.annotate(input_image_obj=rgb_img, **_annotation_from_state(state))
+            )
+        if "n_lines" in state:
+            figure = _figure_from_state(state)
+            digitized_path = stem + "_Digitized.png"
+            writer.write_figure(digitized_path, figure)
+            plt.close(figure)
+
+    return annotated_path, digitized_path
+
+
+def main(paths, output_dir=None):
+    """Renders the images of each render state in paths.
+
+    Args:
+        paths (list) : Paths to render state files, or to directories of render state files.
+        output_dir (str, optional) : Directory to write the images to. Defaults to None, which
+            writes them next to each render state.
+    """
+    render_state_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            render_state_paths += sorted(glob.glob(os.path.join(path, "*" + RENDER_STATE_SUFFIX)))
+        else:
+            render_state_paths.append(path)
+
+    with OutputWriter(artifacts="all") as writer:
+        for render_state_path in render_state_paths:
+            try:
+                render_artifacts(render_state_path, output_dir, writer)
+            except Exception:
+                logger.exception(f"Failed rendering {render_state_path}")
+    logger.info(f"Rendered {len(render_state_paths)} scans")
+
+
+if __name__ == "__main__":
+    matplotlib.use("Agg")
+    parser = argparse.ArgumentParser(description="Renders the skipped images of segmented scans.")
+    parser.add_argument("paths", nargs="+", help="Render state files, or directories of them.")
+    parser.add_argument("--output-dir", default=None, help="Directory to write the images to.")
+    args = parser.parse_args()
+    main(args.paths, args.output_dir)
@@ -0,0 +1,313 @@
+"""Columnar on-disk store of the segmentation results.
+
+The results of all of the images are kept in a directory of four files, each appended to as
+the images finish:
+
+* ``scans.csv`` - one row per image, with its output paths, failed stages and the position of
+  its rows in the other files.
+* ``metrics.csv`` - the text data of every image in a single long table, with a ``scan_id``
+  column giving the row of the image in ``scans.csv``.
+* ``waveform_x.f32`` and ``waveform_y.f32`` - the digitized waveforms of every image, as
+  contiguous float32 arrays. Each image has a slice of them, given by its
+  ``waveform_offset`` and ``waveform_length``.
+
+Selected images or columns are read without loading the rest of the store: the metrics of an
+image are read from their byte range, and the waveforms are memory mapped.
+
+**Usage:**
+
+.. code-block:: python
+
+   from usseg.result_store import ResultStore
+
+   store = ResultStore("segmented_data")
+   scans = store.scans(["filename", "fails"])
+   ps = store.metrics(columns=["scan_id", "Word", "Value"])
+   x, y = store.waveform(0)
+
+The rows of an image are only committed once its row of ``scans.csv`` is written, so if a run
+is interrupted part way through an image, its partial rows are removed on the next append.
+
+An image that is appended again, e.g. when it is segmented again by a later run, replaces its
+earlier rows: the scans and metrics tables only hold the latest rows of each filename. The
+earlier rows stay on disk, and can still be read by their scan_id.
+"""
+# Python imports
+import csv
+import io
+import logging
+import os
+
+# Module imports
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__file__)
+
+SCAN_COLUMNS = [
+    "scan_id",
+    "filename",
+    "digitized_scan",
+    "annotated_scan",
+    "render_state",
+    "fails",
+    "failed_stages",
+    "has_text_data",
+    "metrics_start",
+    "metrics_end",
+    "waveform_offset",
+    "waveform_length",
+]
+METRIC_COLUMNS = ["scan_id", "Line", "Word", "Value", "Digitized Value", "Unit"]
+PATH_COLUMNS = ["filename", "digitized_scan", "annotated_scan", "render_state"]
+INDEX_COLUMNS = ["has_text_data", "metrics_start", "metrics_end", "waveform_offset", "waveform_length"]
+STORE_FILES = ["scans.csv", "metrics.csv", "waveform_x.f32", "waveform_y.f32"]
+
+
+def _csv_line(values):
+    """Returns the csv line of a list of values, as bytes."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue().encode()
+
+
+def _truncate(path, size):
+    """Truncates a file to size bytes, if it is longer."""
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        with open(path, "r+b") as f:
+            f.truncate(size)
+
+
+class ResultStore:
+    """Append-only columnar store of segmentation results.
+
+    The positions of the rows of each image are read from ``scans.csv`` once and cached, so
+    reading single images does not read the whole table each time. The cache is dropped on
+    each append through this store.
+
+    Args:
+        path (str) : Path to the directory of the store. It is created on the first append if
+            it does not exist, and appended to if it does.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._files = None
+        self._n_scans = 0
+        self._n_samples = 0
+        self._index = None
+
+    def _file(self, name):
+        """Returns the path of a file of the store."""
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        """Opens the files of the store for appending, removing any uncommitted rows first."""
+        os.makedirs(self.path, exist_ok=True)
+        scans_path = self._file("scans.csv")
+        metrics_path = self._file("metrics.csv")
+
+        if not os.path.exists(scans_path):
+            with open(scans_path, "wb") as f:
+                f.write(_csv_line(SCAN_COLUMNS))
+        else:
+            # A partly written last row is left by an interrupted append
+            with open(scans_path, "rb") as f:
+                data = f.read()
+            _truncate(scans_path, data.rfind(b"\n") + 1)
+
+        if not os.path.exists(metrics_path):
+            with open(metrics_path, "wb") as f:
+                f.write(_csv_line(METRIC_COLUMNS))
+        metrics_end = len(_csv_line(METRIC_COLUMNS))
+
+        scans = pd.read_csv(scans_path, usecols=["metrics_end", "waveform_offset", "waveform_length"])
+        self._n_scans = len(scans)
+        self._n_samples = 0
+        if self._n_scans:
+            last = scans.iloc[-1]
+            metrics_end = int(last["metrics_end"])
+            self._n_samples = int(last["waveform_offset"] + last["waveform_length"])
+
+        # Rows of an image whose scan row was never written are not part of the store
+        _truncate(metrics_path, metrics_end)
+        _truncate(self._file("waveform_x.f32"), self._n_samples * 4)
+        _truncate(self._file("waveform_y.f32"), self._n_samples * 4)
+
+        self._files = {name: open(self._file(name), "ab") for name in STORE_FILES}
+
+    def append(self, result):
+        """Appends the result of an image to the store.
+
+        Args:
+            result (SegmentationResult) : The result of the image.
+
+        Returns:
+            **scan_id** (int) : The id of the image in the store.
+        """
+        if self._files is None:
+            self._open()
+        scan_id = self._n_scans
+
+        metrics_file = self._files["metrics.csv"]
+        metrics_start = metrics_file.tell()
+        if result.text_data is not None:
+            table = result.text_data.reindex(columns=METRIC_COLUMNS[1:])
+            table.insert(0, "scan_id", scan_id)
+            metrics_file.write(table.to_csv(header=False, index=False, lineterminator="\n").encode())
+        metrics_end = metrics_file.tell()
+
+        waveform_length = 0
+        if result.waveform is not None:
+            waveform = np.asarray(result.waveform, dtype=np.float32)
+            waveform_length = waveform.shape[1]
+            self._files["waveform_x.f32"].write(waveform[0].tobytes())
+            self._files["waveform_y.f32"].write(waveform[1].tobytes())
+
+        for name in ["metrics.csv", "waveform_x.f32", "waveform_y.f32"]:
+            self._files[name].flush()
+        # Written last, as it commits the rows of the image
+        self._files["scans.csv"].write(_csv_line([
+            scan_id,
+            result.filename,
+            result.digitized_scan,
+            result.annotated_scan,
+            result.render_state,
+            result.fails,
+            ";".join(result.failed_stages),
+            result.text_data is not None,
+            metrics_start,
+            metrics_end,
+            self._n_samples,
+            waveform_length,
+        ]))
+        self._files["scans.csv"].flush()
+
+        self._n_scans += 1
+        self._n_samples += waveform_length
+        self._index = None
+        return scan_id
+
+    def clear(self):
+        """Removes all of the images from the store, so the next append starts it again."""
+        self.close()
+        for name in STORE_FILES:
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        self._n_scans = 0
+        self._n_samples = 0
+        self._index = None
+
+    def _scan_index(self):
+        """Returns the INDEX_COLUMNS of every row of scans.csv, by scan_id, read on first use."""
+        if self._index is None:
+            self._index = self.scans(INDEX_COLUMNS, replaced=True)
+        return self._index
+
+    def scans(self, columns=None, replaced=False):
+        """Reads the table of the images in the store.
+
+        Args:
+            columns (list, optional) : The columns to read, from SCAN_COLUMNS. Defaults to
+                None, which reads all of them.
+            replaced (bool, optional) : If True, the rows of images that were appended again
+                are read too. Defaults to False, which reads the latest row of each image.
+
+        Returns:
+            **scans** (pandas.DataFrame) : One row per image, in the order they were appended.
+                Outputs that failed are None. Empty if nothing was appended to the store yet.
+        """
+        columns = SCAN_COLUMNS if columns is None else list(columns)
+        if not os.path.exists(self._file("scans.csv")):
+            return pd.DataFrame(columns=columns)
+
+        scans = pd.read_csv(
+            self._file("scans.csv"),
+            usecols=columns if replaced else list(dict.fromkeys(columns + ["filename"])),
+            dtype={column: str for column in PATH_COLUMNS + ["failed_stages"]},
+            keep_default_na=False,
+        )
+        if not replaced:
+            scans = scans[~scans["filename"].duplicated(keep="last")].reset_index(drop=True)
+            scans = scans[scans.columns.intersection(columns)]
+        for column in scans.columns.intersection(PATH_COLUMNS):
+            scans[column] = scans[column].astype(object).where(scans[column] != "", None)
+        return scans
+
+    def metrics(self, scan_ids=None, columns=None):
+        """Reads the text data of the images in the store, as a single long table.
+
+        Args:
+            scan_ids (list, optional) : The ids of the images to read. Only their rows are
+                read from disk. Defaults to None, which reads the latest rows of every image.
+            columns (list, optional) : The columns to read, from METRIC_COLUMNS. Defaults to
+                None, which reads all of them.
+
+        Returns:
+            **metrics** (pandas.DataFrame) : The rows of the text data of the images, with the
+                scan_id of their image. Missing values are NaN.
+        """
+        if scan_ids is None:
+            latest = self.scans(["scan_id"])["scan_id"]
+            if len(latest) < len(self._scan_index()):
+                scan_ids = latest  # The rows of the images that were appended again are skipped
+
+        if scan_ids is None:
+            source = self._file("metrics.csv")
+        else:
+            ranges = self._scan_index()[["metrics_start", "metrics_end"]].iloc[list(scan_ids)]
+            chunks = [_csv_line(METRIC_COLUMNS)]
+            with open(self._file("metrics.csv"), "rb") as f:
+                for start, end in ranges.itertuples(index=False):
+                    f.seek(start)
+                    chunks.append(f.read(end - start))
+            source = io.BytesIO(b"".join(chunks))
+
+        return pd.read_csv(source, usecols=columns, dtype={"Word": str, "Unit": str})
+
+    def text_data(self, scan_id):
+        """Reads the text data of a single image.
+
+        Args:
+            scan_id (int) : The id of the image.
+
+        Returns:
+            **text_data** (pandas.DataFrame) : The text data of the image, or None if its
+                text extraction failed.
+        """
+        if not self._scan_index()["has_text_data"].iloc[scan_id]:
+            return None
+        return self.metrics([scan_id]).drop(columns="scan_id")
+
+    def waveform(self, scan_id):
+        """Reads the digitized waveform of a single image, memory mapped from disk.
+
+        Args:
+            scan_id (int) : The id of the image.
+
+        Returns:
+            (tuple): tuple containing:
+                - **x** (ndarray): The float32 x-values of the waveform, or None if the image
+                  has no waveform.
+                - **y** (ndarray): The float32 y-values of the waveform, or None.
+        """
+        offset, length = self._scan_index()[["waveform_offset", "waveform_length"]].iloc[scan_id]
+        if length == 0:
+            return None, None
+        return tuple(
+            np.memmap(self._file(name), dtype=np.float32, mode="r", offset=int(offset) * 4, shape=(int(length),))
+            for name in ["waveform_x.f32", "waveform_y.f32"]
+        )
+
+    def close(self):
+        """Closes the files of the store."""
+        if self._files is not None:
+            for f in self._files.values():
+                f.close()
+            self._files = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -5,57 +5,435 @@
 # Python imports
 import os
 import logging
-from PIL import Image
 import pickle
+from collections import deque
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
 
 # Module imports
+import matplotlib
 import matplotlib.pyplot as plt
-import cv2
+import numpy as np
+import pandas as pd
+import pytesseract
 import traceback
 import toml
 
 # Import segmentation module
 from usseg import general_functions
+from usseg import ocr
+from usseg import render
+from usseg.image_context import ImageContext
+from usseg.journal import SegmentationJournal
+from usseg.result_store import ResultStore
+from usseg.output_writer import OutputWriter
 from usseg.setup_environment import setup_tesseract
 
 logger = logging.getLogger(__file__)
 
+WRITE_STAGES = ("annotated image", "digitized image", "render state")  # Failed writes, which may pass on a retry
+
+
+@dataclass
+class SegmentationResult:
+    """The outputs of segmenting a single image.
+
+    Attributes:
+        filename (str) : Path to the image that was segmented.
+        digitized_scan (str) : Path to the digitized scan, or None if digitization failed.
+        annotated_scan (str) : Path to the annotated scan, or None if annotation failed.
+        text_data (pandas.DataFrame) : The text data extracted from the scan, or None if
+            text extraction failed.
+        fails (int) : The number of segmentation stages that failed.
+        failed_stages (list) : The names of the stages that failed, in the order they ran.
+        render_state (str) : Path to the render state of the scan if the artifact policy
+            skipped its images, from which usseg.render draws them later, or None.
+        waveform (ndarray) : The (2, n) float32 x and y values of the digitized waveform, or
+            None if digitization failed.
+        resumed (bool) : True if the result was taken from the journal of an earlier run,
+            rather than segmented again.
+    """
 
-def segment(filenames=None, output_dir=None, pickle_path=None):
-    """Segments the pre-selected ultrasound images
+    filename: str
+    digitized_scan: str = None
+    annotated_scan: str = None
+    text_data: pd.DataFrame = None
+    fails: int = 0
+    failed_stages: list = field(default_factory=list)
+    render_state: str = None
+    waveform: np.ndarray = None
+    resumed: bool = False
+
+
+def segment_image(input_image_filename, output_dir, writer=None, batched_threshold_sweep=False):
+    """Segments and digitizes a single ultrasound image.
 
     Args:
-        filenames (str or list, optional) : If string, must be either a single
-            file name path or a path to a pickle object containing the list of
-            files. Pickle objects are expected to have the extension ".pkl"
-            or ".pickle".
-            If a list, must be a list of filenames to ultrasound images to
-            segment.
-            If None, will load a test image.
+        input_image_filename (str) : Path to the ultrasound image.
+        output_dir (str) : Path to the output directory to store the annotated and digitized
+            images.
+        writer (OutputWriter, optional) : The writer of the annotated and digitized images.
+            Defaults to None, which writes them with the default options before returning.
+        batched_threshold_sweep (bool, optional) : If True, the labels of the axes are read
+            with the batched threshold sweep, see general_functions.search_for_labels.
+            Defaults to False.
+
+    Returns:
+        **result** (SegmentationResult) : The outputs of the image. A stage that fails is
+            logged and leaves its output as None.
+    """
+    # input_image_filename = "E:/us-data-anon/0000/IHE_PDI/00003511/AA3A43F2/AAD8766D/0000371E\\EEEAE224.JPG"
+    image_name = os.path.basename(input_image_filename)
+    print(input_image_filename)
+    result = SegmentationResult(input_image_filename)
+    if writer is None:
+        writer = OutputWriter(background=False)
+    image_context = None
+    annotation = None
+    digitized_figure = None
+
+    try:  # Try text extraction
+        # The image is decoded once, and each stage gets a read-only view of the same buffer
+        image_context = ImageContext.from_file(input_image_filename)
+        rgb_img = image_context.rgb  # We need RGB, so a view in RGB order
+        # rgb_img = General_functions.upscale_to_fixed_longest_edge(rgb_img)  # upscale to longest edge
+
+        # from General_functions import Colour_extract, Text_from_greyscale
+        COL = general_functions.colour_extract_vectorized(rgb_img, [255, 255, 100], 95, 95)
+        logger.info("Done Colour extract")
+
+        # Copied, as boxes are drawn around the text found
+        Fail, df = general_functions.text_from_greyscale(image_context.bgr.copy(), COL)
+    except Exception:  # flat fail on 1
+        traceback.print_exc()  # prints the error message and traceback
+        logger.error("Failed Text extraction")
+        result.failed_stages.append("text extraction")
+        df = None
+        Fail = 0
+        pass
+
+    try:  # Try initial segmentation
+        segmentation_mask, Xmin, Xmax, Ymin, Ymax = general_functions.initial_segmentation(
+            input_image_obj=rgb_img
+        )
+    except Exception:  # flat fail on 1
+        logger.error("Failed Initial segmentation")
+        result.failed_stages.append("initial segmentation")
+        Fail = Fail + 1
+        pass
+
+    try:  # define end ROIs
+        Left_dimensions, Right_dimensions = general_functions.define_end_rois(
+            segmentation_mask, Xmin, Xmax, Ymin, Ymax
+        )
+    except Exception:
+        logger.error("Failed Defining ROI")
+        result.failed_stages.append("defining ROI")
+        Fail = Fail + 1
+        pass
+
+    try:
+        Waveform_dimensions = [Xmin, Xmax, Ymin, Ymax]
+    except Exception:
+        logger.error("Failed Waveform dimensions")
+        result.failed_stages.append("waveform dimensions")
+        Fail = Fail + 1
+        pass
+
+    try:  # Search for ticks and labels
+        (
+            Cs,
+            ROIAX,
+            CenPoints,
+            onY,
+            BCs,
+            TYLshift,
+            thresholded_image,
+            Side,
+            Left_dimensions,
+            Right_dimensions,
+            ROI2,
+            ROI3,
+        ) = general_functions.search_for_ticks(
+            image_context, "Left", Left_dimensions, Right_dimensions
+        )
+        ROIAX, Lnumber, Lpositions, ROIL = general_functions.search_for_labels(
+            Cs,
+            ROIAX,
+            CenPoints,
+            onY,
+            BCs,
+            TYLshift,
+            Side,
+            Left_dimensions,
+            Right_dimensions,
+            image_context,
+            ROI2,
+            ROI3,
+            batched_threshold_sweep=batched_threshold_sweep,
+        )
+
+        (
+            Cs,
+            ROIAX,
+            CenPoints,
+            onY,
+            BCs,
+            TYLshift,
+            thresholded_image,
+            Side,
+            Left_dimensions,
+            Right_dimensions,
+            ROI2,
+            ROI3,
+        ) = general_functions.search_for_ticks(
+            image_context, "Right", Left_dimensions, Right_dimensions
+        )
+        ROIAX, Rnumber, Rpositions, ROIR = general_functions.search_for_labels(
+            Cs,
+            ROIAX,
+            CenPoints,
+            onY,
+            BCs,
+            TYLshift,
+            Side,
+            Left_dimensions,
+            Right_dimensions,
+            image_context,
+            ROI2,
+            ROI3,
+            batched_threshold_sweep=batched_threshold_sweep,
+        )
+    except Exception:
+        traceback.print_exc()  # prints the error message and traceback
+        logger.error("Failed Axes search")
+        result.failed_stages.append("axes search")
+
+        Fail = Fail + 1
+        pass
+
+    try:
+        try:  # Refine segmentation
+            (
+                refined_segmentation_mask, top_curve_mask, top_curve_coords
+            ) = general_functions.segment_refinement(
+                image_context, Xmin, Xmax, Ymin, Ymax
+            )
+        except Exception:
+            traceback.print_exc()  # prints the error message and traceback
+            logger.error("Failed Segment refinement")
+            result.failed_stages.append("segment refinement")
+            Fail = Fail + 1
+            pass
+
+        Xplot, Yplot, Ynought = general_functions.plot_digitized_data(
+            Rnumber, Rpositions, Lnumber, Lpositions, top_curve_coords,
+        )
+        result.waveform = np.array([Xplot, Yplot], dtype=np.float32)
+
+        annotation = dict(
+            refined_segmentation_mask=refined_segmentation_mask,
+            Left_dimensions=Left_dimensions,
+            Right_dimensions=Right_dimensions,
+            Waveform_dimensions=Waveform_dimensions,
+            Left_axis=ROIL,
+            Right_axis=ROIR,
+        )
+
+        try:
+            df = general_functions.plot_correction(Xplot, Yplot, df)
+        except Exception:
+            traceback.print_exc()
+            logger.error("Failed correction")
+            result.failed_stages.append("correction")
+        else:
+            digitized_figure = plt.figure(2)
+
+    except Exception:
+        logger.error("Failed Digitization")
+        result.failed_stages.append("digitization")
+        traceback.print_exc()
+        Fail = Fail + 1
+        pass
+
+    # The images are written once all the stages have run, as the artifact policy may
+    # depend on whether any of them failed
+    Fail = Fail + _write_artifacts(
+        result, output_dir + image_name.partition(".")[0], writer, image_context, annotation, digitized_figure
+    )
+
+    result.text_data = df
+    result.fails = Fail
+    plt.close("all")
+    return result
+
+
+def _write_artifacts(result, output_stem, writer, image_context, annotation, digitized_figure):
+    """Writes the annotated and digitized images of a scan, or its render state if skipped.
+
+    A path is only set on the result once its file is written, or for a background write, once
+    it is submitted; a background write that fails is reported by _report_failed_writes.
+
+    Args:
+        result (SegmentationResult) : The result of the scan, updated with the paths written.
+        output_stem (str) : The output path of the scan, without the suffix of each file.
+        writer (OutputWriter) : The writer of the images, with the artifact policy.
+        image_context (ImageContext) : The decoded scan, or None if it was not decoded.
+        annotation (dict) : The keyword arguments of general_functions.annotate, other than
+            input_image_obj, or None if the scan has no annotated image.
+        digitized_figure (matplotlib.figure.Figure) : The digitized plot, or None if the
+            scan has no digitized image.
+
+    Returns:
+        **fails** (int) : The number of failed stages, one for each file that could not be
+            annotated or written.
+    """
+    if annotation is None and digitized_figure is None:
+        return 0
+
+    if not writer.should_write(result):
+        render_state_path = output_stem + render.RENDER_STATE_SUFFIX
+        try:
+            render.save_render_state(render_state_path, result.filename, annotation, digitized_figure)
+        except Exception:
+            traceback.print_exc()
+            logger.error("Failed saving render state")
+            result.failed_stages.append("render state")
+            return 1
+        result.render_state = render_state_path
+        return 0
+
+    Fail = 0
+    if annotation is not None:
+        try:
+            col = general_functions.annotate(input_image_obj=image_context.rgb, **annotation)
+        except Exception:
+            traceback.print_exc()
+            logger.error("Failed annotation")
+            result.failed_stages.append("annotation")
+            Fail = Fail + 1
+        else:
+            Annotated_path = output_stem + "_Annotated.png"
+            try:
+                writer.write_image(Annotated_path, col, key=result.filename)
+            except Exception:
+                traceback.print_exc()
+                logger.error("Failed writing annotated image")
+                result.failed_stages.append("annotated image")
+                Fail = Fail + 1
+            else:
+                result.annotated_scan = Annotated_path
+
+    if digitized_figure is not None:
+        Digitized_path = output_stem + "_Digitized.png"
+        try:
+            writer.write_figure(Digitized_path, digitized_figure, key=result.filename)
+        except Exception:
+            traceback.print_exc()
+            logger.error("Failed writing digitized image")
+            result.failed_stages.append("digitized image")
+            Fail = Fail + 1
+        else:
+            result.digitized_scan = Digitized_path
+
+    return Fail
+
+
+def _report_failed_writes(result, writer):
+    """Waits for the background writes of a scan, recording those that failed on its result.
+
+    Args:
+        result (SegmentationResult) : The result of the scan.
+        writer (OutputWriter) : The writer the images of the scan were submitted to.
+
+    Returns:
+        **result** (SegmentationResult) : The result, without the paths of the failed writes.
+    """
+    failed = writer.failed_writes(result.filename)
+    for attribute, stage in [("annotated_scan", "annotated image"), ("digitized_scan", "digitized image")]:
+        if getattr(result, attribute) in failed:
+            setattr(result, attribute, None)
+            result.failed_stages.append(stage)
+            result.fails = result.fails + 1
+    return result
+
+
+def _segment_in_worker(input_image_filename, output_dir, writer_options, batched_threshold_sweep):
+    """Segments an image in a worker process, writing its images before returning.
 
-        output_dir (str, optional) : Path to the output directory to store annoated
-            images. If None, will load from config file.
-            Defaults to None.
-        pickle_path (str or bool) : If pickle_path is False, will not store the
-            list of likely us images as a pickle file. If None,
-            will load the pickle path from "config.toml".
-            Else if a string, will dump the pickled list to the specified path.
-            Defaults to None.
     Returns:
         (tuple): tuple containing:
-            - **filenames** (list): A list of the paths to the images that were segmented.
-            - **Digitized_scans** (list): A list of the paths to the digitized scans.
-            - **Annotated_scans** (list): A list of the paths to the annotated scans.
-            - **Text_data** (list): A list of the text data extracted from the scans, as strings.
+            - **result** (SegmentationResult): The outputs of the image.
+            - **cache_counts** (dict): The OCR cache hits and misses of the image in this
+              worker, or None if it has no cache, see _add_worker_cache_counts.
+    """
+    before = _cache_counts()
+    result = segment_image(
+        input_image_filename,
+        output_dir,
+        OutputWriter(background=False, **writer_options),
+        batched_threshold_sweep=batched_threshold_sweep,
+    )
+    after = _cache_counts()
+    return result, None if after is None else {name: after[name] - before[name] for name in after}
+
+
+def _cache_counts():
+    """Returns the hit and miss counts of the OCR cache of this process, or None if it has none."""
+    cache = ocr.get_cache()
+    if cache is None:
+        return None
+    stats = cache.stats()
+    return {name: stats[name] for name in ["memory_hits", "disk_hits", "misses"]}
+
+
+def _add_worker_cache_counts(result_and_counts):
+    """Adds the OCR cache counts of a worker to the cache of this process, returning its result.
+
+    The caches of the workers are separate, so without this, log_cache_stats would only report
+    the lookups of this process.
     """
+    result, counts = result_and_counts
+    if counts is not None and ocr.get_cache() is not None:
+        ocr.get_cache().add_stats(**counts)
+    return result
+
+
+def _worker_initargs():
+    """Returns the arguments of _init_worker that copy the OCR settings of this process."""
+    cache = ocr.get_cache()
+    return (
+        pytesseract.pytesseract.tesseract_cmd,
+        ocr.get_backend(),
+        None if cache is None else cache.max_entries,
+        None if cache is None else cache.cache_dir,
+    )
 
+
+def _init_worker(tesseract_cmd, ocr_backend, ocr_cache_size, ocr_cache_dir):
+    """Sets up a worker process with the OCR settings of the parent process.
+
+    The backend is unpickled in the worker, which rebuilds it with the same options, e.g. the
+    tessdata path of the tesserocr backend.
+    """
+    matplotlib.use("Agg")  # Workers only save figures
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    ocr.set_backend(ocr_backend)
+    ocr.set_cache(ocr.OCRCache(ocr_cache_size, ocr_cache_dir) if ocr_cache_size is not None else None)
+
+
+def _resolve_filenames(filenames):
+    """Returns the filenames to segment from any of the inputs accepted by segment."""
     if filenames is None:
         filenames = ["Lt_test_image.png"]
 
     elif isinstance(filenames, list):
         pass
 
-    elif isinstance(filenames, dict) or filenames.endswith(".pkl") or filenames.endswith(".pickle"):
+    elif isinstance(filenames, dict) or (
+        isinstance(filenames, str) and (filenames.endswith(".pkl") or filenames.endswith(".pickle"))
+    ):
         if isinstance(filenames, str):
             with open(filenames, "rb") as f:
                 text_file = pickle.load(f)
@@ -73,224 +451,270 @@ def segment(filenames=None, output_dir=None, pickle_path=None):
             #
     elif isinstance(filenames, str):
         filenames = [filenames]
+    elif isinstance(filenames, Iterable):
+        pass  # Consumed lazily by segment_iter
     else:
         logging.warning(
             f"Unrecognised filenames type {type(filenames)}"
             "Excepted either a string or a list"
         )
 
-    if output_dir is None:
-        output_dir = toml.load("config.toml")["output_dir"]
-    os.makedirs(output_dir, exist_ok=True)
-    # excel_file = output_dir + "sample3_processed_data"
-    Text_data = []  # text data extracted from image
-    Annotated_scans = []
-    Digitized_scans = []
+    return filenames
 
-    for input_image_filename in filenames:  # Iterate through all file names and populate excel file
-        # input_image_filename = "E:/us-data-anon/0000/IHE_PDI/00003511/AA3A43F2/AAD8766D/0000371E\\EEEAE224.JPG"
-        image_name = os.path.basename(input_image_filename)
-        print(input_image_filename)
-
-        try:  # Try text extraction
-            colRGBA = Image.open(input_image_filename)  # These images are in RGBA form
-            # colRGBA = General_functions.upscale_to_fixed_longest_edge(colRGBA)  # upscale to longest edge
-            PIL_col = colRGBA.convert("RGB")  # We need RGB, so convert here. with PIL
-            cv2_img = cv2.imread(input_image_filename)  # with cv2.
-            # pix = (
-            #     col.load()
-            # )  # Loads a pixel access object, where pixel values can be edited
-
-            # from General_functions import Colour_extract, Text_from_greyscale
-            COL = general_functions.colour_extract_vectorized(PIL_col, [255, 255, 100], 95, 95)
-            logger.info("Done Colour extract")
-
-            Fail, df = general_functions.text_from_greyscale(cv2_img, COL)
-        except Exception:  # flat fail on 1
-            traceback.print_exc()  # prints the error message and traceback
-            logger.error("Failed Text extraction")
-            Text_data.append(None)
-            Fail = 0
-            pass
 
-        try:  # Try initial segmentation
-            segmentation_mask, Xmin, Xmax, Ymin, Ymax = general_functions.initial_segmentation(
-                input_image_obj=PIL_col
-            )
-        except Exception:  # flat fail on 1
-            logger.error("Failed Initial segmentation")
-            Fail = Fail + 1
-            pass
+def segment_iter(
+    filenames=None,
+    output_dir=None,
+    n_workers=1,
+    ordered=True,
+    max_pending=None,
+    journal_path=None,
+    resume=False,
+    writer_options=None,
+    batched_threshold_sweep=False,
+    retry_failed=False,
+):
+    """Segments the pre-selected ultrasound images, yielding the result of each image as it finishes.
 
-        try:  # define end ROIs
-            Left_dimensions, Right_dimensions = general_functions.define_end_rois(
-                segmentation_mask, Xmin, Xmax, Ymin, Ymax
-            )
-        except Exception:
-            logger.error("Failed Defining ROI")
-            Fail = Fail + 1
-            pass
+    Only the images in progress are held in memory, so the memory use does not grow with the
+    number of files, and the caller can store results, report progress or stop early.
 
-        try:
-            Waveform_dimensions = [Xmin, Xmax, Ymin, Ymax]
-        except Exception:
-            logger.error("Failed Waveform dimensions")
-            Fail = Fail + 1
-            pass
-
-        try:  # Search for ticks and labels
-            (
-                Cs,
-                ROIAX,
-                CenPoints,
-                onY,
-                BCs,
-                TYLshift,
-                thresholded_image,
-                Side,
-                Left_dimensions,
-                Right_dimensions,
-                ROI2,
-                ROI3,
-            ) = general_functions.search_for_ticks(
-                cv2_img, "Left", Left_dimensions, Right_dimensions
-            )
-            ROIAX, Lnumber, Lpositions, ROIL = general_functions.search_for_labels(
-                Cs,
-                ROIAX,
-                CenPoints,
-                onY,
-                BCs,
-                TYLshift,
-                Side,
-                Left_dimensions,
-                Right_dimensions,
-                cv2_img,
-                ROI2,
-                ROI3,
-            )
-
-            (
-                Cs,
-                ROIAX,
-                CenPoints,
-                onY,
-                BCs,
-                TYLshift,
-                thresholded_image,
-                Side,
-                Left_dimensions,
-                Right_dimensions,
-                ROI2,
-                ROI3,
-            ) = general_functions.search_for_ticks(
-                cv2_img, "Right", Left_dimensions, Right_dimensions
-            )
-            ROIAX, Rnumber, Rpositions, ROIR = general_functions.search_for_labels(
-                Cs,
-                ROIAX,
-                CenPoints,
-                onY,
-                BCs,
-                TYLshift,
-                Side,
-                Left_dimensions,
-                Right_dimensions,
-                cv2_img,
-                ROI2,
-                ROI3,
-            )
-        except Exception:
-            traceback.print_exc()  # prints the error message and traceback
-            logger.error("Failed Axes search")
-
-            Fail = Fail + 1
-            pass
+    Args:
+        filenames (str, list or iterable, optional) : The images to segment, in any of the
+            forms accepted by segment. An iterable is consumed lazily.
+            If None, will load a test image.
+        output_dir (str, optional) : Path to the output directory to store annoated
+            images. If None, will load from config file.
+            Defaults to None.
+        n_workers (int, optional) : The number of worker processes to segment the images
+            with. Defaults to 1, which segments the images one at a time in this process.
+        ordered (bool, optional) : If True, the results are yielded in the order of filenames.
+            Otherwise, each result is yielded as soon as its worker finishes.
+            Defaults to True.
+        max_pending (int, optional) : The maximum number of images submitted to the workers
+            and not yet yielded. Defaults to None, which allows twice n_workers.
+        journal_path (str, optional) : Path to a journal that each result is appended to as
+            it is yielded, see usseg.journal. Defaults to None, which keeps no journal.
+        resume (bool, optional) : If True, the images already recorded in the journal are
+            not segmented again, and their recorded results are yielded instead.
+            Defaults to False.
+        retry_failed (bool, optional) : If True, the images whose journal record has any failed
+            stage are segmented again when resuming. Otherwise, only those whose images or
+            render state failed to be written are, see WRITE_STAGES, as other failures are
+            likely to happen again. Defaults to False.
+        writer_options (dict, optional) : Keyword arguments of the OutputWriter of the
+            annotated and digitized images. In this process, the images are written on a
+            background thread while the next image is segmented, and each result is yielded
+            once its images are written.
+            Defaults to None, which uses the default options.
+        batched_threshold_sweep (bool, optional) : If True, the labels of the axes are read
+            with the batched threshold sweep, see general_functions.search_for_labels.
+            Defaults to False.
+
+    Yields:
+        **result** (SegmentationResult) : The outputs of each image.
+    """
+    filenames = _resolve_filenames(filenames)
+    if output_dir is None:
+        output_dir = toml.load("config.toml")["output_dir"]
+    os.makedirs(output_dir, exist_ok=True)
 
-        try:
-            try:  # Refine segmentation
-                (
-                    refined_segmentation_mask, top_curve_mask, top_curve_coords
-                ) = general_functions.segment_refinement(
-                    cv2_img, Xmin, Xmax, Ymin, Ymax
+    journal = SegmentationJournal(journal_path) if journal_path else None
+    completed = {}
+    if journal is not None and resume:
+        records = journal.load()
+        journal.compact(records)
+        completed = {
+            filename: SegmentationResult(**{**record, "resumed": True})
+            for filename, record in records.items()
+            if not _needs_retry(record, retry_failed)
+        }
+        logger.info(f"Resuming with {len(completed)} images completed in {journal_path}")
+
+    try:
+        for result in _segment_results(
+            filenames,
+            output_dir,
+            n_workers,
+            ordered,
+            max_pending,
+            completed,
+            writer_options or {},
+            batched_threshold_sweep,
+        ):
+            if journal is not None and result.filename not in completed:
+                journal.append(result)
+            yield result
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def _needs_retry(record, retry_failed):
+    """Returns whether the image of a journal record is segmented again when resuming."""
+    if retry_failed:
+        return bool(record["failed_stages"])
+    return any(stage in WRITE_STAGES for stage in record["failed_stages"])
+
+
+def _segment_results(
+    filenames, output_dir, n_workers, ordered, max_pending, completed, writer_options, batched_threshold_sweep
+):
+    """Yields the result of each image, taking the completed results instead of segmenting again."""
+    if n_workers is None or n_workers <= 1:
+        with OutputWriter(**writer_options) as writer:
+            # Each result is yielded after the next image is segmented, so its images are
+            # written in the background meanwhile, and any failed write is on the result
+            previous = None
+            for input_image_filename in filenames:
+                if input_image_filename in completed:
+                    result = completed[input_image_filename]
+                else:
+                    result = segment_image(input_image_filename, output_dir, writer, batched_threshold_sweep)
+                if previous is not None:
+                    yield _report_failed_writes(previous, writer)
+                previous = result
+            if previous is not None:
+                yield _report_failed_writes(previous, writer)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * n_workers
+
+    executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=_worker_initargs())
+    pending = deque()
+    try:
+        for input_image_filename in filenames:
+            if input_image_filename in completed:
+                # Queued as a finished future, so it keeps its place in the order
+                future = Future()
+                future.set_result((completed[input_image_filename], None))
+            else:
+                future = executor.submit(
+                    _segment_in_worker, input_image_filename, output_dir, writer_options, batched_threshold_sweep
                 )
-            except Exception:
-                traceback.print_exc()  # prints the error message and traceback
-                logger.error("Failed Segment refinement")
-                Fail = Fail + 1
-                pass
-
-            Xplot, Yplot, Ynought = general_functions.plot_digitized_data(
-                Rnumber, Rpositions, Lnumber, Lpositions, top_curve_coords,
-            )
-
-            col = general_functions.annotate(
-                input_image_obj=colRGBA,
-                refined_segmentation_mask=refined_segmentation_mask,
-                Left_dimensions=Left_dimensions,
-                Right_dimensions=Right_dimensions,
-                Waveform_dimensions=Waveform_dimensions,
-                Left_axis=ROIL,
-                Right_axis=ROIR,
-            )
-            Annotated_path = output_dir + image_name.partition(".")[0] + "_Annotated.png"
-            fig1, ax1 = plt.subplots(1)
-            ax1.imshow(col)
-            ax1.set_xticks([])
-            ax1.set_yticks([])
-            ax1.tick_params(axis="both", which="both", length=0)
-            fig1.savefig(Annotated_path, dpi=900, bbox_inches="tight", pad_inches=0)
-            Annotated_scans.append(Annotated_path)
+            pending.append(future)
+            while len(pending) >= max_pending:
+                yield _add_worker_cache_counts(_next_result(pending, ordered))
+        while pending:
+            yield _add_worker_cache_counts(_next_result(pending, ordered))
+    finally:
+        # Runs when the caller stops early, so the images not yet started are dropped
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _next_result(pending, ordered):
+    """Removes the next finished future from pending and returns its result."""
+    if ordered:
+        return pending.popleft().result()
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    # Of the futures that are done, the earliest submitted is returned first
+    future = next(future for future in pending if future in done)
+    pending.remove(future)
+    return future.result()
+
+
+def segment(
+    filenames=None,
+    output_dir=None,
+    pickle_path=None,
+    n_workers=1,
+    journal_path=False,
+    resume=False,
+    writer_options=None,
+    store_path=False,
+    batched_threshold_sweep=False,
+    retry_failed=False,
+):
+    """Segments the pre-selected ultrasound images
 
-            try:
-                df = general_functions.plot_correction(Xplot, Yplot, df)
-                Text_data.append(df)
-            except Exception:
-                traceback.print_exc()
-                logger.error("Failed correction")
-                continue
-            Digitized_path = output_dir + image_name.partition(".")[0] + "_Digitized.png"
-            plt.figure(2)
-            plt.savefig(Digitized_path, dpi=900, bbox_inches="tight", pad_inches=0)
-            Digitized_scans.append(Digitized_path)
+    Args:
+        filenames (str or list, optional) : If string, must be either a single
+            file name path or a path to a pickle object containing the list of
+            files. Pickle objects are expected to have the extension ".pkl"
+            or ".pickle".
+            If a list, must be a list of filenames to ultrasound images to
+            segment.
+            If None, will load a test image.
 
-        except Exception:
-            logger.error("Failed Digitization")
-            Annotated_scans.append(None)
-            traceback.print_exc()
-            try:
-                Text_data.append(df)
-            except Exception:
-                traceback.print_exc()
-                Text_data.append(None)
-            Digitized_scans.append(None)
-            Fail = Fail + 1
-            pass
+        output_dir (str, optional) : Path to the output directory to store annoated
+            images. If None, will load from config file.
+            Defaults to None.
+        pickle_path (str or bool) : If pickle_path is False, will not store the
+            list of likely us images as a pickle file. If None,
+            will load the pickle path from "config.toml".
+            Else if a string, will dump the pickled list to the specified path.
+            Defaults to None.
+        n_workers (int, optional) : The number of worker processes to segment the images
+            with. Each image is segmented in a single worker and the results are returned
+            in the order of filenames, as in serial mode. Defaults to 1, which segments the
+            images one at a time in this process.
+        journal_path (str or bool, optional) : If journal_path is False, no journal is kept.
+            If None, will load the journal path from "config.toml". Else if a string, each
+            finished image is appended to the journal at that path, see usseg.journal.
+            Defaults to False.
+        resume (bool, optional) : If True, the images already recorded in the journal are
+            not segmented again, so an interrupted run only segments the remaining images.
+            Defaults to False.
+        retry_failed (bool, optional) : If True, the images recorded with any failed stage
+            are segmented again when resuming, and otherwise only those whose images failed to
+            be written, see segment_iter. Defaults to False.
+        writer_options (dict, optional) : Keyword arguments of the OutputWriter of the
+            annotated and digitized images, e.g. png_compression, digitized_size and artifacts.
+            Defaults to None, which uses the default options.
+        store_path (str or bool, optional) : If store_path is False, no result store is
+            written. If None, will load the store path from "config.toml". Else if a string,
+            each image is appended as it finishes to the result store in that directory, see
+            usseg.result_store. An image segmented again replaces its earlier rows, while the
+            results a resumed run takes from the journal are only appended if the store does
+            not have them yet. Defaults to False.
+        batched_threshold_sweep (bool, optional) : If True, the labels of the axes are read
+            with the batched threshold sweep, see general_functions.search_for_labels.
+            Defaults to False.
+    Returns:
+        (tuple): tuple containing:
+            - **filenames** (list): A list of the paths to the images that were segmented.
+            - **Digitized_scans** (list): A list of the paths to the digitized scans.
+            - **Annotated_scans** (list): A list of the paths to the annotated scans.
+            - **Text_data** (list): A list of the text data extracted from the scans, as strings.
 
-        to_del = [
-            "df",
-            "image_name",
-            "Xmax",
-            "Xmin",
-            "Ymax",
-            "Ymin",
-            "Rnumber",
-            "Rpositions",
-            "Lnumber",
-            "Lpositions",
-            "Left_dimensions",
-            "Right_dimensions",
-            "segmentation_mask",
-        ]
-        for i in to_del:
-            try:
-                exec("del %s" % i)
-            except Exception:
-                pass
+        Each list has one entry per image in filenames, which is None where that output failed.
+    """
 
-        plt.close("all")
-        i = 1
+    filenames = list(_resolve_filenames(filenames))
+    if journal_path is None:
+        journal_path = toml.load("config.toml")["pickle"]["journal"]
+    if store_path is None:
+        store_path = toml.load("config.toml")["pickle"]["result_store"]
+    store = ResultStore(store_path) if store_path else None
+    # The results taken from the journal were appended to the store by the run that segmented them
+    stored = set(store.scans(["filename"])["filename"]) if store is not None and resume else set()
+    # excel_file = output_dir + "sample3_processed_data"
+    Text_data = []  # text data extracted from image
+    Annotated_scans = []
+    Digitized_scans = []
 
+    for result in segment_iter(
+        filenames,
+        output_dir,
+        n_workers=n_workers,
+        journal_path=journal_path or None,
+        resume=resume,
+        writer_options=writer_options,
+        batched_threshold_sweep=batched_threshold_sweep,
+        retry_failed=retry_failed,
+    ):
+        Text_data.append(result.text_data)
+        Annotated_scans.append(result.annotated_scan)
+        Digitized_scans.append(result.digitized_scan)
+        if store is not None and not (result.resumed and result.filename in stored):
+            store.append(result)
+
+    if store is not None:
+        store.close()
+    ocr.log_cache_stats()
     print(Digitized_scans)
     print(Annotated_scans)
     print(Text_data)
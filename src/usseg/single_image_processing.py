@@ -29,6 +29,7 @@ import pandas as pd
 
 # Local imports
 from usseg import general_functions
+from usseg.image_context import ImageContext
 
 logger = logging.getLogger(__file__)
 
@@ -72,6 +73,9 @@ def data_from_image(pil_img, cv2_img):
         segmentation_mask, Xmin, Xmax, Ymin, Ymax
     )
 
+    # Shares the greyscale and thresholded images between the remaining stages
+    image_context = ImageContext(cv2_img)
+
     # Search for ticks and labels
     (
         Cs,
@@ -87,7 +91,7 @@ def data_from_image(pil_img, cv2_img):
         ROI2,
         ROI3,
     ) = general_functions.search_for_ticks(
-        cv2_img, "Left", Left_dimensions, Right_dimensions
+        image_context, "Left", Left_dimensions, Right_dimensions
     )
     ROIAX, Lnumber, Lpositions, ROIL = general_functions.search_for_labels(
         Cs,
@@ -99,7 +103,7 @@ def data_from_image(pil_img, cv2_img):
         Side,
         Left_dimensions,
         Right_dimensions,
-        cv2_img,
+        image_context,
         ROI2,
         ROI3,
     )
@@ -118,7 +122,7 @@ def data_from_image(pil_img, cv2_img):
         ROI2,
         ROI3,
     ) = general_functions.search_for_ticks(
-        cv2_img, "Right", Left_dimensions, Right_dimensions
+        image_context, "Right", Left_dimensions, Right_dimensions
     )
     ROIAX, Rnumber, Rpositions, ROIR = general_functions.search_for_labels(
         Cs,
@@ -130,7 +134,7 @@ def data_from_image(pil_img, cv2_img):
         Side,
         Left_dimensions,
         Right_dimensions,
-        cv2_img,
+        image_context,
         ROI2,
         ROI3,
     )
@@ -138,7 +142,7 @@ def data_from_image(pil_img, cv2_img):
     (
         refined_segmentation_mask, top_curve_mask, top_curve_coords
     ) = general_functions.segment_refinement(
-        cv2_img, Xmin, Xmax, Ymin, Ymax
+        image_context, Xmin, Xmax, Ymin, Ymax
     )
 
     # Gets the segmentation
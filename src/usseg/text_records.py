@@ -0,0 +1,153 @@
+"""Compact records of the metrics read from the text of a scan.
+
+The text extraction matches each line of text to a metric such as "Lt Ut-PS", and the metric
+checks then read and correct the values of the metrics by name. Both work on a TextRecords,
+a plain list of slotted records with lookup by metric name, and the DataFrame of the text
+data is only built once, when it is returned by general_functions.text_from_greyscale.
+
+**Usage:**
+
+.. code-block:: python
+
+   from usseg.text_records import TextRecords
+
+   records = TextRecords()
+   records.append(1, "Umb-PS", 45.2, "cm/s")
+   records.value("PS")  # 45.2, the metric name is the part of the word after the prefix
+   df = records.to_dataframe()
+"""
+# Python imports
+from dataclasses import dataclass
+
+# Module imports
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["Line", "Word", "Value", "Unit"]
+
+
+def metric_name(word):
+    """Returns the name of the metric of a word, e.g. "S/D" for "Lt Ut-S/D"."""
+    return word.partition("-")[2]
+
+
+@dataclass
+class TextRecord:
+    """A metric read from a line of text.
+
+    Attributes:
+        line (int) : The number of the line of text, from 1, or NaN if the metric was not
+            found in the text.
+        word (str) : The metric, with its prefix, e.g. "Lt Ut-PS".
+        value (float) : The value of the metric.
+        unit (str) : The unit of the metric.
+    """
+
+    __slots__ = ("line", "word", "value", "unit")
+    line: int
+    word: str
+    value: float
+    unit: str
+
+
+class TextRecords:
+    """The metrics read from the text of a scan, in order, with lookup by metric name.
+
+    Args:
+        records (iterable, optional) : The TextRecord of each metric. Defaults to none.
+    """
+
+    def __init__(self, records=()):
+        self.records = list(records)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Creates the records of a DataFrame with the columns 'Line', 'Word', 'Value' and 'Unit'.
+
+        The values are taken from the arrays of the columns, so a float64 column gives numpy
+        floats, which divide by zero without raising, as when the values are read with .loc.
+        """
+        return cls(TextRecord(*row) for row in zip(*(df[column].to_numpy() for column in COLUMNS)))
+
+    def to_dataframe(self):
+        """Returns the records as a DataFrame with the columns 'Line', 'Word', 'Value' and 'Unit'.
+
+        The columns hold the values as they were read, so they have the object dtype.
+        """
+        return pd.DataFrame(
+            [(record.line, record.word, record.value, record.unit) for record in self.records],
+            columns=COLUMNS,
+            dtype=object,
+        )
+
+    def copy(self):
+        """Returns a copy of the records, which can be changed without changing these."""
+        return TextRecords(TextRecord(r.line, r.word, r.value, r.unit) for r in self.records)
+
+    def append(self, line, word, value, unit):
+        """Adds the record of a metric."""
+        self.records.append(TextRecord(line, word, value, unit))
+
+    def add_missing(self, words, value=0):
+        """Adds a record with a value of 0 for each of words that has no record yet.
+
+        Args:
+            words (list) : The words that must have a record.
+            value (optional) : The value of the added records, e.g. np.float64(0) to match the
+                values of a float64 column. Defaults to 0.
+        """
+        existing_words = set(self.words())
+        for word in words:
+            if word not in existing_words:
+                self.append(np.nan, word, value, "")
+
+    def order_by(self, word_order):
+        """Orders the records by the position of their word in word_order, dropping any others."""
+        self.records = [record for word in word_order for record in self.records if record.word == word]
+
+    def words(self):
+        """Returns the word of each record, in order."""
+        return [record.word for record in self.records]
+
+    def _find(self, name):
+        """Returns the records of a metric, by metric name."""
+        return [record for record in self.records if metric_name(record.word) == name]
+
+    def __contains__(self, name):
+        return bool(self._find(name))
+
+    def __len__(self):
+        return len(self.records)
+
+    def value(self, name, default=KeyError):
+        """Returns the value of the first record of a metric.
+
+        Args:
+            name (str) : The name of the metric, e.g. "PS".
+            default (optional) : The value returned if there is no record of the metric.
+                Defaults to raising a KeyError.
+        """
+        return self._get(name, "value", default)
+
+    def unit(self, name, default=KeyError):
+        """Returns the unit of the first record of a metric, see value."""
+        return self._get(name, "unit", default)
+
+    def _get(self, name, attribute, default):
+        """Returns an attribute of the first record of a metric."""
+        records = self._find(name)
+        if records:
+            return getattr(records[0], attribute)
+        if default is KeyError:
+            raise KeyError(name)
+        return default
+
+    def set_value(self, name, value):
+        """Sets the value of every record of a metric."""
+        for record in self._find(name):
+            record.value = value
+
+    def set_unit(self, name, unit):
+        """Sets the unit of every record of a metric."""
+        for record in self._find(name):
+            record.unit = unit
@@ -1,7 +1,99 @@
 import base64
+import itertools
+import logging
+import numbers
+import os
 import pickle
+
+import cv2
+import numpy as np
+import pandas as pd
 import toml
 
+from usseg.result_store import ResultStore
+
+logger = logging.getLogger(__file__)
+
+STYLE = (
+    '<style>'
+    'table {'
+    # '    border-collapse: collapse;'
+    '    font-family: Arial, sans-serif;'
+    '    font-size: 10px;'
+    '}'
+    'table td, table th {'
+    '    border: 1px solid #ddd;'
+    '    padding: 2px;'
+    '    white-space: nowrap;'
+    '}'
+    'table th {'
+    '    background-color: #f2f2f2;'
+    '    font-weight: bold;'
+    '}'
+    '</style>'
+)
+
+
+def _float_or_none(value):
+    """Returns the value as a float, or None if float() cannot convert it."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _digitized_value_styles(table_data):
+    """Returns the cell style of each Digitized Value, coloured by its relative error from Value.
+
+    Empty values are white, values within 5% are green, within 10% orange, and others red. A
+    cell has no style where the error is undefined: a Digitized Value that is not a number or
+    is zero, or a Value that is missing or not a number.
+    """
+    digitized = [_float_or_none(value) for value in table_data["Digitized Value"]]
+    invalid = np.array([value is None for value in digitized], dtype=bool)
+    parsed = np.array([np.nan if value is None else value for value in digitized], dtype=float)
+    invalid |= parsed == 0
+
+    if "Value" in table_data:
+        is_number = np.array([isinstance(value, numbers.Real) for value in table_data["Value"]], dtype=bool)
+        values = np.where(is_number, table_data["Value"].to_numpy(dtype=object), np.nan).astype(float)
+        invalid |= ~is_number
+    else:
+        values = np.full(len(parsed), np.nan)
+        invalid[:] = True
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = np.abs(parsed - values) / parsed
+    return np.select(
+        [(table_data["Digitized Value"] == "").to_numpy(dtype=bool), invalid, error < 0.05, error < 0.1],
+        ["background-color: white", None, "background-color: green", "background-color: orange"],
+        default="background-color: red",
+    )
+
+
+def _table_html(table_data):
+    """Returns the html of a text data table, or an empty block if it is None.
+
+    The cells are built a column at a time rather than row by row. Each column is as wide as
+    the longest value in it so far, and the Digitized Value column is coloured by its error.
+    """
+    if table_data is None:
+        return '<div style="display:inline-block;max-width:100%"></div>'
+
+    texts = np.vectorize(str, otypes=[object])(table_data.to_numpy(dtype=object))
+    widths = np.maximum.accumulate(np.vectorize(len, otypes=[int])(texts), axis=0) + 10  # add some padding
+    open_tags = '<td style="width:' + widths.astype(str).astype(object) + 'px'
+
+    if "Digitized Value" in table_data.columns and len(table_data):
+        column = table_data.columns.get_loc("Digitized Value")
+        styles = _digitized_value_styles(table_data)
+        styled = styles != None  # noqa: E711, elementwise
+        open_tags[styled, column] += ";" + styles[styled]
+
+    cells = open_tags + '">' + texts + '</td>'
+    rows = "".join('<tr>' + "".join(row) + '</tr>' for row in cells)
+    return '<div style="display:inline-block;padding:10px;"><table border="1">' + rows + '</table></div>'
+
 
 def generate_html(scans, annotated_scans, digitized_scans, tables):
     # Check if the number of scan paths and data tables match
@@ -9,24 +101,7 @@ def generate_html(scans, annotated_scans, digitized_scans, tables):
         raise ValueError("The number of scan paths and data tables do not match.")
 
     # Start building the HTML string
-    html_str = '<html><head>'
-    html_str += '<style>'
-    html_str += 'table {'
-    # html_str += '    border-collapse: collapse;'
-    html_str += '    font-family: Arial, sans-serif;'
-    html_str += '    font-size: 10px;'
-    html_str += '}'
-    html_str += 'table td, table th {'
-    html_str += '    border: 1px solid #ddd;'
-    html_str += '    padding: 2px;'
-    html_str += '    white-space: nowrap;'
-    html_str += '}'
-    html_str += 'table th {'
-    html_str += '    background-color: #f2f2f2;'
-    html_str += '    font-weight: bold;'
-    html_str += '}'
-    html_str += '</style>'
-    html_str += '</head><body>'
+    html_str = '<html><head>' + STYLE + '</head><body>'
 
     html_str += '<div style="overflow-x: scroll;white-space: nowrap;">'
     # Loop over each scan and table and add them to the HTML
@@ -51,38 +126,7 @@ def generate_html(scans, annotated_scans, digitized_scans, tables):
             html_str += '<div style="display:inline-block;width:300px"></div>'
 
         # Add the table data to the HTML
-        if table_data is not None:
-            table_html = '<div style="display:inline-block;padding:10px;">'
-            table_html += '<table border="1">'
-            max_widths = [0] * len(table_data.columns)
-            for _, row in table_data.iterrows():
-                for i, val in enumerate(row):
-                    max_widths[i] = max(max_widths[i], len(str(val)))
-                table_html += '<tr>'
-                for i, val in enumerate(row):
-                    width = max_widths[i] + 10  # add some padding
-                    try:
-                        if i == table_data.columns.get_loc('Digitized Value'):
-                            if val == '':
-                                cell_style = 'background-color: white'
-                            elif abs(float(val) - row['Value']) / float(val) < 0.05:
-                                cell_style = 'background-color: green'
-                            elif abs(float(val) - row['Value']) / float(val) < 0.1:
-                                cell_style = 'background-color: orange'
-                            else:
-                                cell_style = 'background-color: red'
-                            cell_html = f'<td style="width:{width}px;{cell_style}">{val}</td>'
-                        else:
-                            cell_html = f'<td style="width:{width}px">{val}</td>'
-                    except:
-                        cell_html = f'<td style="width:{width}px">{val}</td>'
-                    table_html += cell_html
-                table_html += '</tr>'
-            table_html += '</table></div>'
-            html_str += table_html
-
-        else:
-            html_str += '<div style="display:inline-block;max-width:100%"></div>'
+        html_str += _table_html(table_data)
 
         html_str += '<br>'
 
@@ -93,6 +137,118 @@ def generate_html(scans, annotated_scans, digitized_scans, tables):
     return html_str
 
 
+def _relative_link(path, directory):
+    """Returns the link to path from a page in directory."""
+    try:
+        return os.path.relpath(path, directory).replace(os.sep, "/")
+    except ValueError:  # On another drive
+        return os.path.abspath(path)
+
+
+def _write_thumbnail(path, thumbnail_path, width):
+    """Writes a thumbnail of an image at the given width, returning False if it can't be read."""
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        logger.warning(f"Could not read {path} for its thumbnail")
+        return False
+    height = max(1, round(img.shape[0] * width / img.shape[1]))
+    if img.shape[1] > width:
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.imwrite(thumbnail_path, img)
+
+
+def _image_html(path, report_dir, thumbnail_name, thumbnail_width):
+    """Returns the html of a linked thumbnail of an image, or an empty block if there is none."""
+    thumbnail_path = os.path.join(report_dir, "thumbnails", thumbnail_name)
+    if path is None or not _write_thumbnail(path, thumbnail_path, thumbnail_width):
+        return f'<div style="display:inline-block;width:{thumbnail_width}px"></div>'
+    return (
+        f'<div style="display:inline-block;max-width:100%;padding:10px">'
+        f'<a href="{_relative_link(path, report_dir)}"><img src="thumbnails/{thumbnail_name}" width="{thumbnail_width}"></a></div>'
+    )
+
+
+def _page_name(page_number):
+    """Returns the file name of a page of the report."""
+    return f"page_{page_number:05d}.html"
+
+
+def _navigation_html(page_number, has_next):
+    """Returns the links from a page to the previous and next pages and the index."""
+    links = []
+    if page_number > 1:
+        links.append(f'<a href="{_page_name(page_number - 1)}">Previous</a>')
+    links.append('<a href="index.html">Index</a>')
+    if has_next:
+        links.append(f'<a href="{_page_name(page_number + 1)}">Next</a>')
+    return '<p>' + ' | '.join(links) + '</p>'
+
+
+def generate_report(scans, annotated_scans, digitized_scans, tables, report_dir="report", page_size=50,
+                    thumbnail_width=300):
+    """Writes a report of the segmented scans as linked pages of thumbnails.
+
+    Unlike generate_html, the images are not embedded. A thumbnail of each image is written to
+    the thumbnails directory of the report and links to the full image on disk. Each page is
+    written as soon as its scans are read, so the inputs can be lazy iterables and only one
+    page is held at a time. An index page links to every page.
+
+    Args:
+        scans (iterable) : The paths to the original scans.
+        annotated_scans (iterable) : The paths to the annotated scans, None where it failed.
+        digitized_scans (iterable) : The paths to the digitized scans, None where it failed.
+        tables (iterable) : The text data tables of the scans, None where it failed.
+        report_dir (str, optional) : The directory of the report. Defaults to "report".
+        page_size (int, optional) : The number of scans on each page. Defaults to 50.
+        thumbnail_width (int, optional) : The width of the thumbnails in pixels.
+            Defaults to 300.
+
+    Returns:
+        **index_path** (str) : The path to the index page of the report.
+    """
+    os.makedirs(os.path.join(report_dir, "thumbnails"), exist_ok=True)
+    rows = zip(scans, annotated_scans, digitized_scans, tables)
+
+    index_entries = []
+    page = list(itertools.islice(rows, page_size))
+    page_number = 1
+    scan_number = 0
+    while page:
+        next_page = list(itertools.islice(rows, page_size))
+
+        page_str = ['<html><head>', STYLE, '</head><body>', _navigation_html(page_number, bool(next_page))]
+        page_str.append('<div style="overflow-x: scroll;white-space: nowrap;">')
+        for scan_path, Annotated_scan, Digitized_scan, table_data in page:
+            scan_number += 1
+            for path, kind in [(scan_path, "scan"), (Annotated_scan, "annotated"), (Digitized_scan, "digitized")]:
+                page_str.append(_image_html(path, report_dir, f"{scan_number:06d}_{kind}.png", thumbnail_width))
+            page_str.append(_table_html(table_data))
+            page_str.append('<br>')
+        page_str.append('</div>')
+        page_str.append(_navigation_html(page_number, bool(next_page)))
+        page_str.append('</body></html>')
+
+        with open(os.path.join(report_dir, _page_name(page_number)), 'w') as f:
+            f.write("".join(page_str))
+
+        index_entries.append(
+            f'<li><a href="{_page_name(page_number)}">Page {page_number}</a>: scans '
+            f'{scan_number - len(page) + 1} to {scan_number}, from {os.path.basename(page[0][0])}</li>'
+        )
+        page = next_page
+        page_number += 1
+
+    index_path = os.path.join(report_dir, "index.html")
+    with open(index_path, 'w') as f:
+        f.write(
+            '<html><head>' + STYLE + '</head><body>'
+            + f'<h1>Segmented scans</h1><p>{scan_number} scans on {len(index_entries)} pages</p>'
+            + '<ul>' + "".join(index_entries) + '</ul></body></html>'
+        )
+    logger.info(f"Wrote a report of {scan_number} scans to {index_path}")
+    return index_path
+
+
 def generate_html_from_pkl():
     """Generates a html file from the previously processed pickle files"""
 
@@ -106,5 +262,80 @@ def generate_html_from_pkl():
         f.write(html_str)
 
 
+def _store_tables(store, scan_ids, has_text_data, chunk_size):
+    """Yields the text data table of each scan in a result store, reading a chunk of scans at a time."""
+    for start in range(0, len(scan_ids), chunk_size):
+        chunk = list(scan_ids[start:start + chunk_size])
+        metrics = store.metrics(chunk)
+        # Missing values are shown as empty cells, as in the tables of the pickle
+        for column in ["Word", "Digitized Value", "Unit"]:
+            metrics[column] = metrics[column].astype(object).where(metrics[column].notna(), "")
+
+        tables_by_scan = {
+            scan_id: table.drop(columns="scan_id").reset_index(drop=True)
+            for scan_id, table in metrics.groupby("scan_id")
+        }
+        for scan_id, text_data in zip(chunk, has_text_data[start:start + chunk_size]):
+            if text_data:
+                yield tables_by_scan.get(scan_id, metrics.iloc[:0].drop(columns="scan_id"))
+            else:
+                yield None
+
+
+def generate_html_from_store(store_path=None):
+    """Generates a html file from a result store of previously processed images.
+
+    Only the scans table and the metrics table are read, not the waveforms.
+
+    Args:
+        store_path (str, optional) : Path to the result store. If None, will load the store
+            path from "config.toml". Defaults to None.
+    """
+    if store_path is None:
+        store_path = toml.load("config.toml")["pickle"]["result_store"]
+    store = ResultStore(store_path)
+    scans = store.scans(["scan_id", "filename", "digitized_scan", "annotated_scan", "has_text_data"])
+    has_text_data = scans["has_text_data"].tolist()
+    Text_data = list(_store_tables(store, scans["scan_id"].tolist(), has_text_data, max(len(has_text_data), 1)))
+
+    html_str = generate_html(
+        scans["filename"].tolist(), scans["annotated_scan"].tolist(), scans["digitized_scan"].tolist(), Text_data
+    )
+    with open('generated_segmented_data.html', 'w') as f:
+        f.write(html_str)
+
+
+def generate_report_from_store(store_path=None, report_dir="report", page_size=50, thumbnail_width=300):
+    """Writes a paginated report of a result store, see generate_report.
+
+    The metrics of the scans are read from the store a page at a time.
+
+    Args:
+        store_path (str, optional) : Path to the result store. If None, will load the store
+            path from "config.toml". Defaults to None.
+        report_dir (str, optional) : The directory of the report. Defaults to "report".
+        page_size (int, optional) : The number of scans on each page. Defaults to 50.
+        thumbnail_width (int, optional) : The width of the thumbnails in pixels.
+            Defaults to 300.
+
+    Returns:
+        **index_path** (str) : The path to the index page of the report.
+    """
+    if store_path is None:
+        store_path = toml.load("config.toml")["pickle"]["result_store"]
+    store = ResultStore(store_path)
+    scans = store.scans(["scan_id", "filename", "digitized_scan", "annotated_scan", "has_text_data"])
+
+    return generate_report(
+        scans["filename"],
+        scans["annotated_scan"],
+        scans["digitized_scan"],
+        _store_tables(store, scans["scan_id"].tolist(), scans["has_text_data"].tolist(), page_size),
+        report_dir,
+        page_size,
+        thumbnail_width,
+    )
+
+
 if __name__ == "__main__":
     generate_html_from_pkl()
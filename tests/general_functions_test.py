@@ -0,0 +1,332 @@
+"""Test the general functions."""
+
+# Module imports
+import cv2
+import numpy as np
+import pandas as pd
+from PIL import Image
+import pytest
+from rapidfuzz.distance import Levenshtein
+
+# Local imports
+from usseg import general_functions
+from usseg.image_context import ImageContext
+from usseg.text_records import TextRecords
+
+
+def synthetic_scan():
+    """Creates a small RGB image with a grey waveform block and yellow text."""
+    img = np.zeros((120, 200, 3), dtype=np.uint8)
+    img[50:100, 30:170] = 200  # Grey waveform
+    img[5:15, 120:180] = [255, 255, 100]  # Yellow text
+    img[0:10, 0:50] = 255  # White band that should be blanked
+    return img
+
+
+def test_initial_segmentation():
+    """Test the initial segmentation finds the waveform and leaves the input untouched."""
+    img = synthetic_scan()
+    pil_img = Image.fromarray(img)
+
+    segmentation_mask, Xmin, Xmax, Ymin, Ymax = general_functions.initial_segmentation(pil_img)
+
+    assert np.array_equal(np.asarray(pil_img), img)
+    assert segmentation_mask.shape == img.shape[:2]
+    assert not segmentation_mask[:20].any()
+    assert 28 <= Xmin <= 32 and 167 <= Xmax <= 171
+    assert 48 <= Ymin <= 52 and 97 <= Ymax <= 101
+
+    # A numpy array gives the same result
+    array_result = general_functions.initial_segmentation(img)
+    assert np.array_equal(array_result[0], segmentation_mask)
+    assert array_result[1:] == (Xmin, Xmax, Ymin, Ymax)
+
+
+def test_annotate():
+    """Test the annotation layers are composited onto a copy of the image."""
+    img = synthetic_scan()
+    mask = np.zeros(img.shape[:2], dtype=int)
+    mask[60:90, 50:150] = 1
+    left_axis = np.zeros(img.shape[:2])
+    left_axis[60:62, 5:10] = 255
+    right_axis = np.zeros(img.shape[:2])
+
+    annotated = general_functions.annotate(
+        input_image_obj=img,
+        refined_segmentation_mask=mask,
+        Left_dimensions=[0, 29, 40, 119],
+        Right_dimensions=[170, 199, 40, 110],
+        Waveform_dimensions=[30, 169, 50, 100],
+        Left_axis=left_axis,
+        Right_axis=right_axis,
+    )
+
+    assert annotated.shape == img.shape[:2] + (4,)
+    assert np.array_equal(annotated[70, 100], [255, 200, 200, 250])  # Waveform
+    assert np.array_equal(annotated[50, 100], [1, 255, 1, 255])  # Waveform ROI border
+    assert np.array_equal(annotated[61, 7], [255, 0, 255, 255])  # Tick
+    assert np.array_equal(annotated[110, 100], [0, 0, 0, 255])  # Background
+    assert mask.max() == 1 and img[70, 100, 0] == 200
+
+
+def test_colour_extract_vectorized():
+    """Test the yellow text is extracted and the lookup table is shared between calls."""
+    img = synthetic_scan()
+
+    COL = general_functions.colour_extract_vectorized(Image.fromarray(img), [255, 255, 100], 95, 95)
+    extracted = np.asarray(COL)
+
+    assert COL.mode == "RGB"
+    assert (extracted[5:15, 120:180] == 255).all()
+    assert extracted.sum() == 10 * 60 * 3 * 255
+    assert general_functions.colour_lookup_table([255, 255, 100], 95, 95) is \
+        general_functions.colour_lookup_table((255, 255, 100), 95, 95)
+
+
+def test_contour_column_counts():
+    """Test the column histogram counts each contour once per column."""
+    rng = np.random.default_rng(0)
+    contours = [rng.integers(0, 60, size=(rng.integers(1, 30), 1, 2), dtype=np.int32) for _ in range(25)]
+
+    counts = general_functions.contour_column_counts(contours, 50)
+
+    expected = [sum(column in contour[:, 0, 0] for contour in contours) for column in range(50)]
+    assert counts.tolist() == expected
+    assert general_functions.contour_column_counts([], 5).tolist() == [0] * 5
+
+
+def test_remove_dense_columns():
+    """Test only the columns with more than max_count pixels are removed."""
+    image = np.zeros((30, 4))
+    image[:, 1] = 255
+    image[:10, 2] = 255
+    image[5, 3] = 255
+
+    pruned = general_functions.remove_dense_columns(image, max_count=15)
+
+    assert not pruned[:, 1].any()
+    assert pruned[:, 2].sum() == 10 * 255 and pruned[5, 3] == 255
+    assert image[:, 1].all()
+
+
+def test_split_tiled_ocr_data():
+    """Test OCR boxes of a tiled threshold sweep are mapped back to their tile."""
+    keys = ["level", "left", "top", "width", "height", "conf", "text"]
+    rows = [
+        (1, 0, 0, 30, 140, -1, ""),
+        (5, 2, 3, 10, 8, 90, "10"),  # Tile 0
+        (5, 4, 62, 10, 8, 90, "15"),  # Tile 1, 2 rows from its top
+        (5, 4, 45, 10, 8, 90, "-"),  # In the gap between the tiles
+    ]
+    tiled_data = {key: [row[i] for row in rows] for i, key in enumerate(keys)}
+
+    tiles = general_functions._split_tiled_ocr_data(tiled_data, (40, 30), 2, gap=20)
+
+    assert tiles[0]["text"] == ["", "10"] and tiles[1]["text"] == ["", "15"]
+    assert tiles[1]["top"] == [0, 2]
+    assert tiles[1]["height"][0] == 40
+
+
+def test_batched_label_sweep_parity(monkeypatch):
+    """Test the batched sweep picks the same threshold and labels as the sequential sweep."""
+    calls = []
+
+    def fake_image_to_data(image, lang=None, config=""):
+        # Each white blob is a label, read as "10" if it is tall and as "7" otherwise
+        calls.append(image.shape)
+        n, _, stats, _ = cv2.connectedComponentsWithStats((image > 0).astype(np.uint8))
+        data = {"level": [1], "left": [0], "top": [0], "width": [image.shape[1]],
+                "height": [image.shape[0]], "conf": [-1], "text": [""]}
+        for left, top, width, height, _ in stats[1:]:
+            for key, value in zip(data, [5, left, top, width, height, 90, "10" if height >= 6 else "7"]):
+                data[key].append(int(value) if key != "text" else value)
+        return data
+
+    monkeypatch.setattr(general_functions.ocr, "image_to_data", fake_image_to_data)
+    thresh_values = np.arange(100, 190, 5)
+    rows, columns = slice(10, 50), slice(20, 50)
+
+    for noise_level, expected_calls in [(150, 4), (90, 1), (255, 5)]:
+        gray = np.zeros((60, 80), dtype=np.uint8)
+        gray[15:23, 25:35] = 250  # Labels
+        gray[35:43, 25:35] = 250
+        gray[28:30, 40:44] = noise_level  # Read as a label until the threshold is above it
+        context = ImageContext(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+
+        calls.clear()
+        ROIAX, data = general_functions._label_sweep(context, rows, columns, thresh_values, "")
+        sequential_calls = len(calls)
+        calls.clear()
+        batched_ROIAX, batched_data = general_functions._batched_label_sweep(gray[rows, columns], thresh_values, "")
+
+        assert (batched_ROIAX == ROIAX).all()
+        assert batched_data == data
+        assert len(calls) == expected_calls <= sequential_calls
+
+
+def test_scan_type_test(tmp_path, monkeypatch):
+    """Test the scan type is read with a single OCR pass over the text band only."""
+    images = []
+
+    def fake_image_to_string(image, lang=None, config=""):
+        images.append(image)
+        return "Lt Ut-PI 1.2\n"
+
+    monkeypatch.setattr(general_functions.ocr, "image_to_string", fake_image_to_string)
+    img = synthetic_scan()[..., ::-1]  # BGR
+    path = str(tmp_path / "scan.png")
+    cv2.imwrite(path, img)
+
+    Fail, df = general_functions.scan_type_test(path)
+
+    assert Fail == 0 and len(images) == 1
+    assert images[0].shape == (int(img.shape[1] * 0.45), img.shape[1])
+    assert (images[0][5:15, 120:180] > 0).all() and not images[0][50:].any()
+
+    assert general_functions.scan_type_test(path, reduce_factor=2)[0] == 0
+    assert images[1].shape == (int(img.shape[1] / 2 * 0.45), img.shape[1] // 2)
+
+
+def test_target_distances():
+    """Test the batched distances match pairwise Levenshtein distances, capped at the cutoff."""
+    lines = ["Umb-PS 45.2 cm/s", "Umb-ED", "", "a much longer line of text that is not a target"]
+    targets = ["Umb-PS", "Umb-ED", "Umb-S/D"]
+
+    distances = general_functions.target_distances(lines, targets)
+    capped = general_functions.target_distances(lines, targets, score_cutoff=3)
+
+    expected = [[Levenshtein.distance(line, target) for target in targets] for line in lines]
+    assert distances.tolist() == expected
+    assert capped.tolist() == [[min(d, 4) for d in row] for row in expected]
+    assert general_functions.target_distances([], targets).shape == (0, 3)
+
+
+def test_cluster_1d():
+    """Test the values are grouped on gaps larger than the tolerance, with DBSCAN's labels."""
+    values = [30, 10, 12, 100, 15, 31, 60]
+
+    # 10, 12 and 15 chain through gaps of at most 5, the clusters are numbered in order of
+    # appearance and 60 and 100 have no neighbours
+    assert general_functions.cluster_1d(values, 5).tolist() == [0, 1, 1, -1, 1, 0, -1]
+    # A gap equal to the tolerance is within it
+    assert general_functions.cluster_1d([0, 5, 10], 5).tolist() == [0, 0, 0]
+    # With min_samples=3, only 12 is a core value and 10 and 15 join it as border values
+    assert general_functions.cluster_1d(values, 3, min_samples=3).tolist() == [-1, 0, 0, -1, 0, -1, -1]
+    assert general_functions.cluster_1d([], 5).tolist() == []
+
+
+def test_text_from_greyscale_crops_text_band(monkeypatch):
+    """Test only the text is read, and its boxes are moved back into the image."""
+    mask = np.zeros((200, 300, 3), dtype=np.uint8)
+    mask[40:60, 100:200] = 255  # Text
+    mask[150:160, 0:300] = 255  # Below the text band
+    COL = Image.fromarray(mask)
+    img = np.zeros((200, 300, 3), dtype=np.uint8)
+
+    read_sizes = []
+
+    def fake_image_to_data(image, lang=None, config=""):
+        read_sizes.append(image.size)
+        # A page and a single line of text, relative to the image read
+        return {
+            "left": [0, 10, 40], "top": [0, 10, 10], "width": [image.size[0], 25, 15],
+            "height": [image.size[1], 10, 10], "conf": [-1, 90, 90], "text": ["", "Umb-PS", "45"],
+        }
+
+    monkeypatch.setattr(general_functions.ocr, "image_to_data", fake_image_to_data)
+    general_functions.text_from_greyscale(img, COL)
+
+    margin = general_functions.TEXT_BAND_MARGIN
+    assert read_sizes == [(100 + 2 * margin, 20 + 2 * margin)]
+    assert (np.asarray(COL) == mask).all()  # The input is not changed
+    # The box of "Umb-PS" is drawn at its position in the image
+    left, top = 100 - margin + 10, 40 - margin + 10
+    assert (img[top, left:left + 25] == [0, 0, 255]).all()
+
+    assert general_functions._text_band_box(Image.fromarray(np.zeros((20, 30), np.uint8))) == (0, 0, 30, 20)
+
+
+def test_metric_check_dataframe():
+    """Test a DataFrame is corrected in place, and its float64 values divide by zero without raising."""
+    words = ["Umb-PS", "Umb-ED", "Umb-S/D", "Umb-PI", "Umb-RI", "Umb-MD", "Umb-TAmax", "Umb-HR"]
+    values = [500, 0, 3, 50, 0.5, 10, 30, 140]  # PS and PI are misread by a factor of 10, ED as 0
+    df = pd.DataFrame({"Line": range(1, 9), "Word": words, "Value": values, "Unit": [""] * 8}, dtype=object)
+
+    # The corrections made before ED divides by zero reach the caller's DataFrame
+    with pytest.raises(ZeroDivisionError):
+        general_functions.metric_check(df)
+    assert df["Value"].tolist()[:4] == [50, 0, 3, 0.5]
+
+    df = pd.DataFrame({"Line": range(1, 9), "Word": words, "Value": np.array(values, dtype=float), "Unit": [""] * 8})
+    checked = general_functions.metric_check(df)
+    assert checked is df and df["Value"].dtype == np.float64
+    assert df["Value"].tolist() == [50.0, 16.67, 3.0, 0.5, 0.67, 10.0, 27.78, 140.0]
+
+    # Missing metrics are added to a copy, with values of the same dtype
+    partial = df.iloc[:7].copy()
+    checked = general_functions.metric_check(partial)
+    assert checked is not partial and checked["Word"].tolist() == words
+    assert isinstance(checked["Value"].iloc[-1], np.float64)
+
+
+def test_metric_check_batch():
+    """Test each table gets the check of its scan type, as in text_from_greyscale, and keeps the
+    corrections made before a failure."""
+    umb = pd.DataFrame({
+        "Line": [1, 2, 3, 4, 5], "Word": ["Umb-PS", "Umb-ED", "Umb-S/D", "Umb-RI", "Umb-TAmax"],
+        "Value": [50.0, 20.0, 2.5, 0.9, 30.0], "Unit": ["cm/s", "cm/s", "", "", "cm/s"],
+    }, dtype=object)
+    dv = pd.DataFrame({
+        "Line": [1, 2, 3, 4, 5, 6], "Word": ["DV-S", "DV-D", "DV-a", "DV-S/a", "DV-PI", "DV-TAmax"],
+        "Value": [60.0, 20.0, 10.0, 9.0, 1.43, 26.67], "Unit": ["cm/s", "cm/s", "cm/s", "", "", "cm/s"],
+    }, dtype=object)
+    # The values of a and a/S were read from each other's lines, so a/S has the unit of a
+    swapped = pd.DataFrame({
+        "Line": range(1, 11),
+        "Word": ["DV-S", "DV-D", "DV-a", "DV-TAmax", "DV-S/a", "DV-a/S", "DV-PI", "DV-PLI", "DV-PVIV", "DV-HR"],
+        "Value": [60.0, 20.0, 0.17, 26.67, 6.0, 10.0, 1.43, 1.0, 1.0, 140.0],
+        "Unit": ["cm/s", "cm/s", "", "cm/s", "", "cm/s", "", "", "", "bpm"],
+    }, dtype=object)
+    failing = pd.DataFrame({
+        "Line": range(1, 9),
+        "Word": ["Umb-PS", "Umb-ED", "Umb-S/D", "Umb-PI", "Umb-RI", "Umb-MD", "Umb-TAmax", "Umb-HR"],
+        "Value": [500, 0, 3, 50, 0.5, 10, 30, 140], "Unit": [""] * 8,
+    }, dtype=object)
+    unknown = pd.DataFrame({"Line": [1], "Word": ["HR"], "Value": [140.0], "Unit": ["bpm"]}, dtype=object)
+
+    checked = general_functions.metric_check_batch([umb, dv, swapped, failing, unknown])
+
+    # S/D and TAmax agree with PS and ED, so the inconsistent RI is recalculated from them
+    values = dict(zip(checked[0]["Word"], checked[0]["Value"]))
+    assert values["Umb-RI"] == 0.6 and values["Umb-S/D"] == 2.5 and "Umb-HR" in values
+    # As in text_from_greyscale, the swap needs the a/S line, so without it the check fails
+    pd.testing.assert_frame_equal(checked[1], dv)
+    # Once swapped back, a and a/S agree with the other metrics
+    values = dict(zip(checked[2]["Word"], zip(checked[2]["Value"], checked[2]["Unit"])))
+    assert values["DV-a"] == (10.0, "cm/s") and values["DV-a/S"] == (0.17, "")
+
+    # ED divides by zero after PS and PI are corrected
+    assert checked[3]["Value"].tolist()[:4] == [50, 0, 3, 0.5]
+    pd.testing.assert_frame_equal(checked[4], unknown)
+
+    records = TextRecords.from_dataframe(swapped)
+    assert general_functions.metric_check_batch([records])[0] is records and records.value("a") == 10.0
+
+
+def test_consistent_hypotheses():
+    """Test the first hypothesis of each metric within its tolerance is found."""
+    hypotheses = general_functions._hypothesis_values({
+        "ED_from_SoverD": None, "RI_from_ED_from_SoverD": None, "TAmax_from_ED_from_RI": 30.0,
+    })
+    extracted = {"SoverD": None, "RI": 0.6, "TAmax": 31.0}
+    tolerances = general_functions.METRIC_CHECK_TOLERANCES
+
+    # A missing hypothesis is kept as it is when the first of the stage is missing
+    with pytest.raises(TypeError):
+        general_functions._consistent_hypotheses(extracted, hypotheses, tolerances)
+
+    hypotheses = general_functions._hypothesis_values({"ED_from_RI": 20.0, "RI_from_ED_from_SoverD": None,
+                                                        "TAmax_from_ED_from_SoverD": 40.0,
+                                                        "TAmax_from_ED_from_RI": 30.0})
+    assert np.isnan(hypotheses["RI_from_ED_from_SoverD"])
+    assert general_functions._consistent_hypotheses(extracted, hypotheses, tolerances) == ["TAmax_from_ED_from_RI"]
@@ -0,0 +1,31 @@
+"""Test the per-image context."""
+
+# Module imports
+import cv2
+import numpy as np
+import pytest
+
+# Local imports
+from usseg.image_context import ImageContext
+
+
+def test_image_context():
+    """Test derived images are computed once and shared read-only."""
+    bgr = np.random.default_rng(0).integers(0, 256, size=(40, 60, 3), dtype=np.uint8)
+    context = ImageContext(bgr)
+
+    assert np.array_equal(context.gray, cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY))
+    assert np.array_equal(context.hsv, cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV))
+    assert np.array_equal(context.rgb, bgr[..., ::-1])
+    assert np.shares_memory(context.rgb, bgr)
+
+    thresholded_image = context.threshold(127)
+    assert np.array_equal(thresholded_image, cv2.threshold(context.gray, 127, 255, 0)[1])
+    assert context.threshold(np.int64(127)) is thresholded_image
+    assert context.gray is context.gray
+
+    with pytest.raises(ValueError):
+        thresholded_image[0, 0] = 0
+
+    assert ImageContext.wrap(context) is context
+    assert np.array_equal(ImageContext.from_rgb(bgr[..., ::-1]).bgr, bgr)
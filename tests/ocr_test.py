@@ -0,0 +1,90 @@
+"""Test the OCR backends."""
+
+# Module imports
+import numpy as np
+import pytest
+
+# Local imports
+from usseg import ocr
+
+
+class RecordingBackend:
+    """Backend that records its calls instead of running tesseract."""
+
+    def __init__(self):
+        self.calls = []
+
+    def image_to_data(self, image, lang=None, config=""):
+        self.calls.append(("data", lang, config))
+        return {"text": ["10"]}
+
+    def image_to_string(self, image, lang=None, config=""):
+        self.calls.append(("string", lang, config))
+        return "10\n"
+
+
+def test_parse_config():
+    """Test the pytesseract config strings used in usseg are split into their parts."""
+    assert ocr.parse_config("--psm 11 -c tessedit_char_whitelist=-0123456789") == (
+        11, None, {"tessedit_char_whitelist": "-0123456789"}, []
+    )
+    assert ocr.parse_config("--oem 1 --psm 3 -c tessedit_char_blacklist=l,!_|=$") == (
+        3, 1, {"tessedit_char_blacklist": "l,!_|=$"}, []
+    )
+    assert ocr.parse_config("--psm 7 --oem 3 configfile C:/tess/patient_id.txt") == (
+        7, 3, {}, ["C:/tess/patient_id.txt"]
+    )
+    assert ocr.parse_config("") == (None, None, {}, [])
+
+
+def test_set_backend():
+    """Test the OCR calls are forwarded to the backend that is set."""
+    previous, previous_cache = ocr.get_backend(), ocr.get_cache()
+    backend = RecordingBackend()
+    try:
+        ocr.set_backend(backend)
+        ocr.set_cache(None)
+        image = np.zeros((10, 10), dtype=np.uint8)
+
+        assert ocr.image_to_data(image, config="--psm 11") == {"text": ["10"]}
+        assert ocr.image_to_string(image, lang="eng") == "10\n"
+        assert backend.calls == [("data", None, "--psm 11"), ("string", "eng", "")]
+
+        assert isinstance(ocr.configure({"ocr": {"backend": "pytesseract"}}), ocr.PytesseractBackend)
+        assert ocr.configure({}) is ocr.get_backend()
+        with pytest.raises(ValueError):
+            ocr.set_backend("not-a-backend")
+    finally:
+        ocr.set_backend(previous)
+        ocr.set_cache(previous_cache)
+
+
+def test_ocr_cache(tmp_path):
+    """Test repeated OCR of the same pixels and config is served from the cache tiers."""
+    previous_backend, previous_cache = ocr.get_backend(), ocr.get_cache()
+    backend = RecordingBackend()
+    try:
+        ocr.set_backend(backend)
+        cache = ocr.set_cache(ocr.OCRCache(max_entries=1, cache_dir=str(tmp_path)))
+        image = np.zeros((10, 10), dtype=np.uint8)
+        other = np.ones((10, 10), dtype=np.uint8)
+
+        first = ocr.image_to_data(image, config="--psm 11")
+        first["text"].append("changed")  # Callers get their own copy
+        assert ocr.image_to_data(image.copy(), config="--psm 11") == {"text": ["10"]}
+        ocr.image_to_data(image, config="--psm 3")  # Different config
+        ocr.image_to_data(other, config="--psm 11")  # Different pixels, evicts the others from memory
+        ocr.image_to_data(image, config="--psm 11")  # Read back from disk
+
+        assert len(backend.calls) == 3
+        assert cache.stats() == {
+            "memory_hits": 1, "disk_hits": 1, "misses": 3, "hit_rate": 0.4, "entries": 1,
+        }
+
+        # A new cache on the same directory reuses the results of a previous run
+        ocr.set_cache(ocr.OCRCache(cache_dir=str(tmp_path)))
+        assert ocr.image_to_string(image) == "10\n" and ocr.image_to_string(image) == "10\n"
+        assert len(backend.calls) == 4 and ocr.get_cache().stats()["memory_hits"] == 1
+    finally:
+        ocr.set_backend(previous_backend)
+        ocr.set_cache(previous_cache)
@@ -0,0 +1,99 @@
+"""Test the search for likely ultrasound images."""
+
+# Python imports
+import os
+
+# Module imports
+import cv2
+import numpy as np
+
+# Local imports
+from usseg import general_functions, organise_files
+
+
+def test_get_likely_us_manifest(tmp_path, monkeypatch):
+    """Test a manifest run only classifies new or changed files and gives the same paths."""
+    checked = []
+
+    def fake_scan_type_test(file_path):
+        checked.append(os.path.basename(file_path))
+        with open(file_path) as f:
+            return int(f.read() != "us"), None
+
+    monkeypatch.setattr(general_functions, "scan_type_test", fake_scan_type_test)
+    for patient, name, content in [("1234", "a.JPG", "us"), ("1234", "b.JPG", "other"), ("5678", "c.JPG", "us")]:
+        os.makedirs(tmp_path / patient, exist_ok=True)
+        (tmp_path / patient / name).write_text(content)
+    manifest_path = str(tmp_path / "manifest.pkl")
+
+    def run(**kwargs):
+        return organise_files.get_likely_us(str(tmp_path), pickle_path=False, use_parallel=False, **kwargs)
+
+    expected = run()
+    assert sorted(checked) == ["a.JPG", "b.JPG", "c.JPG"]
+
+    checked.clear()
+    assert run(manifest_path=manifest_path) == expected
+    assert run(manifest_path=manifest_path) == expected
+    assert sorted(checked) == ["a.JPG", "b.JPG", "c.JPG"]  # Only classified on the first run
+
+    checked.clear()
+    (tmp_path / "1234" / "b.JPG").write_text("us")
+    os.utime(tmp_path / "1234" / "b.JPG", ns=(0, 0))
+    os.remove(tmp_path / "5678" / "c.JPG")
+    changed = run(manifest_path=manifest_path)
+    assert checked == ["b.JPG"]
+    assert sorted(changed) == sorted([str(tmp_path / "1234" / "a.JPG"), str(tmp_path / "1234" / "b.JPG")])
+    assert set(organise_files.load_manifest(manifest_path)) == {
+        str(tmp_path / "1234" / "a.JPG"), str(tmp_path / "1234" / "b.JPG")
+    }
+
+
+def test_manifest_prefilter_thresholds(tmp_path, monkeypatch):
+    """Test a file rejected by the prefilter is checked again when the prefilter changes."""
+    checked = []
+
+    def fake_scan_type_test(file_path):
+        checked.append(os.path.basename(file_path))
+        return 0, None
+
+    monkeypatch.setattr(general_functions, "scan_type_test", fake_scan_type_test)
+    os.makedirs(tmp_path / "1234")
+    path = str(tmp_path / "1234" / "small.JPG")
+    cv2.imwrite(path, np.full((100, 120, 3), 200, dtype=np.uint8))  # Rejected on its dimensions
+
+    def run(prefilter, manifest_name):
+        return organise_files.get_likely_us(
+            str(tmp_path), pickle_path=False, use_parallel=False,
+            manifest_path=str(tmp_path / manifest_name), prefilter=prefilter,
+        )
+
+    # Turning the prefilter off
+    assert run(True, "off.pkl") == [] and run(True, "off.pkl") == []
+    assert run(False, "off.pkl") == [path]
+    assert checked == ["small.JPG"]
+
+    # Changing the thresholds
+    checked.clear()
+    assert run(True, "changed.pkl") == []
+    assert run({"min_width": 100, "min_height": 100, "min_text_fraction": 0}, "changed.pkl") == [path]
+    assert checked == ["small.JPG"]
+
+    # The scan type test does not depend on the prefilter, so its result is kept
+    assert run(True, "changed.pkl") == [path] and checked == ["small.JPG"]
+
+
+def test_prefilter_file(tmp_path):
+    """Test the doppler test images pass the prefilter and clear non-doppler images do not."""
+    for name in ["Lt_test_image.png", "Rt_test_image.png", "Umb_test_image.png", "left_ut_image.png"]:
+        assert organise_files.prefilter_file(os.path.join("tests", "resources", name)) is None
+
+    small = np.full((100, 120, 3), 200, dtype=np.uint8)
+    blank = np.zeros((600, 800, 3), dtype=np.uint8)
+    text_only = blank.copy()
+    text_only[50:100, 100:400] = [100, 255, 255]  # BGR yellow
+    for image, stage in [(small, "dimensions"), (blank, "text"), (text_only, "waveform")]:
+        path = str(tmp_path / f"{stage}.png")
+        cv2.imwrite(path, image)
+        assert organise_files.prefilter_file(path) == stage
+    assert organise_files.prefilter_file(path, {"min_waveform_fraction": 0}) is None
@@ -0,0 +1,51 @@
+"""Test the writer of the output images."""
+
+# Module imports
+import cv2
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+# Local imports
+from usseg.output_writer import OutputWriter
+from usseg.segment_files import SegmentationResult
+
+matplotlib.use("Agg")
+
+
+def test_output_writer(tmp_path):
+    """Test images are written losslessly at native size and figures at the digitized size."""
+    image = np.random.default_rng(0).integers(0, 256, size=(30, 40, 4), dtype=np.uint8)
+    figure = plt.figure()
+    plt.plot([0, 1, 2], [3, 1, 2])
+
+    with OutputWriter(png_compression=1, digitized_size=(160, 120)) as writer:
+        writer.write_image(str(tmp_path / "annotated.png"), image)
+        writer.write_figure(str(tmp_path / "digitized.png"), figure)
+        writer.write_image(str(tmp_path / "missing" / "failed.png"), image)  # Logged, not raised
+    plt.close(figure)
+
+    written = cv2.imread(str(tmp_path / "annotated.png"), cv2.IMREAD_UNCHANGED)
+    assert np.array_equal(cv2.cvtColor(written, cv2.COLOR_BGRA2RGBA), image)
+    assert cv2.imread(str(tmp_path / "digitized.png")).shape == (120, 160, 3)
+
+
+def test_artifact_policy():
+    """Test which scans get their images written under each artifact policy."""
+    failed = SegmentationResult("failed.png", failed_stages=["correction"])
+    passed = [SegmentationResult(f"scan_{i}.png") for i in range(1000)]
+
+    assert OutputWriter(background=False).should_write(passed[0])
+    assert not OutputWriter(background=False, artifacts="none").should_write(failed)
+
+    failures = OutputWriter(background=False, artifacts="failures")
+    assert failures.should_write(failed) and not failures.should_write(passed[0])
+
+    sampled = OutputWriter(background=False, artifacts="sampled", sample_rate=0.1)
+    chosen = [result.filename for result in passed if sampled.should_write(result)]
+    assert 50 < len(chosen) < 150
+    assert chosen == [result.filename for result in passed if sampled.should_write(result)]
+
+    with pytest.raises(ValueError):
+        OutputWriter(artifacts="some")
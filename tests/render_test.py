@@ -0,0 +1,57 @@
+"""Test the rendering of skipped images from their render state."""
+
+# Module imports
+import cv2
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+
+# Local imports
+from usseg import general_functions
+from usseg import render
+
+matplotlib.use("Agg")
+
+
+def test_render_artifacts(tmp_path):
+    """Test the images rendered from a render state match the images written directly."""
+    img = np.zeros((120, 200, 3), dtype=np.uint8)
+    img[50:100, 30:170] = 200
+    scan_path = str(tmp_path / "scan.png")
+    cv2.imwrite(scan_path, img)
+
+    mask = np.zeros(img.shape[:2], dtype=int)
+    mask[60:90, 50:150] = 1
+    left_axis = np.zeros(img.shape[:2])
+    left_axis[60:62, 5:10] = 255
+    right_axis = np.zeros(img.shape[:2])
+    right_axis[70:72, 190:195] = 255
+    annotation = dict(
+        refined_segmentation_mask=mask,
+        Left_dimensions=[0, 29, 40, 119],
+        Right_dimensions=[170, 199, 40, 110],
+        Waveform_dimensions=[30, 169, 50, 100],
+        Left_axis=left_axis,
+        Right_axis=right_axis,
+    )
+    figure = plt.figure()
+    plt.plot([0, 1, 2], [3, 1, 2], "-")
+    plt.plot([0.5, 1.5], [2, 2], "r+")
+    plt.xlabel("Time (s)")
+
+    state_path = str(tmp_path / ("scan" + render.RENDER_STATE_SUFFIX))
+    render.save_render_state(state_path, scan_path, annotation, figure)
+    plt.close(figure)
+    output_dir = tmp_path / "rendered"
+    output_dir.mkdir()
+    annotated_path, digitized_path = render.render_artifacts(state_path, str(output_dir))
+
+    expected = general_functions.annotate(input_image_obj=img, **annotation)
+    annotated = cv2.cvtColor(cv2.imread(annotated_path, cv2.IMREAD_UNCHANGED), cv2.COLOR_BGRA2RGBA)
+    assert annotated_path == str(output_dir / "scan_Annotated.png")
+    assert np.array_equal(annotated, expected)
+    assert cv2.imread(digitized_path).shape == (480, 640, 3)
+
+    # A scan that failed before digitization only has its annotation rendered
+    render.save_render_state(state_path, scan_path, annotation)
+    assert render.render_artifacts(state_path)[1] is None
@@ -0,0 +1,117 @@
+"""Test the columnar store of segmentation results."""
+
+# Module imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from usseg.result_store import ResultStore
+from usseg.segment_files import SegmentationResult
+
+
+def make_results():
+    """Creates the results of three images, the second of which failed text extraction."""
+    table = pd.DataFrame({
+        "Line": [1, 2], "Word": ["PS", "RI"], "Value": [45.2, 0.61], "Digitized Value": [44.0, ""],
+        "Unit": ["cm/s", ""],
+    })
+    return [
+        SegmentationResult("a.png", "a_D.png", "a_A.png", table, 0, [], None, np.array([[0, 1, 2], [3, 4, 5]])),
+        SegmentationResult("b.png", fails=1, failed_stages=["text extraction", "correction"]),
+        SegmentationResult("c.png", annotated_scan="c_A.png", text_data=table.iloc[:1], waveform=np.ones((2, 4))),
+    ]
+
+
+def test_result_store(tmp_path):
+    """Test results are appended and read back by image and column."""
+    path = str(tmp_path / "store")
+    results = make_results()
+    with ResultStore(path) as store:
+        assert [store.append(result) for result in results[:2]] == [0, 1]
+    with ResultStore(path) as store:
+        assert store.append(results[2]) == 2
+
+    store = ResultStore(path)
+    scans = store.scans()
+    assert scans["filename"].tolist() == ["a.png", "b.png", "c.png"]
+    assert scans["digitized_scan"].tolist() == ["a_D.png", None, None]
+    assert scans["failed_stages"][1] == "text extraction;correction"
+
+    assert store.text_data(1) is None
+    text_data = store.text_data(0)
+    assert text_data["Word"].tolist() == ["PS", "RI"] and text_data["Value"].tolist() == [45.2, 0.61]
+    assert text_data["Digitized Value"][0] == 44.0 and np.isnan(text_data["Digitized Value"][1])
+    assert store.metrics([2], columns=["scan_id", "Word"]).values.tolist() == [[2, "PS"]]
+    assert store.metrics()["scan_id"].tolist() == [0, 0, 2]
+
+    x, y = store.waveform(0)
+    assert x.dtype == np.float32 and x.tolist() == [0, 1, 2] and y.tolist() == [3, 4, 5]
+    assert store.waveform(1) == (None, None)
+    assert store.waveform(2)[1].tolist() == [1, 1, 1, 1]
+
+
+def test_result_store_interrupted(tmp_path):
+    """Test the rows of an image that was interrupted part way are dropped on the next append."""
+    path = str(tmp_path / "store")
+    results = make_results()
+    with ResultStore(path) as store:
+        store.append(results[0])
+    # Interrupted after writing the metrics and waveform of an image, but not its scan row
+    with open(str(tmp_path / "store" / "metrics.csv"), "a") as f:
+        f.write("1,1,PS,1.0,,cm/s\n")
+    with open(str(tmp_path / "store" / "waveform_x.f32"), "ab") as f:
+        f.write(np.zeros(3, dtype=np.float32).tobytes())
+    with open(str(tmp_path / "store" / "scans.csv"), "a") as f:
+        f.write("1,b.p")
+
+    with ResultStore(path) as store:
+        assert store.append(results[2]) == 1
+
+    assert store.scans()["filename"].tolist() == ["a.png", "c.png"]
+    assert store.metrics()["scan_id"].tolist() == [0, 0, 1]
+    assert store.waveform(1)[0].tolist() == [1, 1, 1, 1]
+
+
+def test_result_store_index(tmp_path, monkeypatch):
+    """Test the positions of the images are read once, until the next append or clear."""
+    path = str(tmp_path / "store")
+    results = make_results()
+    store = ResultStore(path)
+    store.append(results[0])
+
+    reads = []
+    read_csv = pd.read_csv
+    monkeypatch.setattr(pd, "read_csv", lambda *args, **kwargs: reads.append(args[0]) or read_csv(*args, **kwargs))
+    scans_path = str(tmp_path / "store" / "scans.csv")
+
+    assert store.text_data(0)["Word"].tolist() == ["PS", "RI"]
+    assert store.waveform(0)[0].tolist() == [0, 1, 2]
+    assert store.metrics([0])["scan_id"].tolist() == [0, 0]
+    assert reads.count(scans_path) == 1
+    store.append(results[2])
+    assert store.waveform(1)[0].tolist() == [1, 1, 1, 1] and reads.count(scans_path) == 2
+
+    store.clear()
+    assert store.append(results[1]) == 0
+    assert store.scans()["filename"].tolist() == ["b.png"] and store.text_data(0) is None
+    store.close()
+
+
+def test_result_store_replaced(tmp_path):
+    """Test an image appended again replaces its earlier rows, which stay readable by scan_id."""
+    path = str(tmp_path / "store")
+    results = make_results()
+    store = ResultStore(path)
+    assert store.scans(["filename"]).empty
+
+    for result in results[:2]:
+        store.append(result)
+    again = SegmentationResult("a.png", fails=1, failed_stages=["correction"], text_data=results[2].text_data)
+    assert store.append(again) == 2
+    store.close()
+
+    scans = store.scans(["scan_id", "filename", "fails"])
+    assert scans.values.tolist() == [[1, "b.png", 1], [2, "a.png", 1]]
+    assert len(store.scans(replaced=True)) == 3
+    assert store.metrics()["scan_id"].tolist() == [2]
+    assert store.text_data(0)["Word"].tolist() == ["PS", "RI"]
@@ -0,0 +1,245 @@
+"""Test the segmentation of a list of files."""
+
+# Python imports
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import types
+
+# Module imports
+import cv2
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+# Local imports
+from usseg import general_functions
+from usseg import ocr
+from usseg import segment_files
+from usseg.journal import SegmentationJournal
+from usseg.output_writer import OutputWriter
+from usseg.result_store import ResultStore
+
+
+def test_segment_failures_stay_aligned(tmp_path):
+    """Test each image gives one entry per output list, in input order, in serial and parallel."""
+    filenames = [str(tmp_path / f"missing_{i}.png") for i in range(3)]
+
+    serial = segment_files.segment(filenames, output_dir=str(tmp_path) + "/", pickle_path=False)
+    parallel = segment_files.segment(
+        filenames, output_dir=str(tmp_path) + "/", pickle_path=False, n_workers=2,
+        store_path=str(tmp_path / "store"),
+    )
+
+    assert serial == parallel == (filenames, [None] * 3, [None] * 3, [None] * 3)
+    assert ResultStore(str(tmp_path / "store")).scans()["filename"].tolist() == filenames
+
+
+def test_segment_iter(tmp_path):
+    """Test results are streamed one per image, and stopping early leaves the rest unsegmented."""
+    filenames = (str(tmp_path / f"missing_{i}.png") for i in range(5))
+
+    results = segment_files.segment_iter(filenames, output_dir=str(tmp_path) + "/", n_workers=2)
+    first = next(results)
+    results.close()
+
+    assert first.filename == str(tmp_path / "missing_0.png")
+    assert first.annotated_scan is None and first.text_data is None
+
+    unordered = segment_files.segment_iter(
+        [str(tmp_path / f"missing_{i}.png") for i in range(4)],
+        output_dir=str(tmp_path) + "/", n_workers=2, ordered=False, max_pending=1,
+    )
+    assert sorted(result.filename for result in unordered) == [
+        str(tmp_path / f"missing_{i}.png") for i in range(4)
+    ]
+
+
+def test_segment_resume(tmp_path):
+    """Test a resumed run only segments the images missing from the journal."""
+    journal_path = str(tmp_path / "journal.jsonl")
+    filenames = [str(tmp_path / f"missing_{i}.png") for i in range(3)]
+    table = pd.DataFrame({"Line": [1], "Word": ["PS"], "Value": [45.2], "Unit": ["cm/s"]})
+    done = segment_files.SegmentationResult(filenames[0], "digitized.png", "annotated.png", table, 0)
+    with SegmentationJournal(journal_path) as journal:
+        journal.append(done)
+    with open(journal_path, "a") as f:
+        f.write('{"filename": "' + filenames[1])  # Interrupted while writing the second image
+
+    results = list(segment_files.segment_iter(
+        filenames, output_dir=str(tmp_path) + "/", journal_path=journal_path, resume=True
+    ))
+
+    assert [result.filename for result in results] == filenames
+    assert results[0].digitized_scan == "digitized.png"
+    pd.testing.assert_frame_equal(results[0].text_data, table)
+    assert results[1].failed_stages[0] == "text extraction"
+
+    records = SegmentationJournal(journal_path).load()
+    assert list(records) == filenames
+    assert records[filenames[2]]["failed_stages"] == results[2].failed_stages
+    with open(journal_path) as f:
+        assert len(f.readlines()) == 3  # The interrupted record was compacted away
+
+
+def test_segment_resume_retries_failures(tmp_path):
+    """Test a resumed run segments the images whose outputs failed to be written again, and the
+    images with any failed stage if asked to."""
+    journal_path = str(tmp_path / "journal.jsonl")
+    filenames = [str(tmp_path / f"missing_{i}.png") for i in range(3)]
+    with SegmentationJournal(journal_path) as journal:
+        journal.append(segment_files.SegmentationResult(filenames[0], "digitized.png", fails=0))
+        journal.append(segment_files.SegmentationResult(
+            filenames[1], "digitized.png", fails=1, failed_stages=["axes search"]
+        ))
+        journal.append(segment_files.SegmentationResult(
+            filenames[2], "digitized.png", fails=1, failed_stages=["annotated image"]
+        ))
+
+    kept = list(segment_files.segment_iter(
+        filenames, output_dir=str(tmp_path) + "/", journal_path=journal_path, resume=True,
+    ))
+    retried = list(segment_files.segment_iter(
+        filenames, output_dir=str(tmp_path) + "/", journal_path=journal_path, resume=True, retry_failed=True,
+    ))
+
+    assert [result.digitized_scan for result in kept] == ["digitized.png", "digitized.png", None]
+    assert [result.resumed for result in kept] == [True, True, False]
+    assert retried[0].digitized_scan == "digitized.png"
+    assert retried[1].digitized_scan is None and retried[1].failed_stages[0] == "text extraction"
+    # The record of the retry replaces the failed one
+    assert SegmentationJournal(journal_path).load()[filenames[1]]["failed_stages"] == retried[1].failed_stages
+
+
+def _worker_backend():
+    """Returns the class and tessdata path of the OCR backend of a worker process."""
+    backend = ocr.get_backend()
+    return type(backend).__name__, backend._tessdata_path
+
+
+def test_worker_ocr_backend(monkeypatch):
+    """Test worker processes rebuild the OCR backend with the options it was configured with."""
+    monkeypatch.setitem(sys.modules, "tesserocr", types.ModuleType("tesserocr"))  # Inherited by the workers
+    previous = ocr.get_backend()
+    try:
+        ocr.configure({"ocr": {"backend": "tesserocr", "tessdata_path": "/opt/tessdata"}})
+        with ProcessPoolExecutor(
+            max_workers=1, initializer=segment_files._init_worker, initargs=segment_files._worker_initargs()
+        ) as executor:
+            assert executor.submit(_worker_backend).result() == ("TesserocrBackend", "/opt/tessdata")
+    finally:
+        ocr.set_backend(previous)
+
+
+def test_write_artifacts_failures(tmp_path, monkeypatch):
+    """Test a failed write is recorded as a failed stage, without the path of the file."""
+    monkeypatch.setattr(general_functions, "annotate", lambda **kwargs: np.zeros((4, 4, 3), dtype=np.uint8))
+    missing_stem = str(tmp_path / "missing" / "scan")  # Its directory does not exist, so writes fail
+    context = types.SimpleNamespace(rgb=None)
+    figure = plt.figure()
+
+    for background in [False, True]:
+        result = segment_files.SegmentationResult("scan.png")
+        with OutputWriter(background=background) as writer:
+            result.fails = segment_files._write_artifacts(result, missing_stem, writer, context, {}, figure)
+            segment_files._report_failed_writes(result, writer)
+        assert result.annotated_scan is None and result.digitized_scan is None
+        assert result.failed_stages == ["annotated image", "digitized image"] and result.fails == 2
+
+    result = segment_files.SegmentationResult("scan.png")
+    writer = OutputWriter(background=False)
+    written = segment_files._write_artifacts(result, str(tmp_path / "scan"), writer, context, {}, figure)
+    assert written == 0 and result.annotated_scan == str(tmp_path / "scan_Annotated.png")
+
+    result = segment_files.SegmentationResult("scan.png")
+    skipped = OutputWriter(background=False, artifacts="none")
+    assert segment_files._write_artifacts(result, missing_stem, skipped, context, {}, figure) == 1
+    assert result.render_state is None and result.failed_stages == ["render state"]
+    plt.close(figure)
+
+
+def test_segment_resume_store(tmp_path):
+    """Test rerunning or resuming a run replaces the rows of the images it segments again."""
+    journal_path = str(tmp_path / "journal.jsonl")
+    store_path = str(tmp_path / "store")
+    filenames = [str(tmp_path / f"missing_{i}.png") for i in range(3)]
+    with SegmentationJournal(journal_path) as journal:
+        journal.append(segment_files.SegmentationResult(filenames[0], "digitized.png", fails=0))
+    with ResultStore(store_path) as store:
+        store.append(segment_files.SegmentationResult("other.png"))  # From an earlier run
+
+    rows = []
+    for resume in [True, True, False]:
+        segment_files.segment(
+            filenames, output_dir=str(tmp_path) + "/", pickle_path=False, journal_path=journal_path,
+            resume=resume, store_path=store_path,
+        )
+        store = ResultStore(store_path)
+        scans = store.scans(["filename", "digitized_scan"])
+        assert scans["filename"].tolist() == ["other.png"] + filenames
+        rows.append(len(store.scans(replaced=True)))
+
+    # The second run takes every image from the journal, and the third segments them all again
+    assert rows == [4, 4, 7]
+    assert scans["digitized_scan"][1] is None
+
+
+def _segment_with_cache_miss(input_image_filename, output_dir, writer=None, batched_threshold_sweep=False):
+    """Stands in for segment_image, looking up a result that is not in the OCR cache."""
+    ocr.get_cache().get(input_image_filename)
+    return segment_files.SegmentationResult(input_image_filename)
+
+
+def test_worker_cache_stats(tmp_path, monkeypatch):
+    """Test the OCR cache lookups of the worker processes are added to the cache of this process."""
+    monkeypatch.setattr(segment_files, "segment_image", _segment_with_cache_miss)  # Inherited by the workers
+    previous = ocr.get_cache()
+    try:
+        cache = ocr.set_cache(ocr.OCRCache())
+        filenames = [str(tmp_path / f"missing_{i}.png") for i in range(3)]
+        results = list(segment_files.segment_iter(filenames, output_dir=str(tmp_path) + "/", n_workers=2))
+    finally:
+        ocr.set_cache(previous)
+
+    assert [result.filename for result in results] == filenames
+    assert cache.stats()["misses"] == 3 and cache.stats()["memory_hits"] == 0
+
+
+def test_segment_image_single_decode(tmp_path, monkeypatch):
+    """Test each stage gets the arrays of a separate decode, and the text boxes drawn stay in the OCR copy."""
+    filename = str(tmp_path / "scan.png")
+    rng = np.random.default_rng(0)
+    cv2.imwrite(filename, rng.integers(0, 256, (20, 30, 4), dtype=np.uint8))  # With an alpha channel
+    received = {}
+
+    def draw_text_boxes(img, COL):
+        received["text"] = img.copy()
+        img[:] = 0  # As the boxes are drawn around the text found
+        return 0, None
+
+    def record(name, returned):
+        def stage(*args, **kwargs):
+            received[name] = np.array(kwargs.get("input_image_obj", args[0] if args else None))
+            return returned
+        return stage
+
+    monkeypatch.setattr(general_functions, "colour_extract_vectorized", record("colour", None))
+    monkeypatch.setattr(general_functions, "text_from_greyscale", draw_text_boxes)
+    monkeypatch.setattr(general_functions, "initial_segmentation", record("segmentation", (None, 0, 1, 0, 1)))
+    monkeypatch.setattr(general_functions, "define_end_rois", lambda *args: (None, None))
+    monkeypatch.setattr(general_functions, "search_for_ticks", lambda *args: (None,) * 12)
+    monkeypatch.setattr(general_functions, "search_for_labels", lambda *args, **kwargs: (None,) * 4)
+    monkeypatch.setattr(general_functions, "segment_refinement", lambda *args: (None, None, None))
+    monkeypatch.setattr(general_functions, "plot_digitized_data", lambda *args: ([0, 1], [0, 1], 0))
+    monkeypatch.setattr(general_functions, "plot_correction", lambda Xplot, Yplot, df: df)
+    monkeypatch.setattr(
+        general_functions, "annotate", record("annotate", np.zeros((20, 30, 3), dtype=np.uint8))
+    )
+
+    result = segment_files.segment_image(filename, str(tmp_path) + "/", OutputWriter(background=False))
+
+    assert result.failed_stages == [] and result.annotated_scan is not None
+    rgb = np.array(Image.open(filename).convert("RGB"))
+    np.testing.assert_array_equal(received["text"], cv2.imread(filename))
+    for name in ["colour", "segmentation", "annotate"]:
+        np.testing.assert_array_equal(received[name], rgb)
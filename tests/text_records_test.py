@@ -0,0 +1,46 @@
+"""Test the records of the metrics read from the text of a scan."""
+
+# Module imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from usseg import general_functions
+from usseg.text_records import TextRecords
+
+
+def test_text_records():
+    """Test metrics are looked up by name and the DataFrame keeps the values as they were read."""
+    records = TextRecords()
+    records.append(2, "Umb-S/D", 3.1, "")
+    records.append(1, "Umb-PS", 45.2, "cm/s")
+    records.append(3, "Umb-HR", 0, 0)
+
+    assert records.value("PS") == 45.2 and records.unit("PS") == "cm/s"
+    assert "S/D" in records and "ED" not in records
+    assert records.value("ED", None) is None
+    records.set_value("S/D", 3.0)
+    records.order_by(["Umb-PS", "Umb-ED", "Umb-S/D"])
+    copy = records.copy()
+    copy.add_missing(["Umb-PS", "Umb-ED"])
+
+    df = records.to_dataframe()
+    assert df.values.tolist() == [[1, "Umb-PS", 45.2, "cm/s"], [2, "Umb-S/D", 3.0, ""]]
+    assert len(copy) == 3 and np.isnan(copy.records[2].line) and copy.value("ED") == 0
+    assert TextRecords.from_dataframe(df).words() == ["Umb-PS", "Umb-S/D"]
+
+
+def test_metric_check_types():
+    """Test the metric check corrects DataFrames and records alike."""
+    df = pd.DataFrame({
+        "Line": [1, 2, 3, 4, 5], "Word": ["Umb-PS", "Umb-ED", "Umb-S/D", "Umb-RI", "Umb-TAmax"],
+        "Value": [50.0, 20.0, 2.5, 0.6, 300.0], "Unit": ["cm/s", "cm/s", "", "", "cm/s"],
+    }, dtype=object)
+
+    checked = general_functions.metric_check(df)
+    records = general_functions.metric_check(TextRecords.from_dataframe(df))
+
+    assert isinstance(checked, pd.DataFrame) and checked.equals(records.to_dataframe())
+    assert checked["Word"].tolist()[5:] == ["Umb-PI", "Umb-MD", "Umb-HR"]
+    assert df["Value"].tolist()[4] == 300.0  # The input is left unchanged
+    assert checked.loc[checked["Word"] == "Umb-TAmax", "Value"].item() == 30.0
@@ -0,0 +1,70 @@
+"""Test the html output of the segmented scans."""
+
+# Python imports
+import os
+
+# Module imports
+import cv2
+import numpy as np
+import pandas as pd
+
+# Local imports
+from usseg import visualisation_html
+
+
+def test_table_html():
+    """Test the Digitized Value cells are coloured by their relative error from Value."""
+    table = pd.DataFrame({
+        "Word": ["PS", "ED", "RI", "S/D", "HR"],
+        "Value": [100.0, 10.0, 1.0, 2.0, 60.0],
+        "Digitized Value": [98.0, 10.8, 0.5, "", "n/a"],
+    })
+
+    html = visualisation_html._table_html(table)
+
+    cells = [row.split("</td>")[2] for row in html.split("<tr>")[1:]]
+    assert "green" in cells[0] and "orange" in cells[1] and "red" in cells[2]
+    assert "white" in cells[3] and "background" not in cells[4]
+    assert '<td style="width:12px">PS</td>' in html  # Widths are the longest value so far, plus 10
+    assert visualisation_html._table_html(None) == '<div style="display:inline-block;max-width:100%"></div>'
+
+
+def test_digitized_value_styles_undefined_error():
+    """Test the cells whose relative error is undefined are left without a style."""
+    table = pd.DataFrame({
+        "Word": ["PS", "ED", "RI", "S/D", "HR", "TAmax", "PI"],
+        "Value": [100.0, None, "1.0", 2.0, 60.0, np.nan, 0.0],
+        "Digitized Value": [0, 10.0, 1.0, None, "61", 30.0, 0.01],
+    }, dtype=object)
+
+    styles = visualisation_html._digitized_value_styles(table)
+
+    # Zero, None and string Values left the error undefined, numeric strings are digitized values
+    assert list(styles) == [None, None, None, None, "background-color: green", "background-color: red",
+                            "background-color: red"]
+    assert list(visualisation_html._digitized_value_styles(table.drop(columns="Value"))) == [None] * 7
+
+
+def test_generate_report(tmp_path):
+    """Test the report is split into linked pages of thumbnails with an index page."""
+    scan = str(tmp_path / "scan.png")
+    cv2.imwrite(scan, np.full((400, 600, 3), 128, dtype=np.uint8))
+    table = pd.DataFrame({"Word": ["PS"], "Value": [45.0], "Digitized Value": [45.2]})
+    report_dir = str(tmp_path / "report")
+
+    index_path = visualisation_html.generate_report(
+        (scan for _ in range(5)), [scan, None] * 2 + [None], [None] * 5, [table, None] * 2 + [table],
+        report_dir, page_size=2, thumbnail_width=60,
+    )
+
+    assert sorted(os.listdir(report_dir)) == [
+        "index.html", "page_00001.html", "page_00002.html", "page_00003.html", "thumbnails"
+    ]
+    assert "5 scans on 3 pages" in open(index_path).read()
+    assert cv2.imread(os.path.join(report_dir, "thumbnails", "000001_scan.png")).shape == (40, 60, 3)
+    assert not os.path.exists(os.path.join(report_dir, "thumbnails", "000002_annotated.png"))
+
+    page = open(os.path.join(report_dir, "page_00001.html")).read()
+    assert 'href="../scan.png"' in page and "base64" not in page
+    assert 'href="page_00002.html">Next' in page and "Previous" not in page
+    assert "Next" not in open(os.path.join(report_dir, "page_00003.html")).read()